@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+@author: EllenWasbo
+
+Compare analytic and tabulated (interpolated) Archer transmission.
+
+For each Archer entry in config_defaults/shield_data.yaml and each table
+accuracy: time to build the table, max error against the analytic formula
+and time pr evaluation of a 1000x1000 map of effective thicknesses.
+Run from the repository root with src on the python path.
+"""
+
+from pathlib import Path
+from timeit import timeit
+
+import numpy as np
+import yaml
+
+from Shield_NM_CT.config import config_classes as cfc
+from Shield_NM_CT.scripts import calculate_dose as cd
+
+path_shield_data = (Path(__file__).parent.parent / 'src' / 'Shield_NM_CT'
+                    / 'config_defaults' / 'shield_data.yaml')
+with open(path_shield_data, 'r') as file:
+    shield_data = [cfc.ShieldData(**doc) for doc in yaml.safe_load_all(file)
+                   if doc is not None]
+
+accuracies = [1e-3, 1e-4, 1e-5]
+n_repeat = 10
+rng = np.random.default_rng(0)
+
+shield_lookup = cd.get_shield_lookup(shield_data)
+for key, coeffs in shield_lookup.items():
+    if coeffs is None or coeffs.archer is False:
+        continue
+    print(' / '.join([txt for txt in key if txt]))
+    for dtype in [np.float64, np.float32]:
+        thickness_map = rng.uniform(
+            0, 80. / abs(coeffs.alpha_gamma), (1000, 1000)).astype(dtype)
+        time_analytic = timeit(
+            lambda: cd.calculate_log_transmission_archer(coeffs, thickness_map),
+            number=n_repeat) / n_repeat
+        print(f'  {np.dtype(dtype).name} analytic: {1000*time_analytic:.1f} ms')
+        for accuracy in accuracies:
+            coeffs_table = cd.ShieldCoefficients(**{
+                name: getattr(coeffs, name) for name in
+                ['archer', 'beta_alpha', 'alpha_gamma', 'inv_gamma']})
+            time_build = timeit(
+                lambda: cd.set_transmission_table(coeffs_table, accuracy),
+                number=1)
+            time_table = timeit(
+                lambda: cd.interpolate_log_transmission(
+                    coeffs_table, thickness_map),
+                number=n_repeat) / n_repeat
+            error = cd.get_transmission_table_error(coeffs_table)
+            print(f'  {np.dtype(dtype).name} table accuracy {accuracy:.0e}: '
+                  f'{1000*time_table:.1f} ms, '
+                  f'{coeffs_table.log_table.size} values, '
+                  f'built in {1000*time_build:.1f} ms, max error {error:.1e}')
@@ -45,6 +45,10 @@ class GeneralValues:
     working_days: int = 230
     convert_to_mSv: bool = True  # multiply dose(rate) by 0.001 to obtain dose in mSv
     correct_thickness: bool = False  # perform geometrical thickness correction
+    float32: bool = True  # calculate and store dose maps in single precision
+    calculation_grid_cm: int = 0  # distance between calculation points, 0 = pixels
+    calculation_mode: str = 'sources'  # sources, streaming, tiled or adaptive
+    transmission_table_accuracy: float = 0.0  # tabulated Archer, 0 = analytic
     c0: float = 1.7
     c1: float = 1.0
     c2: float = 0.5
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Memory limited cache for arrays reused between dose calculations.
+
+@author: Ellen Wasbo
+"""
+from collections import OrderedDict
+import threading
+
+import numpy as np
+
+
+class ArrayCache():
+    """Least recently used cache of np.arrays limited by total memory.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        memory budget for cached arrays. Least recently used arrays are removed
+        when exceeded. Default is 512 MB.
+    """
+
+    def __init__(self, max_bytes=512 * 2**20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def get(self, key, default=None):
+        """Return cached value for key (and mark as recently used) or default."""
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                value = self.items[key]
+            else:
+                self.misses += 1
+                value = default
+        return value
+
+    def put(self, key, value):
+        """Add value to cache. Value is made read-only as it might be shared.
+
+        Values larger than the memory budget are not cached.
+        """
+        nbytes = get_nbytes(value)
+        if nbytes <= self.max_bytes:
+            set_read_only(value)
+            with self.lock:
+                if key in self.items:
+                    self.nbytes -= get_nbytes(self.items.pop(key))
+                self.items[key] = value
+                self.nbytes += nbytes
+                while self.nbytes > self.max_bytes:
+                    _, removed = self.items.popitem(last=False)
+                    self.nbytes -= get_nbytes(removed)
+        return value
+
+    def clear(self):
+        """Remove all cached values."""
+        with self.lock:
+            self.items.clear()
+            self.nbytes = 0
+
+
+def get_nbytes(value):
+    """Return memory used by np.array or list/tuple of np.arrays."""
+    nbytes = 0
+    if isinstance(value, np.ndarray):
+        nbytes = value.nbytes
+    elif isinstance(value, (list, tuple)):
+        nbytes = sum([get_nbytes(sub) for sub in value])
+    return nbytes
+
+
+def set_read_only(value):
+    """Avoid cached np.array (or list/tuple of np.arrays) being changed in place."""
+    if isinstance(value, np.ndarray):
+        value.setflags(write=False)
+    elif isinstance(value, (list, tuple)):
+        for sub in value:
+            set_read_only(sub)
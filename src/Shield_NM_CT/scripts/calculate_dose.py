@@ -5,15 +5,69 @@ Collection of small functions used in ImageQC.
 
 @author: Ellen Wasbo
 """
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import copy
+from dataclasses import astuple, dataclass
+from functools import partial
+import math
+import os
 import numpy as np
 
-# Shield_NM_CT block start
-from Shield_NM_CT.ui import reusable_widgets as uir
-# Shield_NM_CT block end
+# max number of elements in batched intermediate arrays (walls x pixels)
+MAX_CHUNK_ELEMENTS = 2 ** 24
+# default number of sources calculated in parallel
+N_WORKERS = min(4, os.cpu_count() or 1)
+# default memory limit (bytes) for calculate_dose_tiled
+MEMORY_LIMIT = 2 ** 31
+# approximate number of maps (of one tile) used pr source in calculate_dose_tiled
+TILE_MAPS_GEOMETRY = 12  # wall geometry, 8 bytes pr value
+TILE_MAPS_SOURCE = 16  # distance, transmission, dose factors and sums
 
 
-def calculate_dose(main, source_number=None, modality=None):
+class CalculationProgress():
+    """Forward progress and cancel requests from the dose engine to callbacks.
+
+    Parameters
+    ----------
+    n_steps : int
+        number of steps for the full calculation (100 pr source)
+    progress_callback : callable, optional
+        called with (percent, text) where percent is int 0-100. Default is None.
+    cancel_callback : callable, optional
+        called without arguments, return True to stop the calculation.
+        Default is None.
+    """
+
+    def __init__(self, n_steps=100, progress_callback=None, cancel_callback=None):
+        self.n_steps = max(n_steps, 1)
+        self.value = 0
+        self.text = ''
+        self.progress_callback = progress_callback
+        self.cancel_callback = cancel_callback
+
+    def set_text(self, text):
+        """Set description of current step."""
+        self.text = text
+        self.set_value(self.value)
+
+    def set_value(self, value):
+        """Set number of finished steps."""
+        self.value = value
+        if self.progress_callback is not None:
+            self.progress_callback(
+                min(100, int(100 * value / self.n_steps)), self.text)
+
+    def was_canceled(self):
+        """Return True if calculation should be canceled."""
+        canceled = False
+        if self.cancel_callback is not None:
+            canceled = bool(self.cancel_callback())
+        return canceled
+
+
+def calculate_dose(main, source_number=None, modality=None,
+                   progress_callback=None, cancel_callback=None):
     """Calculate dose based on parameters in main updating dose_dict of main.
 
     Parameters
@@ -23,6 +77,10 @@ def calculate_dose(main, source_number=None, modality=None):
         source number to calculate/update. Default is None = all.
     modality: str, Optional
         modality of source_number to update. Default is None = all
+    progress_callback : callable, optional
+        see CalculationProgress. Default is None.
+    cancel_callback : callable, optional
+        see CalculationProgress. Default is None.
 
     Returns
     -------
@@ -31,8 +89,141 @@ def calculate_dose(main, source_number=None, modality=None):
     msgs : list of str
         Info and warning messages to display after this process finished.
     """
-    msgs = []
     status = False
+    dose_input, source_number, modality, msgs = get_dose_input(
+        main, source_number=source_number, modality=modality)
+
+    if dose_input is not None:
+        dose_dict, calculation_msgs = calculate_dose_mode(
+            dose_input,
+            progress_callback=progress_callback, cancel_callback=cancel_callback)
+        msgs.extend(calculation_msgs)
+        if dose_dict is not None:
+            status = set_dose_result(
+                main, dose_dict, source_number=source_number, modality=modality)
+    elif modality:
+        # not valid dose (e.g. zero and specific source)
+        status = set_dose_result(
+            main, None, source_number=source_number, modality=modality)
+
+    return status, msgs
+
+
+def calculate_dose_points(main, progress_callback=None, cancel_callback=None):
+    """Calculate dose at the calculation points of main without dose maps.
+
+    Dose is calculated for the current floor, the points table and the
+    number of working days of main (see calculate_dose_positions).
+
+    Parameters
+    ----------
+    main : ui_main.MainWindow
+    progress_callback : callable, optional
+        see CalculationProgress. Default is None.
+    cancel_callback : callable, optional
+        see CalculationProgress. Default is None.
+
+    Returns
+    -------
+    point_doses : list of tuple or None
+        (dose in mSv, NM max doserate uSv/h) pr row of points table,
+        None for rows without valid position. None if calculation failed or
+        was canceled.
+    msgs : list of str
+        Info and warning messages.
+    """
+    point_doses = None
+    dose_input, _, _, msgs = get_dose_input(main)
+    if dose_input is not None:
+        rows, xs, ys = get_points_positions(
+            main.points_tab.table_list, dose_input['map_shape'])
+        floor = main.gui.current_floor
+        progress = CalculationProgress(
+            progress_callback=progress_callback, cancel_callback=cancel_callback)
+        progress.set_text('Calculating dose at calculation points...')
+        kwargs = {key: value for key, value in dose_input.items()
+                  if key not in ['geometry_cache', 'kernel_cache']}
+        dose_sums, msgs_points = calculate_dose_positions(
+            xs, ys, n_workers=1, floors=(floor, ), progress=progress, **kwargs)
+        msgs.extend(msgs_points)
+        if progress.was_canceled() is False:
+            dose_maps = sum_dose_days(
+                {'dose_sums': dose_sums}, occ_map=main.occ_map[ys, xs],
+                floor=floor, working_days=main.general_values.working_days,
+                general_values=dose_input['general_values'])
+            point_doses = [None for point in main.points_tab.table_list]
+            for j, i in enumerate(rows):
+                dose = sum([float(dose_maps[key][j]) for key in [
+                    'nm_dose_map', 'ct_dose_map', 'ot_dose_map']
+                    if dose_maps[key] is not None])
+                doserate = 0.
+                if dose_maps['nm_doserate_map'] is not None:
+                    doserate = float(dose_maps['nm_doserate_map'][j])
+                point_doses[i] = (dose, doserate)
+            progress.set_value(progress.n_steps)
+
+    return point_doses, msgs
+
+
+def get_points_positions(points, map_shape):
+    """Get pixel positions of calculation points within the map.
+
+    Parameters
+    ----------
+    points : list of list
+        table_list of points tab
+    map_shape : tuple of ints
+        shape of floor plan (y, x)
+
+    Returns
+    -------
+    rows : list of int
+        row number in points of each position
+    xs : np.array
+        x pixel positions
+    ys : np.array
+        y pixel positions
+    """
+    rows = []
+    positions = []
+    for i, point in enumerate(points):
+        try:
+            x, y = [int(coord) for coord in point[2].split(',')]
+        except ValueError:
+            continue
+        if x and y and 0 <= x < map_shape[1] and 0 <= y < map_shape[0]:
+            rows.append(i)
+            positions.append((x, y))
+    xs = np.array([x for x, _ in positions], dtype=int)
+    ys = np.array([y for _, y in positions], dtype=int)
+    return (rows, xs, ys)
+
+
+def get_dose_input(main, source_number=None, modality=None):
+    """Collect input for calculate_dose_sources from main.
+
+    Parameters
+    ----------
+    main : ui_main.MainWindow
+    source_number : int, Optional
+        source number to calculate/update. Default is None = all.
+    modality: str, Optional
+        modality of source_number to update. Default is None = all
+
+    Returns
+    -------
+    dose_input : dict or None
+        keyword arguments to calculate_dose_sources.
+        None if calculation not possible.
+    source_number : int or None
+        None if all sources should be calculated.
+    modality : str or None
+        None if all sources should be calculated.
+    msgs : list of str
+        Info and warning messages.
+    """
+    msgs = []
+    dose_input = None
     proceed = False
     # calibrated scale?
     calibration_factor = main.gui.calibration_factor
@@ -47,12 +238,12 @@ def calculate_dose(main, source_number=None, modality=None):
 
     sources = {}
     if proceed:
-        # if first source of given modality added, data not ready, calculate 
         if source_number is not None and modality is not None:
-            if main.dose_dict[f'dose_{modality}'] is None:
+            # nothing calculated yet or dose pr source not kept, calculate all
+            if not main.dose_dict or (
+                    main.dose_dict.get('retain_sources', True) is False):
                 source_number = None
                 modality = None
-                # = calculate all, TODO - avoid all, just new
 
         if source_number is not None and modality is not None:
             if modality == 'NM':
@@ -61,36 +252,34 @@ def calculate_dose(main, source_number=None, modality=None):
                 nonzero_columns = [7, 8, 9]
             elif modality == 'OT':
                 nonzero_columns = [4, 5]
+            source_tab = {
+                'NM': main.NMsources_tab, 'CT': main.CTsources_tab,
+                'OT': main.OTsources_tab}[modality]
             this_source = get_valid_rows(
-                [main.tabs.currentWidget().table_list[source_number]],
+                [source_tab.table_list[source_number]],
                 nonzero_columns=nonzero_columns,
                 n_coordinates=2)
             if any(this_source):
                 sources[modality] = this_source
-                n_sources = 1
             else:
                 proceed = False
         else:
             # any sources with # patients or dose-values > 0?
-            n_sources = 0
             sources_NM = get_valid_rows(
                 main.NMsources_tab.table_list, nonzero_columns=[5, 7, 8, 9],
                 n_coordinates=2)
             if any(sources_NM):
                 sources['NM'] = sources_NM
-                n_sources += len(sources_NM)
             sources_CT = get_valid_rows(
                 main.CTsources_tab.table_list, nonzero_columns=[7, 8, 9],
                 n_coordinates=2)
             if any(sources_CT):
                 sources['CT'] = sources_CT
-                n_sources += len(sources_CT)
             sources_OT = get_valid_rows(
                 main.OTsources_tab.table_list, nonzero_columns=[4, 5],
                 n_coordinates=2)
             if any(sources_OT):
                 sources['OT'] = sources_OT
-                n_sources += len(sources_OT)
 
         if not sources and source_number is None:
             proceed = False
@@ -98,244 +287,1788 @@ def calculate_dose(main, source_number=None, modality=None):
                 'Found no valid sources (either not defined, not active '
                 'or values zero that causes zero dose.')
 
-    walls = []
     if proceed:
         # any walls to consider (thickness > 0)
         walls = get_valid_rows(
             main.walls_tab.table_list, nonzero_columns=[4], n_coordinates=4)
+        main.areas_tab.update_occ_map(update_overlay=False, update_patches=False)
+        dose_input = {
+            'sources': sources, 'walls': walls,
+            'isotopes': main.isotopes, 'ct_models': main.ct_models,
+            'shield_data': main.shield_lookup,
+            'general_values': copy.deepcopy(main.general_values),
+            'map_shape': main.occ_map.shape,
+            'calibration_factor': calibration_factor,
+            'geometry_cache': main.wall_geometry_cache,
+            'kernel_cache': main.ct_kernel_cache,
+            }
 
-    if proceed:
-        max_progress = 100 * n_sources  # 0-100 within each source
-        step = 100 if len(walls) == 0 else 100 // len(walls)
-        progress_modal = uir.ProgressModal(
-            "Calculating...", "Cancel", 0, max_progress, main, minimum_duration=0)
+    return dose_input, source_number, modality, msgs
 
-        progress_modal.setLabelText("Preparing data...")
-        progress_modal.setValue(1)
-        current_progress_value = 1
 
-        main.areas_tab.update_occ_map(update_overlay=False, update_patches=False)
+def set_dose_result(main, dose_dict, source_number=None, modality=None):
+    """Update dose_dict of main with result from calculate_dose_sources.
+
+    Parameters
+    ----------
+    main : ui_main.MainWindow
+    dose_dict : dict or None
+        as returned by calculate_dose_sources. None if specific source is no
+        longer valid.
+    source_number : int, Optional
+        source number calculated. Default is None = all.
+    modality: str, Optional
+        modality of source_number. Default is None = all
+
+    Returns
+    -------
+    status : bool
+        True if dose_dict of main was changed.
+    """
+    status = False
+    if modality:
+        if main.dose_dict:
+            set_source_dose(
+                main.dose_dict, modality, source_number,
+                None if dose_dict is None else dose_dict[f'dose_{modality}'])
+            # walls of this source if other than main.dose_dict['walls']
+            walls_sources = main.dose_dict.get('walls_sources', {})
+            walls_sources.pop((modality, source_number), None)
+            if dose_dict is not None and (
+                    dose_dict['walls'] != main.dose_dict['walls']):
+                walls_sources[(modality, source_number)] = dose_dict['walls']
+            if walls_sources:
+                main.dose_dict['walls_sources'] = walls_sources
+            status = True
+    elif dose_dict is not None:
+        main.dose_dict = dose_dict
+        status = True
+    return status
+
+
+def set_source_dose(dose_dict, modality, source_number, dose_source):
+    """Set calculated values for one source into dose_dict.
+
+    The container for the modality is created if this is the first
+    calculated source of the modality, leaving other modalities untouched.
 
-        nNM = 0
-        if 'NM' in sources:
-            dose_NM = calculate_dose_NM(
-                sources['NM'], main.isotopes, walls, main.shield_data,
-                main.occ_map.shape, calibration_factor, main.general_values,
-                progress_modal, current_progress_value, step, msgs
-                )
-            nNM = len(sources['NM'])
-            current_progress_value = 100 * nNM
+    Parameters
+    ----------
+    dose_dict : dict
+        as returned by calculate_dose_sources. Updated in place.
+    modality : str
+        'NM', 'CT' or 'OT'
+    source_number : int
+        row number of source in table
+    dose_source : dict or None
+        dose_{modality} from calculate_dose_sources with only this source.
+        None to remove results for this source.
+    """
+    reset_dose_sums(dose_dict)
+    dd = dose_dict[f'dose_{modality}']
+    if dd is None and dose_source is not None:
+        dd = get_source_stack(
+            modality, [], dose_source['dist_maps'].shape[1:],
+            dose_source['dist_maps'].dtype)
+        dose_dict[f'dose_{modality}'] = dd
+    if dd is not None:
+        resize_source_stack(dd, max(source_number + 1, len(dd['sources'])))
+        if dose_source is None:
+            dd['sources'][source_number] = None
+            set_source_values(dd, source_number, None)
         else:
-            dose_NM = None
-
-        nCT = 0
-        if 'CT' in sources and progress_modal.wasCanceled() is False:
-            dose_CT = calculate_dose_kV(
-                sources['CT'], main.ct_models, walls, main.shield_data,
-                main.occ_map.shape, calibration_factor, main.general_values,
-                progress_modal, current_progress_value, step, msgs
-                )
-            nCT = len(sources['CT'])
-            current_progress_value = 100 * (nNM + nCT)
+            dd['sources'][source_number] = dose_source['sources'][0]
+            set_source_values(
+                dd, source_number, get_source_values(dose_source, 0))
+
+
+def get_source_stack(modality, sources, map_shape, dtype=np.float64):
+    """Get container for calculated values and arrays stacked pr source.
+
+    Maps are stacked only for sources with a source row, in the order of the
+    rows. stack_index gives the position in the stack pr source number. Stack
+    positions not (or no longer) used have zero dose factors (and distance and
+    transmission 1) such that the stack can be summed without checking validity.
+
+    Parameters
+    ----------
+    modality : str
+        'NM', 'CT' or 'OT'
+    sources : list of list
+        source rows as returned by get_valid_rows (None for invalid rows)
+    map_shape : tuple of ints
+        shape of floor plan (y, x)
+    dtype : numpy dtype, optional
+        floating point type of the maps. Default is np.float64.
+
+    Returns
+    -------
+    dose_source : dict
+    """
+    n_sources = len(sources)
+    stack_index = np.full(n_sources, -1, dtype=int)
+    idxs = [i for i, source in enumerate(sources) if source]
+    stack_index[idxs] = np.arange(len(idxs))
+    n_stack = len(idxs)
+    map_shape = tuple(map_shape)
+    dose_source = {
+        'sources': list(sources),  # source rows used (to update for wall changes)
+        'valid': np.zeros(n_sources, dtype=bool),  # successfully calculated
+        'shield_keys': [None] * n_sources,  # (isotope, kV_source) pr source
+        'stack_index': stack_index,  # position in stacked arrays, -1 = none
+        'n_stack': n_stack,  # positions in use, arrays might have more
+        'dist_maps': np.ones((n_stack, ) + map_shape, dtype=dtype),
+        # distances in floor 1
+        'transmission_maps': [
+            None, np.ones((n_stack, ) + map_shape, dtype=dtype), None],
+        # transmission pr floor, floor 0 and 2 None until needed
+        # (set_floors_transmission), shape (n_stack, 1, 1) if not corrected
+        # for thickness
+        'floors_done': np.zeros((3, n_stack), dtype=bool),
+        # floor 0 and 2 transmission calculated pr stack position
+        }
+    if modality == 'CT':
+        # dose pr day pr floor
+        dose_source['dose_factors'] = [
+            np.zeros((n_stack, ) + map_shape, dtype=dtype) for floor in range(3)]
+    else:
+        # unshielded dose uSv @ 1 m pr day
+        dose_source['dose_factors'] = np.zeros(n_stack)
+    if modality == 'NM':
+        # max doserate uSv/h @ 1m
+        dose_source['doserate_max_factors'] = np.zeros(n_stack)
+    return dose_source
+
+
+def resize_source_stack(dose_source, n_sources):
+    """Add invalid sources to container from get_source_stack up to n_sources.
+
+    No maps are added, see add_source_stack_position.
+    """
+    n_add = n_sources - len(dose_source['sources'])
+    if n_add > 0:
+        dose_source['sources'].extend([None] * n_add)
+        dose_source['shield_keys'].extend([None] * n_add)
+        dose_source['valid'] = np.concatenate(
+            [dose_source['valid'], np.zeros(n_add, dtype=bool)])
+        dose_source['stack_index'] = np.concatenate(
+            [dose_source['stack_index'], np.full(n_add, -1, dtype=int)])
+
+
+def add_source_stack_position(dose_source, source_number):
+    """Add position in stacked arrays for source_number.
+
+    Arrays are reallocated with doubled size when full, such that adding
+    sources one by one copies the stack only a few times.
+
+    Returns
+    -------
+    index : int
+        position in stacked arrays
+    """
+    index = dose_source['n_stack']
+    n_allocated = dose_source['dist_maps'].shape[0]
+    if index >= n_allocated:
+        n_add = max(n_allocated, 1)
+
+        def add_rows(array, value):
+            if array is None:
+                return None
+            added = np.full((n_add, ) + array.shape[1:], value, dtype=array.dtype)
+            return np.concatenate([array, added])
+
+        dose_source['dist_maps'] = add_rows(dose_source['dist_maps'], 1)
+        dose_source['transmission_maps'] = [
+            add_rows(array, 1) for array in dose_source['transmission_maps']]
+        dose_source['floors_done'] = np.concatenate(
+            [dose_source['floors_done'], np.zeros((3, n_add), dtype=bool)],
+            axis=1)
+        if isinstance(dose_source['dose_factors'], list):
+            dose_source['dose_factors'] = [
+                add_rows(array, 0) for array in dose_source['dose_factors']]
         else:
-            dose_CT = None
-
-        if 'OT' in sources and progress_modal.wasCanceled() is False:
-            dose_OT = calculate_dose_kV(
-                sources['OT'], None, walls, main.shield_data,
-                main.occ_map.shape, calibration_factor, main.general_values,
-                progress_modal, current_progress_value, step, msgs
-                )
+            dose_source['dose_factors'] = add_rows(dose_source['dose_factors'], 0)
+        if 'doserate_max_factors' in dose_source:
+            dose_source['doserate_max_factors'] = add_rows(
+                dose_source['doserate_max_factors'], 0)
+    dose_source['stack_index'][source_number] = index
+    dose_source['n_stack'] = index + 1
+    return index
+
+
+def get_source_stack_used(dose_source, name, floor=None):
+    """Get stacked array from container without unused allocated positions."""
+    array = dose_source[name]
+    if floor is not None:
+        array = array[floor]
+    if array is not None:
+        array = array[:dose_source['n_stack']]
+    return array
+
+
+def get_source_values(dose_source, source_number):
+    """Get values of one source from container as from calculate_source_NM/kV.
+
+    Returns None if source not valid. Arrays are views into the container.
+    """
+    values = None
+    if dose_source['valid'][source_number]:
+        index = dose_source['stack_index'][source_number]
+        dose_factors = dose_source['dose_factors']
+        if isinstance(dose_factors, list):
+            dose_factor = [array[index] for array in dose_factors]
         else:
-            dose_OT = None
+            dose_factor = float(dose_factors[index])
+        values = {
+            'dist_maps': dose_source['dist_maps'][index],
+            'dose_factors': dose_factor,
+            'transmission_maps': [
+                None, dose_source['transmission_maps'][1][index], None],
+            'shield_keys': dose_source['shield_keys'][source_number],
+            }
+        if 'doserate_max_factors' in dose_source:
+            values['doserate_max_factors'] = float(
+                dose_source['doserate_max_factors'][index])
+    return values
+
+
+def set_source_values(dose_source, source_number, values):
+    """Write values of one source into container from get_source_stack.
 
-        if progress_modal.wasCanceled() is False:
-            status = True
+    Parameters
+    ----------
+    dose_source : dict
+        as returned by get_source_stack. Updated in place.
+    source_number : int
+    values : dict or None
+        as returned by calculate_source_NM or calculate_source_kV.
+        None (or dose_factors None) if the source is not valid.
+    """
+    valid = values is not None and values['dose_factors'] is not None
+    dose_source['valid'][source_number] = valid
+    dose_source['shield_keys'][source_number] = (
+        None if values is None else values['shield_keys'])
+    index = dose_source['stack_index'][source_number]
+    if index < 0:
+        if not valid:
+            return
+        index = add_source_stack_position(dose_source, source_number)
+    dose_source['floors_done'][:, index] = False
+    dose_source['dist_maps'][index] = (
+        values['dist_maps'] if valid else 1)
+    for floor, transmission_maps in enumerate(dose_source['transmission_maps']):
+        if transmission_maps is not None:
+            transmission_maps[index] = (
+                values['transmission_maps'][floor] if valid and floor == 1 else 1)
+    dose_factors = dose_source['dose_factors']
+    if isinstance(dose_factors, list):
+        for floor, array in enumerate(dose_factors):
+            array[index] = (
+                values['dose_factors'][floor] if valid else 0)
+    else:
+        dose_factors[index] = values['dose_factors'] if valid else 0
+    if 'doserate_max_factors' in dose_source:
+        dose_source['doserate_max_factors'][index] = (
+            values['doserate_max_factors'] if valid else 0)
+
+
+class DoseAccumulator():
+    """Sum dose from sources as they are calculated without keeping maps pr source.
+
+    Peak memory is a few maps pr source calculated in parallel in addition to
+    the summed maps, independent of the number of sources.
+
+    Parameters
+    ----------
+    shield_data : dict
+        as returned by get_shield_lookup
+    general_values : config_classes.GeneralValues
+    floors : list of int, optional
+        floors to sum dose for. Default is [0, 1, 2].
+    map_shape : tuple of ints, optional
+        shape of floor plan (y, x). Needed if sources are calculated in tiles
+        of rows (see calculate_dose_tiled). Default is None.
+    """
 
-        progress_modal.close()
-        if modality:
+    def __init__(self, shield_data, general_values, floors=(0, 1, 2),
+                 map_shape=None):
+        self.shield_data = shield_data
+        self.general_values = general_values
+        self.map_shape = map_shape
+        self.rows = None  # (first, stop) rows currently calculated, None = all
+        self.dose_sums = {}  # as dose_dict['dose_sums'], see get_dose_sums
+        for floor in floors:
+            self.dose_sums[get_dose_sums_key(floor, general_values)] = {
+                'nm_dose_map': None, 'nm_doserate_map': None,
+                'ct_dose_map': None, 'ot_dose_map': None}
+
+    def add_result(self, modality, source_number, result, msgs):
+        """Add result from calculate_sources (result_callback)."""
+        values, msgs_source = result
+        msgs.extend(msgs_source)
+        if values is not None and values['dose_factors'] is not None:
+            dose_source = get_source_stack(
+                modality, [None], values['dist_maps'].shape,
+                dtype=values['dist_maps'].dtype)
+            set_source_values(dose_source, 0, values)
+            dose_dict_source = {
+                'dose_NM': None, 'dose_CT': None, 'dose_OT': None,
+                'shield_data': self.shield_data}
+            dose_dict_source[f'dose_{modality}'] = dose_source
+            for key, dose_sums in self.dose_sums.items():
+                dose_sums_source = get_dose_sums(
+                    dose_dict_source, floor=key[0],
+                    general_values=self.general_values)
+                for name, dose_sum in dose_sums_source.items():
+                    if dose_sum is None:
+                        pass
+                    elif self.rows is not None:
+                        if dose_sums[name] is None:
+                            dose_sums[name] = np.zeros(
+                                self.map_shape, dtype=dose_sum.dtype)
+                        dose_sums[name][self.rows[0]:self.rows[1]] += dose_sum
+                    elif dose_sums[name] is None:
+                        dose_sums[name] = dose_sum
+                    else:
+                        dose_sums[name] += dose_sum
+
+
+def get_dose_nbytes(dose_dict):
+    """Get memory used by arrays in dose_dict.
+
+    Parameters
+    ----------
+    dose_dict : dict
+        as returned by calculate_dose_sources
+
+    Returns
+    -------
+    nbytes : dict
+        bytes used pr modality (NM, CT, OT) and for cached sums (dose_sums)
+    """
+    def get_nbytes(value):
+        nbytes = 0
+        if isinstance(value, np.ndarray):
+            nbytes = value.nbytes
+        elif isinstance(value, (list, tuple)):
+            nbytes = sum([get_nbytes(sub) for sub in value])
+        elif isinstance(value, dict):
+            nbytes = sum([get_nbytes(sub) for sub in value.values()])
+        return nbytes
+
+    nbytes = {modality: get_nbytes(dose_dict.get(f'dose_{modality}', None))
+              for modality in ['NM', 'CT', 'OT']}
+    nbytes['dose_sums'] = get_nbytes(dose_dict.get('dose_sums', None))
+    return nbytes
+
+
+def calculate_dose_mode(dose_input, progress_callback=None,
+                        cancel_callback=None, partial_callback=None):
+    """Calculate dose with the method set in general_values.calculation_mode.
+
+    Parameters
+    ----------
+    dose_input : dict
+        keyword arguments to calculate_dose_sources as from get_dose_input
+    progress_callback, cancel_callback, partial_callback :
+        as calculate_dose_sources. partial_callback is only used if the dose
+        pr source is kept (calculation_mode sources).
+
+    Returns
+    -------
+    dose_dict : dict or None
+        as calculate_dose_sources. None if canceled.
+    msgs : list of str
+        Info and warning messages.
+    """
+    callbacks = {'progress_callback': progress_callback,
+                 'cancel_callback': cancel_callback}
+    mode = dose_input['general_values'].calculation_mode
+    kwargs = {key: value for key, value in dose_input.items()
+              if key not in ['geometry_cache', 'kernel_cache']}
+    if mode == 'tiled':
+        dose_dict, msgs = calculate_dose_tiled(**kwargs, **callbacks)
+    elif mode == 'adaptive':
+        dose_dict, msgs = calculate_dose_adaptive(**kwargs, **callbacks)
+    else:
+        dose_dict, msgs = calculate_dose_sources(
+            **dose_input, partial_callback=partial_callback,
+            retain_sources=mode != 'streaming', **callbacks)
+    return (dose_dict, msgs)
+
+
+def calculate_dose_sources(
+        sources, walls, isotopes=None, ct_models=None, shield_data=None,
+        general_values=None, map_shape=(0, 0), calibration_factor=None,
+        progress_callback=None, cancel_callback=None, geometry_cache=None,
+        kernel_cache=None, n_workers=N_WORKERS, partial_callback=None,
+        retain_sources=True):
+    """Calculate dose parameters for sources without depending on the GUI.
+
+    Parameters
+    ----------
+    sources : dict
+        keys 'NM', 'CT' and/or 'OT' with source rows as returned by
+        get_valid_rows (None for invalid rows)
+    walls : list of list
+        wall rows as returned by get_valid_rows
+    isotopes : list of config_classes.Isotope
+        needed if NM sources
+    ct_models : list of config_classes.CT_model
+        needed if CT sources
+    shield_data : dict or list of config_classes.ShieldData
+        dict as returned by get_shield_lookup or list of ShieldData
+    general_values : config_classes.GeneralValues
+    map_shape : tuple of ints
+        shape of floor plan (y, x)
+    calibration_factor : float
+        meters/pixel
+    progress_callback : callable, optional
+        see CalculationProgress. Default is None.
+    cancel_callback : callable, optional
+        see CalculationProgress. Default is None.
+    geometry_cache : array_cache.ArrayCache, optional
+        reuse wall geometry between calculations. Default is None.
+    kernel_cache : array_cache.ArrayCache, optional
+        reuse CT doseratemap kernels between sources and calculations.
+        Used for CT sources sharing CT model and rotation. Default is None.
+    n_workers : int, optional
+        number of sources calculated in parallel. Default is N_WORKERS.
+    partial_callback : callable, optional
+        called with (modality, dose values of modality) as each modality is
+        finished. Default is None.
+        The values are calculated on the calculation grid (see get_grid_factor).
+    retain_sources : bool, optional
+        If False, dose from each source is added to the dose sums of all floors
+        and the maps pr source discarded (see DoseAccumulator). The dose can
+        then not be updated for single sources or walls. Default is True.
+
+    Returns
+    -------
+    dose_dict : dict or None
+        keys dose_NM, dose_CT, dose_OT as used by MainWindow.dose_dict.
+        None if canceled.
+        Maps pr source are calculated on the calculation grid if
+        general_values.calculation_grid_cm is set (see get_grid_factor), summed
+        dose is upsampled to map_shape (see get_dose_sums).
+        If retain_sources is False dose_NM, dose_CT, dose_OT are None and
+        summed dose is found in dose_sums for the floor shielding at
+        calculation (see get_dose_sums).
+    msgs : list of str
+        Info and warning messages.
+    """
+    msgs = []
+    if not isinstance(shield_data, dict):
+        shield_data = get_shield_lookup(shield_data)
+    walls_input = walls
+    full_shape = tuple(map_shape)
+    grid_factor = get_grid_factor(calibration_factor, general_values)
+    if grid_factor > 1:
+        sources = {modality: scale_rows_to_grid(rows, grid_factor)
+                   for modality, rows in sources.items()}
+        walls = scale_rows_to_grid(walls, grid_factor)
+        map_shape = get_grid_shape(map_shape, grid_factor)
+        calibration_factor = calibration_factor * grid_factor
+    n_sources = sum([len(rows) for rows in sources.values()])
+    n_walls = len(walls)
+    step = 100 if n_walls == 0 else 100 // n_walls
+    progress = CalculationProgress(
+        n_steps=100 * n_sources, progress_callback=progress_callback,
+        cancel_callback=cancel_callback)
+    progress.set_text('Preparing data...')
+    progress.set_value(1)
+
+    dose_dict = {'dose_NM': None, 'dose_CT': None, 'dose_OT': None}
+    accumulator = None
+    if retain_sources is False:
+        accumulator = DoseAccumulator(shield_data, general_values)
+    n_done = 0
+    for modality in ['NM', 'CT', 'OT']:
+        if modality in sources and progress.was_canceled() is False:
             if modality == 'NM':
-                dd = dose_NM
-                param = 'doserate_max_factors'
-                #try:
-                main.dose_dict['dose_NM'][param][source_number] = dd[param][0]
-                #except TypeError:
-                #    pass
-            elif modality == 'CT':
-                dd = dose_CT
+                dose_dict['dose_NM'] = calculate_dose_NM(
+                    sources['NM'], isotopes, walls, shield_data,
+                    map_shape, calibration_factor, general_values,
+                    progress, 100 * n_done, step, msgs,
+                    geometry_cache=geometry_cache, n_workers=n_workers,
+                    accumulator=accumulator)
             else:
-                dd = dose_OT
-            for param in [
-                    'dist_maps', 'dose_factors', 'transmission_maps']:
-                #try:
-                main.dose_dict[f'dose_{modality}'][param][source_number] = dd[param][0]
-                #except TypeError:
-                #    pass
+                dose_dict[f'dose_{modality}'] = calculate_dose_kV(
+                    sources[modality], ct_models if modality == 'CT' else None,
+                    walls, shield_data,
+                    map_shape, calibration_factor, general_values,
+                    progress, 100 * n_done, step, msgs,
+                    geometry_cache=geometry_cache, kernel_cache=kernel_cache,
+                    n_workers=n_workers, accumulator=accumulator)
+            n_done += len(sources[modality])
+            if (partial_callback is not None
+                    and dose_dict[f'dose_{modality}'] is not None):
+                partial_callback(modality, dose_dict[f'dose_{modality}'])
+
+    if progress.was_canceled():
+        dose_dict = None
+    else:
+        dose_dict['walls'] = copy.deepcopy(walls_input)
+        dose_dict['shield_data'] = shield_data  # for floor 0 and 2 when needed
+        dose_dict['grid_factor'] = grid_factor
+        dose_dict['map_shape'] = full_shape
+        dose_dict['retain_sources'] = retain_sources
+        if accumulator is not None:
+            dose_dict['dose_sums'] = {
+                key: upsample_dose_sums(dose_sums, full_shape, grid_factor)
+                for key, dose_sums in accumulator.dose_sums.items()}
 
-        else:
-            main.dose_dict = {
-                'dose_NM': dose_NM,
-                'dose_CT': dose_CT,
-                'dose_OT': dose_OT,
-                }
+    return (dose_dict, msgs)
+
+
+def get_tile_rows(map_shape, n_sources_parallel=1, n_accumulators=1,
+                  dtype=np.float64, memory_limit=MEMORY_LIMIT):
+    """Get number of map rows to calculate at a time to stay below memory_limit.
+
+    Parameters
+    ----------
+    map_shape : tuple of ints
+        shape of floor plan (y, x)
+    n_sources_parallel : int, optional
+        number of sources calculated at the same time. Default is 1.
+    n_accumulators : int, optional
+        number of summed maps of full size. Default is 1.
+    dtype : numpy dtype, optional
+        floating point type of the maps. Default is np.float64.
+    memory_limit : int, optional
+        bytes. Default is MEMORY_LIMIT.
+
+    Returns
+    -------
+    n_rows : int
+        at least 1, at most map_shape[0]
+    """
+    itemsize = np.dtype(dtype).itemsize
+    available = memory_limit - n_accumulators * itemsize * map_shape[0] * map_shape[1]
+    # int64 and float64 intermediates in wall geometry, not depending on dtype
+    bytes_row = n_sources_parallel * map_shape[1] * (
+        8 * TILE_MAPS_GEOMETRY + itemsize * TILE_MAPS_SOURCE)
+    return int(min(max(available // max(bytes_row, 1), 1), map_shape[0]))
+
+
+def calculate_dose_tiled(
+        sources, walls, isotopes=None, ct_models=None, shield_data=None,
+        general_values=None, map_shape=(0, 0), calibration_factor=None,
+        progress_callback=None, cancel_callback=None, n_workers=N_WORKERS,
+        memory_limit=MEMORY_LIMIT, floors=(0, 1, 2)):
+    """Calculate summed dose in tiles of map rows with bounded memory.
+
+    Sources are calculated for a few rows of the map at a time and added to
+    preallocated dose sums (see DoseAccumulator) without maps pr source or
+    kernels of the full map. Used for large floor plans.
+
+    Parameters
+    ----------
+    sources, walls, isotopes, ct_models, shield_data, general_values,
+    map_shape, calibration_factor, progress_callback, cancel_callback,
+    n_workers :
+        as calculate_dose_sources
+    memory_limit : int, optional
+        approximate maximum memory in bytes used by the calculation including
+        the dose sums. The dose sums are always allocated, with tiles of one
+        row if the limit is too low. Default is MEMORY_LIMIT.
+    floors : list of int, optional
+        floors to sum dose for. Default is [0, 1, 2].
+
+    Returns
+    -------
+    dose_dict : dict or None
+        as calculate_dose_sources with retain_sources False. None if canceled.
+    msgs : list of str
+        Info and warning messages.
+    """
+    msgs = []
+    if not isinstance(shield_data, dict):
+        shield_data = get_shield_lookup(shield_data)
+    map_shape = tuple(map_shape)
+    n_sources = sum([len([row for row in rows if row])
+                     for rows in sources.values()])
+    n_accumulators = len(floors) * (
+        ('NM' in sources) * 2 + ('CT' in sources) + ('OT' in sources))
+    n_rows = get_tile_rows(
+        map_shape, n_sources_parallel=max(min(n_workers, n_sources), 1),
+        n_accumulators=n_accumulators, dtype=get_dtype(general_values),
+        memory_limit=memory_limit)
+    tiles = [(first, min(first + n_rows, map_shape[0]))
+             for first in range(0, map_shape[0], n_rows)]
+
+    n_walls = len(walls)
+    step = 100 if n_walls == 0 else 100 // n_walls
+    progress = CalculationProgress(
+        n_steps=100 * sum([len(rows) for rows in sources.values()]) * len(tiles),
+        progress_callback=progress_callback, cancel_callback=cancel_callback)
+    progress.set_text('Preparing data...')
+    progress.set_value(1)
+
+    accumulator = DoseAccumulator(
+        shield_data, general_values, floors=floors, map_shape=map_shape)
+    msgs_tiles = []
+    n_done = 0
+    for rows in tiles:
+        accumulator.rows = rows
+        ys, xs = np.ogrid[rows[0]:rows[1], :map_shape[1]]
+        for modality in ['NM', 'CT', 'OT']:
+            if modality in sources and progress.was_canceled() is False:
+                progress.set_text(
+                    f'Calculating {modality} dose for rows {rows[0]}-{rows[1]}...')
+                if modality == 'NM':
+                    calculate_dose_NM(
+                        sources['NM'], isotopes, walls, shield_data,
+                        map_shape, calibration_factor, general_values,
+                        progress, 100 * n_done, step, msgs_tiles,
+                        n_workers=n_workers, accumulator=accumulator,
+                        positions=(xs, ys))
+                else:
+                    calculate_dose_kV(
+                        sources[modality],
+                        ct_models if modality == 'CT' else None,
+                        walls, shield_data,
+                        map_shape, calibration_factor, general_values,
+                        progress, 100 * n_done, step, msgs_tiles,
+                        n_workers=n_workers, accumulator=accumulator,
+                        positions=(xs, ys))
+                n_done += len(sources[modality])
+    for msg in msgs_tiles:  # same warnings for all tiles
+        if msg not in msgs:
+            msgs.append(msg)
+
+    dose_dict = None
+    if progress.was_canceled() is False:
+        dose_dict = {
+            'dose_NM': None, 'dose_CT': None, 'dose_OT': None,
+            'walls': copy.deepcopy(walls), 'shield_data': shield_data,
+            'map_shape': map_shape, 'retain_sources': False,
+            'dose_sums': accumulator.dose_sums}
+
+    return (dose_dict, msgs)
+
+
+def calculate_dose_positions(
+        xs, ys, sources, walls, isotopes=None, ct_models=None, shield_data=None,
+        general_values=None, map_shape=(0, 0), calibration_factor=None,
+        floors=(1, ), n_workers=1, progress=None):
+    """Calculate summed dose at given positions without calculating maps.
+
+    Parameters
+    ----------
+    xs : np.array
+        x pixel coordinates (1d)
+    ys : np.array
+        y pixel coordinates (1d)
+    sources, walls, isotopes, ct_models, shield_data, general_values,
+    map_shape, calibration_factor, n_workers :
+        as calculate_dose_sources
+    floors : list of int, optional
+        floors to sum dose for. Default is [1].
+    progress : CalculationProgress, optional
+        to forward cancel requests. Default is None.
+
+    Returns
+    -------
+    dose_sums : dict
+        as dose_dict['dose_sums'] (see get_dose_sums) with values pr position
+    msgs : list of str
+        Info and warning messages.
+    """
+    msgs = []
+    if not isinstance(shield_data, dict):
+        shield_data = get_shield_lookup(shield_data)
+    if progress is None:
+        progress = CalculationProgress()
+    accumulator = DoseAccumulator(shield_data, general_values, floors=floors)
+    dose_sums = accumulator.dose_sums
+    # limit size of arrays pr source
+    n_chunk = max(1, MAX_CHUNK_ELEMENTS // (8 * TILE_MAPS_SOURCE))
+    for first in range(0, len(xs), n_chunk):
+        if progress.was_canceled() is False:
+            if first > 0:
+                accumulator.dose_sums = {
+                    key: dict.fromkeys(dose_sums[key]) for key in dose_sums}
+            positions = (np.asarray(xs[first:first + n_chunk]),
+                         np.asarray(ys[first:first + n_chunk]))
+            for modality in ['NM', 'CT', 'OT']:
+                if modality in sources:
+                    if modality == 'NM':
+                        calculate_dose_NM(
+                            sources['NM'], isotopes, walls, shield_data,
+                            map_shape, calibration_factor, general_values,
+                            progress, progress.value, 0, msgs,
+                            n_workers=n_workers, accumulator=accumulator,
+                            positions=positions)
+                    else:
+                        calculate_dose_kV(
+                            sources[modality],
+                            ct_models if modality == 'CT' else None,
+                            walls, shield_data,
+                            map_shape, calibration_factor, general_values,
+                            progress, progress.value, 0, msgs,
+                            n_workers=n_workers, accumulator=accumulator,
+                            positions=positions)
+            if first > 0:
+                for key, dose_sums_chunk in accumulator.dose_sums.items():
+                    for name, dose_sum in dose_sums_chunk.items():
+                        if dose_sum is not None:
+                            dose_sums[key][name] = np.concatenate(
+                                [dose_sums[key][name], dose_sum])
+    msgs_unique = []
+    for msg in msgs:  # same warnings for all chunks
+        if msg not in msgs_unique:
+            msgs_unique.append(msg)
+
+    return (dose_sums, msgs_unique)
+
+
+def get_edge_cells(cells_shape, grid_factor, sources, walls, map_shape):
+    """Find cells of calculation grid crossed by walls or wall shadow edges.
+
+    Parameters
+    ----------
+    cells_shape : tuple of ints
+        number of cells (y, x) between the calculation points
+    grid_factor : int
+        pixels between calculation points
+    sources : dict
+        as calculate_dose_sources
+    walls : list of list
+        as calculate_dose_sources
+    map_shape : tuple of ints
+        shape of floor plan (y, x)
+
+    Returns
+    -------
+    edge_cells : np.array of bool
+        shape cells_shape, True for cells with walls, shadow edges or sources
+    """
+    edge_cells = np.zeros(cells_shape, dtype=bool)
+    if edge_cells.size > 0:
+        sources_pos = [row[2] for rows in sources.values() for row in rows if row]
+        walls_pos = [row[2] for row in walls if row]
+        diagonal = float(np.hypot(*map_shape))
+        segments = [wall_pos for wall_pos in walls_pos]
+        for sx, sy in sources_pos:
+            for wall_pos in walls_pos:
+                for wx, wy in [wall_pos[:2], wall_pos[2:]]:
+                    length = np.hypot(wx - sx, wy - sy)
+                    if length > 0:  # shadow edge from wall end and outwards
+                        scale = diagonal / length
+                        segments.append([wx, wy, wx + scale * (wx - sx),
+                                         wy + scale * (wy - sy)])
+        xs = [np.array([sx for sx, sy in sources_pos], dtype=float)]
+        ys = [np.array([sy for sx, sy in sources_pos], dtype=float)]
+        for x0, y0, x1, y1 in segments:
+            n_samples = int(2 * np.hypot(x1 - x0, y1 - y0) / grid_factor) + 2
+            xs.append(np.linspace(x0, x1, n_samples))
+            ys.append(np.linspace(y0, y1, n_samples))
+        xs = np.concatenate(xs) / grid_factor
+        ys = np.concatenate(ys) / grid_factor
+        inside = ((xs >= 0) & (xs < cells_shape[1] + 1)
+                  & (ys >= 0) & (ys < cells_shape[0] + 1))
+        idxs_x = np.minimum(xs[inside].astype(int), cells_shape[1] - 1)
+        idxs_y = np.minimum(ys[inside].astype(int), cells_shape[0] - 1)
+        edge_cells[idxs_y, idxs_x] = True
+    return edge_cells
+
+
+def calculate_dose_adaptive(
+        sources, walls, isotopes=None, ct_models=None, shield_data=None,
+        general_values=None, map_shape=(0, 0), calibration_factor=None,
+        progress_callback=None, cancel_callback=None, n_workers=N_WORKERS,
+        coarse_factor=16, tolerance=0.01, floors=(0, 1, 2)):
+    """Calculate summed dose on a grid refined where interpolation fails.
+
+    Dose is calculated on a coarse grid. Each cell between calculation points
+    is then split in four (quadtree) by calculating dose at the cell center and
+    the edge midpoints. Cells are split further where these differ from the
+    bilinear interpolation by more than tolerance and where walls, wall shadow
+    edges or sources cross the cell. Dose at positions not calculated is
+    interpolated bilinearly.
+
+    Parameters
+    ----------
+    sources, walls, isotopes, ct_models, shield_data, general_values,
+    map_shape, calibration_factor, progress_callback, cancel_callback,
+    n_workers :
+        as calculate_dose_sources
+    coarse_factor : int, optional
+        pixels between points of the coarse grid, rounded down to a power of 2.
+        Default is 16.
+    tolerance : float, optional
+        accepted relative interpolation error. Default is 0.01.
+    floors : list of int, optional
+        floors to sum dose for. Default is [0, 1, 2].
+
+    Returns
+    -------
+    dose_dict : dict or None
+        as calculate_dose_sources with retain_sources False. Number of
+        positions calculated in n_calculated. None if canceled.
+    msgs : list of str
+        Info and warning messages.
+    """
+    msgs = []
+    if not isinstance(shield_data, dict):
+        shield_data = get_shield_lookup(shield_data)
+    map_shape = tuple(map_shape)
+    grid_factor = 2 ** int(np.log2(max(coarse_factor, 1)))
+    n_levels = int(np.log2(grid_factor)) + 1
+    progress = CalculationProgress(
+        n_steps=n_levels, progress_callback=progress_callback,
+        cancel_callback=cancel_callback)
+    progress.set_text('Calculating dose on coarse grid...')
+    kwargs = {
+        'isotopes': isotopes, 'ct_models': ct_models,
+        'shield_data': shield_data, 'general_values': general_values,
+        'map_shape': map_shape, 'calibration_factor': calibration_factor,
+        'floors': floors, 'n_workers': n_workers, 'progress': progress}
+
+    grid_shape = get_grid_shape(map_shape, grid_factor)
+    idxs_y, idxs_x = np.indices(grid_shape).reshape(2, -1)
+    dose_sums, msgs = calculate_dose_positions(
+        grid_factor * idxs_x, grid_factor * idxs_y, sources, walls, **kwargs)
+    values = {(key, name): dose_sum.reshape(grid_shape)
+              for key, dose_sums_floor in dose_sums.items()
+              for name, dose_sum in dose_sums_floor.items()
+              if dose_sum is not None}
+    n_calculated = idxs_x.size
+    refine = np.ones((grid_shape[0] - 1, grid_shape[1] - 1), dtype=bool)
+
+    while grid_factor > 1 and progress.was_canceled() is False:
+        progress.set_value(progress.value + 1)
+        progress.set_text(f'Refining dose grid to {grid_factor // 2} pixels...')
+        refine |= get_edge_cells(
+            refine.shape, grid_factor, sources, walls, map_shape)
+        fine_shape = (2 * grid_shape[0] - 1, 2 * grid_shape[1] - 1)
+        values = {name: upsample_grid(value, fine_shape, 2)
+                  for name, value in values.items()}
+        # center and edge midpoints of cells to refine
+        calculate = np.zeros(fine_shape, dtype=bool)
+        calculate[1::2, 1::2] |= refine
+        calculate[:-1:2, 1::2] |= refine
+        calculate[2::2, 1::2] |= refine
+        calculate[1::2, :-1:2] |= refine
+        calculate[1::2, 2::2] |= refine
+        grid_factor = grid_factor // 2
+        idxs_y, idxs_x = np.nonzero(calculate)
+        dose_sums, _ = calculate_dose_positions(
+            grid_factor * idxs_x, grid_factor * idxs_y, sources, walls, **kwargs)
+        n_calculated += idxs_x.size
+        failed = np.zeros(fine_shape, dtype=bool)
+        failed_calculated = np.zeros(idxs_x.size, dtype=bool)
+        for (key, name), value in values.items():
+            calculated = dose_sums[key][name]
+            interpolated = value[calculate]
+            failed_calculated |= np.abs(calculated - interpolated) > (
+                tolerance * np.maximum(np.abs(calculated), 1e-6 * value.max()))
+            value[calculate] = calculated
+        failed[calculate] = failed_calculated
+        # split cells of the refined cells with failed corners
+        refine = np.repeat(np.repeat(refine, 2, axis=0), 2, axis=1) & (
+            failed[:-1, :-1] | failed[1:, :-1] | failed[:-1, 1:] | failed[1:, 1:])
+        grid_shape = fine_shape
+
+    dose_dict = None
+    if progress.was_canceled() is False:
+        dose_sums = {key: {name: None for name in dose_sums_floor}
+                     for key, dose_sums_floor in dose_sums.items()}
+        for (key, name), value in values.items():
+            dose_sums[key][name] = value[:map_shape[0], :map_shape[1]]
+        dose_dict = {
+            'dose_NM': None, 'dose_CT': None, 'dose_OT': None,
+            'walls': copy.deepcopy(walls), 'shield_data': shield_data,
+            'map_shape': map_shape, 'retain_sources': False,
+            'dose_sums': dose_sums, 'n_calculated': n_calculated}
+
+    return (dose_dict, msgs)
+
+
+def update_dose_walls(main):
+    """Update dose_dict of main after walls are edited, added or removed.
+
+    Parameters
+    ----------
+    main : ui_main.MainWindow
+
+    Returns
+    -------
+    status : bool
+        True if dose_dict was updated. False if the dose pr source is not kept
+        (retain_sources False), then recalculate if walls changed.
+    msgs : list of str
+        Info and warning messages to display after this process finished.
+    """
+    status = False
+    msgs = []
+    walls_input = get_walls_input(main)
+    if walls_input is not None:
+        msgs = update_walls_transmission(**walls_input)
+        status = True
+    return status, msgs
+
+
+def get_walls_input(main):
+    """Collect input for update_walls_transmission from main.
+
+    Parameters
+    ----------
+    main : ui_main.MainWindow
+
+    Returns
+    -------
+    walls_input : dict or None
+        keyword arguments to update_walls_transmission. None if the dose pr
+        source is not kept (retain_sources False) or no dose calculated.
+    """
+    walls_input = None
+    if (main.dose_dict and main.gui.calibration_factor
+            and main.dose_dict.get('retain_sources', True)):
+        walls_input = {
+            'dose_dict': main.dose_dict,
+            'walls': get_valid_rows(
+                main.walls_tab.table_list, nonzero_columns=[4],
+                n_coordinates=4),
+            'isotopes': main.isotopes, 'shield_data': main.shield_lookup,
+            'general_values': copy.deepcopy(main.general_values),
+            'map_shape': main.occ_map.shape,
+            'geometry_cache': main.wall_geometry_cache}
+    return walls_input
+
+
+def walls_changed(dose_dict, walls):
+    """Return True if any source of dose_dict is calculated with other walls."""
+    return bool(dose_dict.get('walls_sources')) or walls != dose_dict['walls']
+
+
+def get_source_shield_keys(modality, source, isotopes=None):
+    """Get isotope or kV_source used to find shield data for a source.
+
+    Parameters
+    ----------
+    modality : str
+        'NM', 'CT' or 'OT'
+    source : list
+        source row
+    isotopes : list of config_classes.Isotope
+        needed for NM
+
+    Returns
+    -------
+    isotope : config_classes.Isotope or ''
+    kV_source : str
+    """
+    isotope = ''
+    kV_source = ''
+    if modality == 'NM':
+        isotope_labels = [x.label for x in isotopes]
+        isotope = isotopes[isotope_labels.index(source[3])]
+    elif modality == 'CT':
+        kV_source = source[4]
     else:
-        if modality:  # not valid dose (e.g. zero and specific source)
-            if modality == 'NM':
-                try:
-                    main.dose_dict['dose_NM']['doserate_max_factors'][source_number] = None
-                except TypeError:
-                    pass
-            for param in [
-                    'dist_maps', 'dose_factors', 'transmission_maps']:
+        kV_source = source[3]
+    return (isotope, kV_source)
+
+
+def get_wall_key(wall):
+    """Return values defining the shielding of a wall row as hashable key."""
+    return (tuple(wall[2]), wall[3], wall[4])
+
+
+def get_walls_diff(walls_old, walls):
+    """Get walls removed and added as rows with only shielding values."""
+    old_keys = Counter([get_wall_key(wall) for wall in walls_old if wall])
+    new_keys = Counter([get_wall_key(wall) for wall in walls if wall])
+    removed_walls = [
+        [True, '', list(key[0]), key[1], key[2]]
+        for key in (old_keys - new_keys).elements()]
+    added_walls = [
+        [True, '', list(key[0]), key[1], key[2]]
+        for key in (new_keys - old_keys).elements()]
+    return (removed_walls, added_walls)
+
+
+def update_walls_transmission(
+        dose_dict, walls, isotopes=None, shield_data=None, general_values=None,
+        map_shape=(0, 0), geometry_cache=None, progress_callback=None,
+        cancel_callback=None):
+    """Update transmission in floor 1 for changed walls only.
+
+    Walls that are no longer present (or changed) are divided out and new walls
+    multiplied into the transmission map of each source. The source is
+    recalculated for all walls if the removed walls transmit too little to
+    be divided out without loss of precision.
+
+    Sources calculated with other walls than dose_dict['walls'] are listed in
+    dose_dict['walls_sources'], e.g. if canceled before all sources are
+    updated. dose_dict['walls'] is set when all sources are updated.
+
+    Parameters
+    ----------
+    dose_dict : dict
+        as returned by calculate_dose_sources. Updated in place.
+    walls : list of list
+        current wall rows as returned by get_valid_rows
+    isotopes : list of config_classes.Isotope
+    shield_data : dict or list of config_classes.ShieldData
+    general_values : config_classes.GeneralValues
+    map_shape : tuple of ints
+        shape of floor plan (y, x)
+    geometry_cache : array_cache.ArrayCache, optional
+        reuse wall geometry between calculations. Default is None.
+    progress_callback : callable, optional
+        as CalculationProgress. Default is None.
+    cancel_callback : callable, optional
+        as CalculationProgress, checked between sources. Default is None.
+
+    Returns
+    -------
+    msgs : list of str
+        Info and warning messages.
+    """
+    msgs = []
+    if not isinstance(shield_data, dict):
+        shield_data = get_shield_lookup(shield_data)
+    walls_sources = dose_dict.get('walls_sources', {})
+    grid_factor = dose_dict.get('grid_factor', 1)
+    if grid_factor > 1:
+        map_shape = get_grid_shape(map_shape, grid_factor)
+    walls_grid = scale_rows_to_grid(walls, grid_factor)
+
+    # sources to update with walls removed and added
+    updates = []
+    for modality in ['NM', 'CT', 'OT']:
+        dd = dose_dict[f'dose_{modality}']
+        if dd:
+            for i in np.flatnonzero(dd['valid']):
+                removed_walls, added_walls = get_walls_diff(
+                    walls_sources.get((modality, i), dose_dict['walls']), walls)
+                if removed_walls or added_walls:
+                    updates.append((
+                        modality, int(i),
+                        scale_rows_to_grid(removed_walls, grid_factor),
+                        scale_rows_to_grid(added_walls, grid_factor)))
+
+    canceled = False
+    progress = CalculationProgress(
+        n_steps=len(updates), progress_callback=progress_callback,
+        cancel_callback=cancel_callback)
+    progress.set_text('Updating walls...')
+    if updates:
+        reset_dose_sums(dose_dict)
+    for step, (modality, i, removed_walls, added_walls) in enumerate(updates):
+        if progress.was_canceled():
+            canceled = True
+            break
+        dd = dose_dict[f'dose_{modality}']
+        transmission_maps = dd['transmission_maps'][1]
+        source = dd['sources'][i]
+        index = dd['stack_index'][i]
+        isotope, kV_source = get_source_shield_keys(
+            modality, source, isotopes)
+        kwargs = {
+            'correct_thickness': general_values.correct_thickness,
+            'isotope': isotope, 'kV_source': kV_source,
+            'geometry_cache': geometry_cache,
+            'dtype': transmission_maps.dtype}
+        transmission_removed = calculate_walls_transmission(
+            map_shape, source[2], removed_walls, shield_data, **kwargs)
+        # product with removed walls may have lost precision
+        # (subnormal) if removed walls transmit less than
+        # min_transmission, then recalculate all walls
+        min_transmission = np.sqrt(np.finfo(transmission_maps.dtype).tiny)
+        if np.all(transmission_removed >= min_transmission):
+            # new map set at once, not visible half updated
+            transmission = transmission_maps[index] / transmission_removed
+            transmission *= calculate_walls_transmission(
+                map_shape, source[2], added_walls, shield_data,
+                msgs=msgs, **kwargs)
+        else:
+            transmission = calculate_walls_transmission(
+                map_shape, source[2], walls_grid, shield_data,
+                msgs=msgs, **kwargs)
+        transmission_maps[index] = transmission
+        walls_sources[(modality, i)] = copy.deepcopy(walls)
+        dose_dict['walls_sources'] = walls_sources
+        progress.set_value(step + 1)
+
+    if not canceled:
+        dose_dict['walls'] = copy.deepcopy(walls)
+        dose_dict.pop('walls_sources', None)
+    return msgs
+
+
+def sum_dose_days(dose_dict, occ_map=1., floor=1, working_days=1,
+                  general_values=None):
+    """Sum dose pr source to dose maps for the given floor.
+
+    Parameters
+    ----------
+    dose_dict : dict
+        as returned by calculate_dose_sources
+    occ_map : np.array or float, optional
+        occupancy factors. Default is 1.
+    floor : int, optional
+        0 = floor below, 1 = this floor, 2 = floor above. Default is 1.
+    working_days : int, optional
+        number of working days to sum dose for. Default is 1.
+    general_values : config_classes.GeneralValues, optional
+        needed for floor 0 and 2 and to get floating point type.
+        Default is None.
+
+    Returns
+    -------
+    dose_maps : dict or None
+        keys nm_dose_map, nm_doserate_map, ct_dose_map, ot_dose_map
+        with np.array or None if no sources for that modality.
+        None if the summed dose is not available (see get_dose_sums).
+    """
+    if isinstance(occ_map, np.ndarray):
+        occ_map = occ_map.astype(get_dtype(general_values), copy=False)
+    dose_sums = get_dose_sums(dose_dict, floor=floor, general_values=general_values)
+    dose_maps = None
+    if dose_sums is not None:
+        factor = 0.001 * working_days  # mSv
+        dose_maps = {}
+        for key, dose_sum in dose_sums.items():
+            if dose_sum is None or key == 'nm_doserate_map':
+                dose_maps[key] = dose_sum
+            else:
+                dose_maps[key] = factor * occ_map * dose_sum
+
+    return dose_maps
+
+
+def get_dose_sums(dose_dict, floor=1, general_values=None):
+    """Get dose pr day summed over sources without occupancy factors.
+
+    The sums are kept in dose_dict['dose_sums'] for reuse until the dose pr
+    source change (see reset_dose_sums). Transmission through floor below or
+    above is calculated the first time that floor is requested.
+    Sums calculated on a coarser calculation grid are upsampled to the shape
+    of the floor plan by bilinear interpolation.
+
+    Parameters
+    ----------
+    dose_dict : dict
+        as returned by calculate_dose_sources
+    floor : int, optional
+        0 = floor below, 1 = this floor, 2 = floor above. Default is 1.
+    general_values : config_classes.GeneralValues, optional
+        needed for floor 0 and 2. Default is None.
+
+    Returns
+    -------
+    dose_sums : dict or None
+        keys nm_dose_map (uSv pr day), nm_doserate_map (uSv/h),
+        ct_dose_map and ot_dose_map (uSv pr day)
+        with np.array or None if no sources for that modality.
+        None if the dose pr source is not kept (retain_sources False) and the
+        floor shielding changed since calculation. Then recalculate.
+    """
+    key = get_dose_sums_key(floor, general_values)
+    if 'dose_sums' not in dose_dict:
+        dose_dict['dose_sums'] = {}
+    dose_sums = dose_dict['dose_sums'].get(key, None)
+    if dose_sums is None and dose_dict.get('retain_sources', True):
+        floor_dist = 0.
+        if len(key) > 1:
+            floor_dist = get_floor_distance(floor, general_values)
+            set_floors_transmission(dose_dict, floor, general_values)
+        dose_sums = calculate_dose_sums(
+            dose_dict, floor=floor, floor_dist=floor_dist)
+        if dose_dict.get('grid_factor', 1) > 1:
+            dose_sums = upsample_dose_sums(
+                dose_sums, dose_dict['map_shape'], dose_dict['grid_factor'])
+        dose_dict['dose_sums'][key] = dose_sums
+    return dose_sums
+
+
+def get_dose_sums_key(floor, general_values=None):
+    """Get key of dose_dict['dose_sums'] for floor with current floor shielding."""
+    key = (floor, )
+    if general_values is not None and floor != 1:
+        key = (floor, ) + get_floor_shielding(floor, general_values)
+    return key
+
+
+def reset_dose_sums(dose_dict):
+    """Remove sums from get_dose_sums after changing dose pr source."""
+    dose_dict.pop('dose_sums', None)
+
+
+def calculate_dose_sums(dose_dict, floor=1, floor_dist=0.):
+    """Sum dose pr day of all sources without occupancy factors.
+
+    Parameters
+    ----------
+    dose_dict : dict
+        as returned by calculate_dose_sources
+    floor : int, optional
+        0 = floor below, 1 = this floor, 2 = floor above. Default is 1.
+    floor_dist : float, optional
+        distance from source height to calculation height in floor. Default is 0.
+
+    Returns
+    -------
+    dose_sums : dict
+        as get_dose_sums
+    """
+    dose_sums = {
+        'nm_dose_map': None, 'nm_doserate_map': None,
+        'ct_dose_map': None, 'ot_dose_map': None}
+
+    for modality in ['NM', 'CT', 'OT']:
+        dd = dose_dict[f'dose_{modality}']
+        if dd and dd['valid'].any():
+            dist_maps = get_source_stack_used(dd, 'dist_maps')
+            transmission_maps = get_source_stack_used(
+                dd, 'transmission_maps', floor=floor)
+            if transmission_maps is None:
+                transmission_maps = np.ones(
+                    dist_maps.shape[:1] + (1, ) * (dist_maps.ndim - 1),
+                    dtype=dist_maps.dtype)
+            if modality == 'CT':
+                # unused stack positions have zero dose factors
+                dose_sums['ct_dose_map'] = np.einsum(
+                    'i...,i...->...', transmission_maps,
+                    get_source_stack_used(dd, 'dose_factors', floor=floor))
+            elif modality == 'NM':
+                factors = np.array(
+                    [get_source_stack_used(dd, 'dose_factors'),
+                     get_source_stack_used(dd, 'doserate_max_factors')])
+                sums = sum_inverse_square(
+                    factors, transmission_maps, dist_maps,
+                    floor_dist=0. if floor == 1 else floor_dist)
+                dose_sums['nm_dose_map'] = sums[0]
+                dose_sums['nm_doserate_map'] = sums[1]
+            else:
+                dose_sums['ot_dose_map'] = sum_inverse_square(
+                    get_source_stack_used(dd, 'dose_factors')[np.newaxis],
+                    transmission_maps, dist_maps,
+                    floor_dist=0. if floor == 1 else floor_dist)[0]
+
+    return dose_sums
+
+
+def sum_inverse_square(factors, transmission_maps, dist_maps, floor_dist=0.):
+    """Sum factors * transmission / distance**2 over sources.
+
+    The inverse square maps are calculated for chunks of sources to limit the
+    size of intermediate arrays.
+
+    Parameters
+    ----------
+    factors : np.array
+        shape (n_factors, n_sources)
+    transmission_maps : np.array
+        shape (n_sources, y, x) or (n_sources, 1, 1)
+    dist_maps : np.array
+        distances in floor 1, shape (n_sources, y, x)
+        (or (n_sources, n_points) for positions not in a map)
+    floor_dist : float, optional
+        distance from source height to calculation height. Default is 0.
+
+    Returns
+    -------
+    sums : np.array
+        shape (n_factors, y, x)
+    """
+    n_sources = dist_maps.shape[0]
+    factors = factors.astype(dist_maps.dtype)
+    sums = np.zeros((factors.shape[0], ) + dist_maps.shape[1:],
+                    dtype=dist_maps.dtype)
+    n_chunk = max(1, MAX_CHUNK_ELEMENTS // max(dist_maps[0].size, 1))
+    for start in range(0, n_sources, n_chunk):
+        chunk = slice(start, start + n_chunk)
+        inverse_square = dist_maps[chunk] ** 2
+        if floor_dist:
+            inverse_square += floor_dist ** 2
+        np.reciprocal(inverse_square, out=inverse_square)
+        sums += np.einsum('mi,i...,i...->m...', factors[:, chunk],
+                          transmission_maps[chunk], inverse_square)
+    return sums
+
+
+def get_valid_rows(table_list, nonzero_columns=None, n_coordinates=0):
+    """Get rows from table_list where active and specific columns are not zero.
+
+    Also concert position-string to list of ints.
+
+    Parameters
+    ----------
+    table_list : list of list
+        as defined in ui_main for each tab.
+    nonzero_columns : list of int, optional
+        Columns that cannot be zero to be valid. The default is None.
+    n_coordinates: int
+        number of coordinate values [x1, y1, x2, y2] = 4 numbers
+
+    Returns
+    -------
+    valid_table_list : list of list
+        table_list with valid rows.
+    """
+    valid_table_list = [None for row in table_list]
+    for rowno, row in enumerate(table_list):
+        add = True
+        if len(row[2]):
+            if row[0]:  # active
+                for i in nonzero_columns:
+                    if row[i] == 0:
+                        add = False
+                        break
+            else:
+                add = False
+        else:
+            add = False  # position(s) not given
+
+        if add:
+            coords = row[2].split(',')
+            if len(coords) == n_coordinates:
                 try:
-                    main.dose_dict[f'dose_{modality}'][param][source_number] = None
-                except TypeError:
+                    coord_list = [int(coord) for coord in coords]
+                    valid_table_list[rowno] = copy.deepcopy(row)
+                    valid_table_list[rowno][2] = coord_list
+                except ValueError:
                     pass
 
-    return status, msgs
+    return valid_table_list
+
+
+def get_distance_source(shape, xy, calibration_factor, dtype=np.float64,
+                        positions=None):
+    """Calculate distances from (x,y) in image.
+
+    Parameters
+    ----------
+    shape : tuple
+        shape of array to generate
+    xy: str
+        x, y position of point in map
+    calibration_factor: float
+        m/pixel
+    dtype : numpy dtype, optional
+        floating point type of the map. Default is np.float64.
+    positions : tuple of np.array, optional
+        (xs, ys) pixel coordinates, broadcastable (e.g. from np.ogrid), to
+        calculate only these positions of the map. Default is None.
+
+    Returns
+    -------
+    distance_map : ndarray
+        distances to source
+    """
+    x, y = xy
+    if positions is None:
+        ys, xs = np.ogrid[0:shape[0], 0:shape[1]]
+    else:
+        xs, ys = positions
+    dist_sq = ((xs - x) ** 2 + (ys - y) ** 2).astype(dtype, copy=False)
+    distance_map = np.sqrt(dist_sq, out=dist_sq)
+    distance_map *= calibration_factor
+    distance_map[distance_map < 0.1] = 0.1  # ignore doses closer than 0.1m
+
+    return distance_map
+
+
+def calculate_wall_affect_sector(shape, source_pos, wall_pos):
+    """Return matrix zeros except for sector where source is shielded by wall.
+
+    Where shielded by wall = relative thickness of wall (path length through
+    the wall relative to the wall thickness). Any wall orientation.
+
+    Parameters
+    ----------
+    shape : tuple of ints
+        shape of map (y, x)
+    source_pos : tuple or list
+        x, y pixel position of source
+    wall_pos : tuple or list
+        x0, y0, x1, y1 pixel positions of wall
+
+    Returns
+    -------
+    wall_affect_sector : np.array
+    mask : np.array
+        1 where shielded by wall, else 0
+    """
+    y, x = np.ogrid[:shape[0], :shape[1]]
+    wall_affect_sector = get_walls_affect(x, y, source_pos, [wall_pos])[0]
+    mask = np.zeros(shape)
+    mask[wall_affect_sector != 0] = 1
+    return wall_affect_sector, mask
+
+
+def get_walls_affect(xs, ys, source_pos, walls_pos, correct_thickness=True):
+    """Calculate where walls shield source, all walls in one batched pass.
+
+    A position is shielded by a wall if the line from the source to the position
+    crosses the wall segment, i.e. the position is within the angular sector
+    spanned by the wall end points and on the opposite side of the wall line.
+    Positions on the wall line are shielded, with or without correct_thickness.
+
+    Parameters
+    ----------
+    xs : np.array
+        x pixel coordinates, broadcastable with ys (e.g. from np.ogrid)
+    ys : np.array
+        y pixel coordinates
+    source_pos : tuple or list
+        x, y pixel position of source
+    walls_pos : list of list or np.array
+        [x0, y0, x1, y1] pixel positions pr wall
+    correct_thickness : bool, optional
+        if True return relative path length through the wall where shielded.
+        If False return 1 where shielded. Default is True.
+
+    Returns
+    -------
+    walls_affect : np.array
+        shape (n_walls,) + shape of xs, ys broadcasted.
+        0 where not shielded, else relative thickness of wall.
+    """
+    sx, sy = source_pos
+    walls_pos = np.array(walls_pos, dtype=float).reshape(-1, 4)
+    expand = (slice(None),) + (np.newaxis,) * np.broadcast(xs, ys).ndim
+    wx0, wy0, wx1, wy1 = [walls_pos[expand + (i,)] for i in range(4)]
+    wdx, wdy = wx1 - wx0, wy1 - wy0
+    ax, ay = wx0 - sx, wy0 - sy  # source to wall start
+    bx, by = wx1 - sx, wy1 - sy  # source to wall end
+    px, py = xs - sx, ys - sy  # source to position
+
+    # side of wall line (cross product), source side and position side
+    # positions on the wall line (side_pos 0) are behind the wall
+    side_source = wdy * ax - wdx * ay
+    side_pos = wdx * py - wdy * px + side_source
+    behind = (side_pos * side_source <= 0) & (side_source != 0)
+    # within sector between rays to wall start and wall end
+    sector_sign = np.sign(ax * by - ay * bx)
+    behind &= sector_sign * (ax * py - ay * px) >= 0
+    behind &= sector_sign * (px * by - py * bx) >= 0
+
+    if correct_thickness:
+        # path length / thickness = |P-S| / |(P-S) . unit normal of wall|
+        # cross_pos >= |side_source| > 0 where behind, same mask as below
+        cross_pos = np.abs(side_pos - side_source)
+        walls_affect = np.divide(
+            np.sqrt(px ** 2 + py ** 2) * np.sqrt(wdx ** 2 + wdy ** 2),
+            cross_pos, out=np.zeros(behind.shape), where=behind)
+    else:
+        walls_affect = behind.astype(float)
+
+    return walls_affect
+
+
+def get_walls_affect_cached(map_shape, source_pos, walls_pos,
+                            correct_thickness=False, geometry_cache=None,
+                            dtype=np.float64):
+    """Get wall affect maps for one source, reusing cached geometry if possible.
+
+    Parameters
+    ----------
+    map_shape : tuple of ints
+        shape of map (y, x)
+    source_pos : list of int
+        x, y pixel position of source
+    walls_pos : list of list of int
+        x0, y0, x1, y1 pixel positions pr wall
+    correct_thickness : bool, optional
+        correct geometrically for wall thickness. Default is False.
+    geometry_cache : array_cache.ArrayCache, optional
+        cache holding maps from earlier calculations. Default is None.
+    dtype : numpy dtype, optional
+        floating point type of maps if correct_thickness. Default is np.float64.
+
+    Returns
+    -------
+    walls_affect : list of np.array
+        as get_walls_affect pr wall. Boolean maps if correct_thickness is False.
+    """
+    keys = [
+        (tuple(map_shape), tuple(source_pos), tuple(wall_pos), correct_thickness,
+         np.dtype(dtype).name if correct_thickness else 'bool')
+        for wall_pos in walls_pos]
+    walls_affect = [None for key in keys]
+    if geometry_cache is not None:
+        walls_affect = [geometry_cache.get(key) for key in keys]
+    missing = [i for i, wall_affect in enumerate(walls_affect)
+               if wall_affect is None]
+    if missing:
+        ys, xs = np.ogrid[:map_shape[0], :map_shape[1]]
+        walls_affect_missing = get_walls_affect(
+            xs, ys, source_pos, [walls_pos[i] for i in missing],
+            correct_thickness=correct_thickness)
+        for i, wall_affect in zip(missing, walls_affect_missing):
+            if correct_thickness is False:
+                wall_affect = wall_affect > 0
+            else:
+                wall_affect = wall_affect.astype(dtype, copy=False)
+            if geometry_cache is not None:
+                geometry_cache.put(keys[i], wall_affect)
+            walls_affect[i] = wall_affect
+    return walls_affect
+
+
+def calculate_walls_transmission(
+        map_shape, source_pos, walls, shield_data,
+        correct_thickness=False, isotope='', kV_source='', msgs=None,
+        geometry_cache=None, dtype=np.float64, positions=None):
+    """Calculate combined transmission map of all walls for one source.
+
+    Parameters
+    ----------
+    map_shape : tuple of ints
+        shape of map (y, x)
+    source_pos : list of int
+        x, y pixel position of source
+    walls : list of list
+        wall rows as returned by get_valid_rows (None if not valid)
+    shield_data : dict
+        as returned by get_shield_lookup
+    correct_thickness : bool, optional
+        correct geometrically for wall thickness. Default is False.
+    isotope : config_classes.Isotope, optional
+        isotope of NM source. Default is ''
+    kV_source : str, optional
+        kV_source of CT or other kV source. Default is ''
+    msgs : list of str, optional
+        append warnings to this list. Default is None.
+    geometry_cache : array_cache.ArrayCache, optional
+        reuse wall affect maps depending only on source and wall positions.
+        Default is None.
+    dtype : numpy dtype, optional
+        floating point type of transmission_map. Default is np.float64.
+    positions : tuple of np.array, optional
+        (xs, ys) pixel coordinates, broadcastable (e.g. from np.ogrid), to
+        calculate only these positions of the map.
+        One wall at a time and without geometry_cache. Default is None.
+
+    Returns
+    -------
+    transmission_map : np.array
+    """
+    if positions is None:
+        shape = map_shape
+        n_walls_chunk = max(1, MAX_CHUNK_ELEMENTS // math.prod(map_shape))
+    else:
+        shape = np.broadcast(*positions).shape
+        n_walls_chunk = 1
+    if correct_thickness:  # summed log(transmission) until all walls added
+        transmission_map = np.zeros(shape, dtype=dtype)
+    else:
+        transmission_map = np.ones(shape, dtype=dtype)
+    walls = [wall for wall in walls if wall]
+    for first in range(0, len(walls), n_walls_chunk):
+        walls_chunk = walls[first:first + n_walls_chunk]
+        if positions is None:
+            walls_affect = get_walls_affect_cached(
+                map_shape, source_pos, [wall[2] for wall in walls_chunk],
+                correct_thickness=correct_thickness,
+                geometry_cache=geometry_cache, dtype=dtype)
+        else:
+            walls_affect = get_walls_affect(
+                *positions, source_pos, [wall[2] for wall in walls_chunk],
+                correct_thickness=correct_thickness)
+            walls_affect = [
+                wall_affect.astype(dtype, copy=False) if correct_thickness
+                else wall_affect > 0 for wall_affect in walls_affect]
+        for wall, wall_affect_map in zip(walls_chunk, walls_affect):
+            if correct_thickness:
+                errmsg = add_log_transmission(
+                    transmission_map, shield_data, wall_affect_map,
+                    thickness=wall[4], material=wall[3], isotope=isotope,
+                    kV_source=kV_source)
+            else:  # same transmission for all shielded positions
+                transmission_this, errmsg = calculate_transmission(
+                    shield_data, 1, thickness=wall[4],
+                    material=wall[3], isotope=isotope, kV_source=kV_source)
+                if transmission_this is not None:
+                    np.multiply(transmission_map, transmission_this,
+                                out=transmission_map, where=wall_affect_map)
+            if errmsg:
+                if msgs is not None:
+                    msgs.append(errmsg)
+    if correct_thickness:
+        np.exp(transmission_map, out=transmission_map)
+
+    return transmission_map
+
+
+@dataclass
+class ShieldCoefficients:
+    """Constants from ShieldData precomputed for transmission calculations."""
+
+    archer: bool = False  # True if alpha, beta, gamma given, else hvl/tvl
+    beta_alpha: float = 0.0  # beta/alpha
+    alpha_gamma: float = 0.0  # alpha*gamma
+    inv_gamma: float = 0.0  # -1/gamma
+    hvl1: float = 0.0
+    hvl2: float = 0.0
+    tvl1: float = 0.0
+    tvl2: float = 0.0
+    slope_hvl1: float = 0.0  # -ln(2)/hvl1
+    slope_hvl2: float = 0.0  # -ln(2)/hvl2
+    slope_tvl2: float = 0.0  # -ln(10)/tvl2
+    log_table: np.ndarray = None  # log(transmission) pr table_step mm if Archer
+    table_step: float = 0.0  # mm between values of log_table
+
+
+def get_shield_coefficients(data):
+    """Precompute constants for transmission calculations.
+
+    Parameters
+    ----------
+    data : config_classes.ShieldData
+
+    Returns
+    -------
+    coeffs : ShieldCoefficients or None
+        None if neither alpha, beta, gamma nor hvl1/tvl1 defined.
+    """
+    coeffs = None
+    if all([data.alpha, data.beta, data.gamma]):
+        coeffs = ShieldCoefficients(
+            archer=True,
+            beta_alpha=data.beta / data.alpha,
+            alpha_gamma=data.alpha * data.gamma,
+            inv_gamma=-1. / data.gamma)
+    elif data.hvl1 or data.tvl1:
+        coeffs = ShieldCoefficients(
+            hvl1=data.hvl1, hvl2=data.hvl2, tvl1=data.tvl1, tvl2=data.tvl2,
+            slope_hvl1=-math.log(2) / data.hvl1 if data.hvl1 else 0.,
+            slope_hvl2=-math.log(2) / data.hvl2 if data.hvl2 else 0.,
+            slope_tvl2=-math.log(10) / data.tvl2 if data.tvl2 else 0.)
+    return coeffs
+
+
+def calculate_log_transmission_archer(coeffs, thickness_map):
+    """Calculate log(transmission) from Archer parameters.
+
+    Parameters
+    ----------
+    coeffs : ShieldCoefficients
+    thickness_map : np.array
+        effective thickness (mm)
+
+    Returns
+    -------
+    log_transmission : np.array
+        -inf where transmission is zero (overflow)
+    """
+    with np.errstate(over='ignore', divide='ignore'):
+        log_transmission = np.exp(coeffs.alpha_gamma * thickness_map)
+        log_transmission *= 1 + coeffs.beta_alpha
+        log_transmission -= coeffs.beta_alpha
+        np.log(log_transmission, out=log_transmission)
+    log_transmission *= coeffs.inv_gamma
+    return log_transmission
 
 
-def get_valid_rows(table_list, nonzero_columns=None, n_coordinates=0):
-    """Get rows from table_list where active and specific columns are not zero.
+def interpolate_log_transmission(coeffs, thickness_map):
+    """Interpolate log(transmission) linearly in coeffs.log_table.
 
-    Also concert position-string to list of ints.
+    Thickness beyond the table is extrapolated from the last two values where
+    log(transmission) is linear in thickness.
 
     Parameters
     ----------
-    table_list : list of list
-        as defined in ui_main for each tab.
-    nonzero_columns : list of int, optional
-        Columns that cannot be zero to be valid. The default is None.
-    n_coordinates: int
-        number of coordinate values [x1, y1, x2, y2] = 4 numbers
+    coeffs : ShieldCoefficients
+        with log_table
+    thickness_map : np.array
+        effective thickness (mm)
 
     Returns
     -------
-    valid_table_list : list of list
-        table_list with valid rows.
+    log_transmission : np.array
     """
-    valid_table_list = [None for row in table_list]
-    for rowno, row in enumerate(table_list):
-        add = True
-        if len(row[2]):
-            if row[0]:  # active
-                for i in nonzero_columns:
-                    if row[i] == 0:
-                        add = False
-                        break
-            else:
-                add = False
-        else:
-            add = False  # position(s) not given
-
-        if add:
-            coords = row[2].split(',')
-            if len(coords) == n_coordinates:
-                try:
-                    coord_list = [int(coord) for coord in coords]
-                    valid_table_list[rowno] = copy.deepcopy(row)
-                    valid_table_list[rowno][2] = coord_list
-                except ValueError:
-                    pass
+    table = coeffs.log_table
+    position = thickness_map * (1. / coeffs.table_step)
+    index = np.minimum(position.astype(np.intp), table.size - 2)
+    position -= index
+    lower = table[index]
+    return lower + position * (table[index + 1] - lower)
 
-    return valid_table_list
 
+def get_transmission_table_error(coeffs):
+    """Find max relative error of interpolated transmission.
 
-def get_distance_source(shape, xy, calibration_factor):
-    """Calculate distance factors 1/dist^2 for (x,y) in image.
+    Linear interpolation error is largest between the tabulated values and
+    log(transmission) is curved at small thickness only. The error is
+    evaluated against the analytic formula at the midpoints and beyond the
+    table.
 
     Parameters
     ----------
-    shape : tuple
-        shape of array to generate
-    xy: str
-        x, y position of point in map
-    calibration_factor: float
-        m/pixel
+    coeffs : ShieldCoefficients
+        with log_table
 
     Returns
     -------
-    distance_map : ndarray
-        distances to source
+    max_error : float
     """
-    sz_y, sz_x = shape
-    x, y = xy
-    xs, ys = np.meshgrid(np.arange(sz_x), np.arange(sz_y))
-    distance_map = np.sqrt((xs-x) ** 2 + (ys-y) ** 2)
-    distance_map = calibration_factor * distance_map
-    distance_map[distance_map < 0.1] = 0.1  # ignore doses closer than 0.5m
+    thicknesses = coeffs.table_step * np.arange(
+        0.5, 2 * coeffs.log_table.size, 0.5)
+    log_error = (interpolate_log_transmission(coeffs, thicknesses)
+                 - calculate_log_transmission_archer(coeffs, thicknesses))
+    return float(np.expm1(np.abs(log_error)).max())
 
-    return distance_map
 
+def set_transmission_table(coeffs, accuracy):
+    """Tabulate log(transmission) of Archer parameters for interpolation.
 
-def calculate_wall_affect_sector(shape, source_pos, wall_pos):
-    """Return matrix zeros except for sector where source is shielded by wall.
+    Parameters
+    ----------
+    coeffs : ShieldCoefficients
+        Archer parameters, log_table and table_step set in place
+    accuracy : float
+        max relative error of interpolated transmission
+    """
+    # log(transmission) linear in thickness within float precision beyond
+    # exp(alpha_gamma * thickness) = exp(40)
+    max_thickness = 40. / abs(coeffs.alpha_gamma)
+    # linear interpolation error step**2/8 * max curvature (at zero thickness)
+    curvature = abs(coeffs.inv_gamma * coeffs.alpha_gamma ** 2
+                    * coeffs.beta_alpha * (1 + coeffs.beta_alpha))
+    step = math.sqrt(8 * accuracy / curvature) if curvature else max_thickness
+    for _ in range(10):
+        step = min(step, max_thickness / 2)
+        coeffs.table_step = step
+        coeffs.log_table = calculate_log_transmission_archer(
+            coeffs, step * np.arange(math.ceil(max_thickness / step) + 2))
+        if get_transmission_table_error(coeffs) <= accuracy:
+            break
+        step = 0.5 * step
+
+
+def get_shield_lookup(shield_data, table_accuracy=0.):
+    """Index shield data for direct lookup in calculate_transmission.
+
+    Parameters
+    ----------
+    shield_data : list of ShieldData
+    table_accuracy : float, optional
+        if > 0 tabulate Archer transmission with this max relative error
+        for interpolation in calculate_walls_transmission.
+        Default is 0 (analytic).
 
-    Where shielded by wall = relative thickness of wall
+    Returns
+    -------
+    shield_lookup : dict
+        key (material, isotope label, kV_source), value ShieldCoefficients
+        or None if no parameters given. First entry used if duplicates.
     """
-    sx, sy = source_pos
-    wx0, wy0, wx1, wy1 = wall_pos
-    dx0, dy0 = (wx0 - sx), (wy0 - sy)
-    dx1, dy1 = (wx1 - sx), (wy1 - sy)
-    angle0 = np.arctan2(dy0, dx0)
-    angle1 = np.arctan2(dy1, dx1)
-    angle_min = np.min([angle0, angle1])
-    angle_max = np.max([angle0, angle1])
-
-    # convert cartesian --> polar coordinates
-    y, x = np.ogrid[:shape[0], :shape[1]]
-    theta0 = np.arctan2(y-sy, x-sx)
-    theta = np.arctan2(y-sy, x-sx) - angle_min
-    theta %= (2*np.pi)  # force values between 0 and 2*pi
-    anglemask = theta < (angle_max - angle_min)
-
-    if wx0 == wx1:  # vertical wall
-        if sx > wx0:
-            anglemask = theta > (angle_max - angle_min)
-            if np.mean(anglemask) > 0.5:
-                anglemask = np.invert(anglemask)
-        wall_affect_sector = anglemask * np.abs(1/np.cos(theta0))
-        if sx > wx0:
-            wall_affect_sector[:, wx0:] = 0
-        elif sx < wx0:
-            wall_affect_sector[:, :wx0] = 0
-    elif wy0 == wy1:  # horizontal wall
-        wall_affect_sector = anglemask * np.abs(1/np.cos(theta0 + np.pi/2))
-        if sy > wy0:
-            wall_affect_sector[wy0:, :] = 0
-        elif sy < wy0:
-            wall_affect_sector[:wy0, :] = 0
-    else:  # oblique wall
-        # Express wall as line (left to right)
-        if wx0 > wx1:
-            xmax, ymax = wx0, wy0
-            xmin, ymin = wx1, wy1
-        else:
-            xmax, ymax = wx1, wy1
-            xmin, ymin = wx0, wy0
-        slope = (ymax-ymin)/(xmax-xmin)
-        y0 = - (slope * xmin - ymin)
-        y_at_source = slope*sx + y0  # vertical through source crossing wall
-        if np.mean(anglemask) > 0.5:  # make sure affected segment less than half rotation
-            anglemask = np.invert(anglemask)
-        wall_affect_sector = anglemask  # geometric correction of thickness ignored
-        for xx in range(shape[0]):
-            if xx > xmax:  # right of rightmost wall-position
-                if xx > sx:
-                    break
-                else:
-                    wall_affect_sector[:, xx] = 0
-            elif sx < xx < xmin:
-                wall_affect_sector[:, xx] = 0
-            elif xx >= xmin:
-                ythis = int(slope * xx + y0)
-                if y_at_source > sy:
-                    wall_affect_sector[:ythis, xx] = 0
-                else:
-                    wall_affect_sector[ythis:, xx] = 0
-    mask = np.copy(wall_affect_sector)
-    mask[wall_affect_sector != 0] = 1
-    return wall_affect_sector, mask
+    shield_lookup = {}
+    for data in shield_data:
+        key = (data.material, data.isotope, data.kV_source)
+        if key not in shield_lookup:
+            coeffs = get_shield_coefficients(data)
+            if table_accuracy > 0 and coeffs is not None and coeffs.archer:
+                set_transmission_table(coeffs, table_accuracy)
+            shield_lookup[key] = coeffs
+    return shield_lookup
 
 
 def calculate_transmission(shield_data, wall_affect_map=1, thickness=0.,
@@ -344,57 +2077,133 @@ def calculate_transmission(shield_data, wall_affect_map=1, thickness=0.,
 
     Parameters
     ----------
-    shield_data : list of ShieldData
+    shield_data : dict or list of ShieldData
+        dict as returned by get_shield_lookup (preferred) or list of ShieldData
     wall_affect_map : np.array or 1
         0 or 1 if thickness correction not performed else thickness correction
         1 (int) if floor 0 or 2 and thickness correction is False
-    thickness : float
-        wall thickness in mm
+    thickness : float or np.array
+        wall thickness in mm. If np.array, thickness is an extra axis
+        broadcasted with wall_affect_map (e.g. shape (n, 1, 1) for 2d maps).
     material : str
         Material name
-    isotope : str, Optional
-        Isotope name. Default is ''
+    isotope : config_classes.Isotope, Optional
+        Isotope. Default is ''
     kV_source : str, Optional
         kV_source name. Default is ''
 
     Returns
     -------
     transmission : float or np array
+        same floating point type as wall_affect_map if np.array
     errmsg : str
     """
-    sd = None
     transmission = None
     errmsg = ''
-    for data in shield_data:
-        if isotope:
-            if data.material == material and data.isotope == isotope.label:
-                sd = data
-                break
-        elif kV_source:
-            if data.material == material and data.kV_source == kV_source:
-                sd = data
-                break
-    if sd:
-        if all([sd.alpha, sd.beta, sd.gamma]):
-            transmission = (
-                (1 + (sd.beta/sd.alpha))
-                * np.exp(sd.alpha*sd.gamma*thickness*wall_affect_map)
-                - (sd.beta/sd.alpha)) ** (-1./sd.gamma)
-        elif sd.hvl1 or sd.tvl1:
+    if not isinstance(shield_data, dict):
+        shield_data = get_shield_lookup(shield_data)
+    if isotope:
+        key = (material, isotope.label, '')
+    else:
+        key = (material, '', kV_source)
+
+    if key in shield_data:
+        sd = shield_data[key]
+        if sd is None:
+            pass
+        elif sd.archer:
+            with np.errstate(over='ignore'):  # overflow = zero transmission
+                transmission = (
+                    (1 + sd.beta_alpha)
+                    * np.exp(sd.alpha_gamma*thickness*wall_affect_map)
+                    - sd.beta_alpha) ** sd.inv_gamma
+        else:
             thickness_map = thickness * wall_affect_map
+            if np.ndim(thickness) > 0:  # thickness as broadcast axis
+                transmission = np.select(
+                    [thickness < sd.hvl1,
+                     (thickness < sd.tvl1) & (sd.hvl2 > 0)],
+                    [np.exp(sd.slope_hvl1 * thickness_map),
+                     0.5 * np.exp(sd.slope_hvl2 * (thickness_map - sd.hvl1))],
+                    default=0.1 * np.exp(
+                        sd.slope_tvl2 * (thickness_map - sd.tvl1)))
+                transmission = np.where(
+                    np.asarray(wall_affect_map) == 0, 1., transmission)
+            else:
+                if thickness < sd.hvl1:
+                    transmission = np.exp(sd.slope_hvl1 * thickness_map)
+                elif thickness < sd.tvl1 and sd.hvl2 > 0:
+                    transmission = 0.5 * np.exp(
+                        sd.slope_hvl2 * (thickness_map - sd.hvl1))
+                else:
+                    transmission = 0.1 * np.exp(
+                        sd.slope_tvl2 * (thickness_map - sd.tvl1))
+                if not isinstance(wall_affect_map, int):
+                    transmission[wall_affect_map == 0] = 1.
+        if not isinstance(transmission, np.ndarray):
+            transmission = float(transmission)  # avoid upcasting float32 maps
+    else:
+        source_label = isotope.label if isotope else kV_source
+        errmsg = f'Found no shield data for {material} and {source_label}'
+    return (transmission, errmsg)
+
+
+def add_log_transmission(log_transmission_map, shield_data, wall_affect_map,
+                         thickness=0., material='', isotope='', kV_source=''):
+    """Add natural logarithm of transmission through one wall to a map.
+
+    Same transmission as calculate_transmission, but summed in the log domain
+    to evaluate exp only once pr position for all walls. For hvl/tvl data
+    the logarithm is linear in the thickness and no exp/log is needed pr wall.
+    Archer data are interpolated if tabulated (see get_shield_lookup).
+
+    Parameters
+    ----------
+    log_transmission_map : np.array
+        summed log(transmission), updated in place
+    shield_data : dict
+        as returned by get_shield_lookup
+    wall_affect_map : np.array
+        relative thickness of wall, 0 where not shielded
+    thickness, material, isotope, kV_source :
+        as calculate_transmission
+
+    Returns
+    -------
+    errmsg : str
+    """
+    errmsg = ''
+    if isotope:
+        key = (material, isotope.label, '')
+    else:
+        key = (material, '', kV_source)
+
+    if key in shield_data:
+        sd = shield_data[key]
+        if sd is None:
+            pass
+        elif sd.archer:
+            if sd.log_table is None:
+                log_transmission_map += calculate_log_transmission_archer(
+                    sd, thickness * wall_affect_map)
+            else:
+                log_transmission_map += interpolate_log_transmission(
+                    sd, thickness * wall_affect_map)
+        else:
             if thickness < sd.hvl1:
-                transmission = 2 ** -(thickness_map / sd.hvl1)
+                log_factor, slope, offset = 0., sd.slope_hvl1, 0.
             elif thickness < sd.tvl1 and sd.hvl2 > 0:
-                transmission = 0.5 * 2 ** -(
-                    (thickness_map - sd.hvl1)/sd.hvl2)
-            elif thickness > sd.tvl1:
-                transmission = 0.1 * 10 ** -(
-                    (thickness_map - sd.tvl1)/sd.tvl2)
-            if not isinstance(wall_affect_map, int):
-                transmission[wall_affect_map == 0] = 1.
+                log_factor, slope, offset = math.log(0.5), sd.slope_hvl2, sd.hvl1
+            else:
+                log_factor, slope, offset = math.log(0.1), sd.slope_tvl2, sd.tvl1
+            # log_factor + slope * (thickness_map - offset) where shielded
+            log_transmission_map += (slope * thickness) * wall_affect_map
+            np.add(log_transmission_map, log_factor - slope * offset,
+                   out=log_transmission_map, where=wall_affect_map > 0)
     else:
-        errmsg = f'Found no shield data for {material} and {isotope}'
-    return (transmission, errmsg)
+        source_label = isotope.label if isotope else kV_source
+        errmsg = f'Found no shield data for {material} and {source_label}'
+    return errmsg
 
 
 def get_floor_distance(floor, general_values):
@@ -410,6 +2219,102 @@ def get_floor_distance(floor, general_values):
     return floor_dist
 
 
+def get_dtype(general_values):
+    """Get floating point type for dose maps as set in general_values."""
+    dtype = np.float64
+    if general_values is not None and general_values.float32:
+        dtype = np.float32
+    return dtype
+
+
+def get_grid_factor(calibration_factor, general_values=None):
+    """Get number of image pixels between calculation points.
+
+    Parameters
+    ----------
+    calibration_factor : float
+        meters/pixel
+    general_values : config_classes.GeneralValues, optional
+        calculation_grid_cm is the wanted distance between calculation points.
+        Default is None.
+
+    Returns
+    -------
+    grid_factor : int
+        1 if dose is calculated for each pixel.
+    """
+    grid_factor = 1
+    if general_values is not None and calibration_factor:
+        if general_values.calculation_grid_cm > 0:
+            grid_factor = max(1, int(round(
+                0.01 * general_values.calculation_grid_cm / calibration_factor)))
+    return grid_factor
+
+
+def get_grid_shape(map_shape, grid_factor):
+    """Get shape of calculation grid covering the map with points every grid_factor.
+
+    Calculation point (j, i) is at pixel (j * grid_factor, i * grid_factor).
+    """
+    return tuple([-(-(n - 1) // grid_factor) + 1 for n in map_shape])
+
+
+def scale_rows_to_grid(rows, grid_factor):
+    """Get copy of source or wall rows with positions in calculation grid units."""
+    rows_grid = rows
+    if grid_factor > 1:
+        rows_grid = copy.deepcopy(rows)
+        for row in rows_grid:
+            if row:
+                row[2] = [val / grid_factor for val in row[2]]
+    return rows_grid
+
+
+def upsample_grid(grid_map, map_shape, grid_factor):
+    """Interpolate map from calculation grid bilinearly to map_shape.
+
+    Parameters
+    ----------
+    grid_map : np.array
+        values at calculation points, shape as get_grid_shape
+    map_shape : tuple of ints
+        shape of floor plan (y, x)
+    grid_factor : int
+        pixels between calculation points
+
+    Returns
+    -------
+    upsampled : np.array
+        shape map_shape, same floating point type as grid_map
+    """
+    upsampled = grid_map
+    for axis, n_pixels in enumerate(map_shape):
+        n_grid = upsampled.shape[axis]
+        if n_grid == 1:
+            upsampled = np.repeat(upsampled, n_pixels, axis=axis)
+        else:
+            pos = np.arange(n_pixels) / grid_factor
+            idxs = np.minimum(pos.astype(int), n_grid - 2)
+            weights = (pos - idxs).astype(grid_map.dtype)
+            shape = [1, 1]
+            shape[axis] = n_pixels
+            weights = weights.reshape(shape)
+            upsampled = (
+                (1 - weights) * np.take(upsampled, idxs, axis=axis)
+                + weights * np.take(upsampled, idxs + 1, axis=axis))
+    return upsampled
+
+
+def upsample_dose_sums(dose_sums, map_shape, grid_factor):
+    """Upsample maps of dose_sums (see get_dose_sums) from calculation grid."""
+    if grid_factor > 1:
+        dose_sums = {
+            name: None if dose_sum is None
+            else upsample_grid(dose_sum, map_shape, grid_factor)
+            for name, dose_sum in dose_sums.items()}
+    return dose_sums
+
+
 def get_dose_factors_NM(source_row, isotope):
     """Calculate dose and maximum dose rate @ 1m from source (unshielded, pr workday).
 
@@ -455,92 +2360,244 @@ def get_dose_factors_NM(source_row, isotope):
         act_at_t1 * integral_duration * gamma_ray_constant *
         rest_void * n_pr_workday)
 
-    return (dose_factor, doserate_max_factor)
+    # as python float to keep floating point type of dose maps
+    return (float(dose_factor), float(doserate_max_factor))
 
 
-def calculate_dose_NM(
-        sources, isotopes, walls, shield_data,
-        map_shape, calibration_factor, general_values,
-        progress_modal, progress_value, step, msgs):
-    """Calculate parameters for NM sources."""
-    dose_NM = {  # calculated values and arrays listed pr source
-        'dist_maps': [],  # list of np.array, distances in floor 1
-        'dose_factors': [],  # list of floats - unshielded dose uSv @ 1 m pr day
-        'doserate_max_factors': [],  # list of floats - max doserate uSv/h @ 1m
-        'transmission_maps': [],  # list of list of transmission map pr floor pr source
+def get_floor_shielding(floor, general_values):
+    """Get values defining shielding of floor below (0) or above (2) as key."""
+    if floor == 0:
+        thickness = general_values.shield_mm_below
+        material = general_values.shield_material_below
+    else:
+        thickness = general_values.shield_mm_above
+        material = general_values.shield_material_above
+    return (thickness, material, general_values.correct_thickness,
+            get_floor_distance(floor, general_values))
+
+
+def check_floors_shield_data(shield_data, general_values, isotope='',
+                             kV_source='', msgs=None):
+    """Warn if shield data missing for floor below or above.
+
+    The transmission maps for the floors are first calculated when needed
+    (see set_floors_transmission).
+    """
+    for floor in [0, 2]:
+        thickness, material, _, _ = get_floor_shielding(floor, general_values)
+        _, errmsg = calculate_transmission(
+            shield_data, thickness=thickness, material=material,
+            isotope=isotope, kV_source=kV_source)
+        if errmsg and msgs is not None:
+            msgs.append(errmsg)
+
+
+def calculate_floor_transmission(
+        dist_map, shield_data, general_values, floor=0, isotope='', kV_source=''):
+    """Calculate transmission through floor below or ceiling above.
+
+    Parameters
+    ----------
+    dist_map : np.array
+        distances to source in floor 1
+    shield_data : dict
+        as returned by get_shield_lookup
+    general_values : config_classes.GeneralValues
+    floor : int, optional
+        0 (below) or 2 (above). Default is 0.
+    isotope : config_classes.Isotope, optional
+        isotope of NM source. Default is ''
+    kV_source : str, optional
+        kV_source of CT or other kV source. Default is ''
+
+    Returns
+    -------
+    transmission : float or np.array
+        1. if shield data is missing
+    """
+    thickness, material, correct_thickness, dist = get_floor_shielding(
+        floor, general_values)
+    thickness_corr = 1
+    if correct_thickness:
+        thickness_corr = np.sqrt(dist_map ** 2 + dist ** 2) / dist
+    transmission, _ = calculate_transmission(
+        shield_data, wall_affect_map=thickness_corr, thickness=thickness,
+        material=material, isotope=isotope, kV_source=kV_source)
+    if transmission is None:
+        transmission = 1.
+    return transmission
+
+
+def set_floors_transmission(dose_dict, floor, general_values):
+    """Calculate transmission through floor for sources if not already done.
+
+    Parameters
+    ----------
+    dose_dict : dict
+        as returned by calculate_dose_sources. Updated in place.
+    floor : int
+        0 (below) or 2 (above)
+    general_values : config_classes.GeneralValues
+    """
+    floor_shielding = get_floor_shielding(floor, general_values)
+    if 'floor_shielding' not in dose_dict:
+        dose_dict['floor_shielding'] = {}
+    changed = dose_dict['floor_shielding'].get(floor, None) != floor_shielding
+    dose_dict['floor_shielding'][floor] = floor_shielding
+    for modality in ['NM', 'CT', 'OT']:
+        dd = dose_dict[f'dose_{modality}']
+        if dd:
+            dist_maps = dd['dist_maps']
+            shape = (
+                dist_maps.shape if floor_shielding[2]
+                else dist_maps.shape[:1] + (1, ) * (dist_maps.ndim - 1))
+            transmission_maps = dd['transmission_maps'][floor]
+            if (transmission_maps is None or changed
+                    or transmission_maps.shape != shape):
+                transmission_maps = np.ones(shape, dtype=dist_maps.dtype)
+                dd['transmission_maps'][floor] = transmission_maps
+                dd['floors_done'][floor] = False
+            for i in np.flatnonzero(dd['valid']):
+                index = dd['stack_index'][i]
+                if not dd['floors_done'][floor, index]:
+                    isotope, kV_source = dd['shield_keys'][i]
+                    transmission_maps[index] = calculate_floor_transmission(
+                        dist_maps[index], dose_dict['shield_data'],
+                        general_values, floor=floor,
+                        isotope=isotope, kV_source=kV_source)
+                    dd['floors_done'][floor, index] = True
+
+
+def calculate_sources(function, sources, result_callback, progress,
+                      progress_value, step, n_workers=1):
+    """Run function for each valid source, in parallel if n_workers > 1.
+
+    Sources are calculated in a thread pool as numpy releases the GIL for array
+    operations. Arrays and caches are shared between the threads without copying.
+    Results, progress and cancel requests are handled in the calling thread.
+
+    Parameters
+    ----------
+    function : callable
+        called with source row, returning (values, msgs)
+    sources : list of list
+        source rows as returned by get_valid_rows (None for invalid rows)
+    result_callback : callable
+        called with (source number, (values, msgs)) as each source is finished
+    progress : CalculationProgress
+    progress_value : int
+        progress value before the first source
+    step : int
+        progress steps pr source
+    n_workers : int, optional
+        number of sources to calculate in parallel. Default is 1.
+
+    Returns
+    -------
+    finished : bool
+        False if canceled.
+    """
+    idxs = [i for i, source in enumerate(sources) if source]
+    canceled = False
+    if n_workers > 1 and len(idxs) > 1:
+        with ThreadPoolExecutor(max_workers=min(n_workers, len(idxs))) as executor:
+            futures = {executor.submit(function, sources[i]): i for i in idxs}
+            for future in as_completed(futures):
+                result_callback(futures[future], future.result())
+                progress_value += step
+                progress.set_value(progress_value)
+                if progress.was_canceled():
+                    canceled = True
+                    for future_not_done in futures:
+                        future_not_done.cancel()
+                    break
+    else:
+        for i in idxs:
+            result_callback(i, function(sources[i]))
+            progress_value += step
+            progress.set_value(progress_value)
+            if progress.was_canceled():
+                canceled = True
+                break
+
+    return not canceled
+
+
+def set_source_result(dose_source, source_number, result, msgs):
+    """Write result from calculate_sources into container from get_source_stack."""
+    values, msgs_source = result
+    msgs.extend(msgs_source)
+    set_source_values(dose_source, source_number, values)
+
+
+def calculate_source_NM(
+        source, isotopes, walls, shield_data,
+        map_shape, calibration_factor, general_values, geometry_cache=None,
+        positions=None):
+    """Calculate parameters for one NM source.
+
+    Only positions (xs, ys) of the map are calculated if positions is given.
+
+    Returns
+    -------
+    values : dict
+        keys as the lists of dose_NM in calculate_dose_NM
+    msgs : list of str
+    """
+    msgs = []
+    dtype = get_dtype(general_values)
+    isotope = isotopes[[x.label for x in isotopes].index(source[3])]
+    dist_map = get_distance_source(
+        map_shape, source[2], calibration_factor, dtype=dtype,
+        positions=positions)
+    dose_factor, doserate_max_factor = get_dose_factors_NM(source, isotope)
+
+    transmission_map = calculate_walls_transmission(
+        map_shape, source[2], walls, shield_data,
+        correct_thickness=general_values.correct_thickness,
+        isotope=isotope, msgs=msgs, geometry_cache=geometry_cache,
+        dtype=dtype, positions=positions)
+    check_floors_shield_data(
+        shield_data, general_values, isotope=isotope, msgs=msgs)
+
+    values = {
+        'dist_maps': dist_map,
+        'dose_factors': dose_factor,
+        'doserate_max_factors': doserate_max_factor,
+        'transmission_maps': [None, transmission_map, None],
+        'shield_keys': (isotope, '')
         }
+    return (values, msgs)
 
-    isotope_labels = [x.label for x in isotopes]
-    progress_modal.setLabelText("Calculating NM dose...")
-
-    for i, source in enumerate(sources):
-        if source:
-            isotope = isotopes[isotope_labels.index(source[3])]
-            dist_map = get_distance_source(
-                map_shape, source[2], calibration_factor)
-            dose_factor, doserate_max_factor = get_dose_factors_NM(
-                source, isotope)
-
-            transmission_map = np.ones(map_shape)
-            if any(walls):
-                for wall in walls:
-                    progress_value += step
-                    progress_modal.setValue(progress_value)
-                    if wall:
-                        wall_affect_map, mask = calculate_wall_affect_sector(
-                            map_shape, source[2], wall[2])
-                        if general_values.correct_thickness is False:
-                            wall_affect_map = np.ones(map_shape) * mask
-
-                        material = wall[3]
-                        transmission_map_this, errmsg = calculate_transmission(
-                            shield_data, wall_affect_map, thickness=wall[4],
-                            material=material, isotope=isotope)
-                        if errmsg:
-                            msgs.append(errmsg)
-                        else:
-                            transmission_map = (
-                                transmission_map * transmission_map_this)
-
-            thickness_corr_0 = 1
-            thickness_corr_2 = 1
-            if general_values.correct_thickness:
-                dist = get_floor_distance(0, general_values)
-                thickness_corr_0 = np.sqrt(dist_map ** 2 + dist ** 2) / dist
-                dist = get_floor_distance(2, general_values)
-                thickness_corr_2 = np.sqrt(dist_map ** 2 + dist ** 2) / dist
-            transmission_floor_0, errmsg = calculate_transmission(
-                shield_data, wall_affect_map=thickness_corr_0,
-                thickness=general_values.shield_mm_below,
-                material=general_values.shield_material_below,
-                isotope=isotope)
-            if errmsg:
-                msgs.append(errmsg)
-            transmission_floor_2, errmsg = calculate_transmission(
-                shield_data, wall_affect_map=thickness_corr_2,
-                thickness=general_values.shield_mm_above,
-                material=general_values.shield_material_above,
-                isotope=isotope)
-            if errmsg:
-                msgs.append(errmsg)
 
-            transmission_maps = [
-                transmission_floor_0, transmission_map, transmission_floor_2]
+def calculate_dose_NM(
+        sources, isotopes, walls, shield_data,
+        map_shape, calibration_factor, general_values,
+        progress, progress_value, step, msgs, geometry_cache=None,
+        n_workers=1, accumulator=None, positions=None):
+    """Calculate parameters for NM sources.
 
-            dose_NM['dist_maps'].append(dist_map)
-            dose_NM['dose_factors'].append(dose_factor)
-            dose_NM['doserate_max_factors'].append(doserate_max_factor)
-            dose_NM['transmission_maps'].append(transmission_maps)
-        else:
-            dose_NM['dist_maps'].append(None)
-            dose_NM['dose_factors'].append(None)
-            dose_NM['doserate_max_factors'].append(None)
-            dose_NM['transmission_maps'].append(None)
+    Returns None if accumulator is given (dose added to accumulator).
+    """
+    if accumulator is None:
+        # calculated values and arrays stacked pr source
+        dose_NM = get_source_stack(
+            'NM', sources, map_shape, dtype=get_dtype(general_values))
+        result_callback = partial(set_source_result, dose_NM, msgs=msgs)
+    else:
+        dose_NM = None
+        result_callback = partial(accumulator.add_result, 'NM', msgs=msgs)
 
-        if progress_modal.wasCanceled():
-            dose_NM = None
-            break
-    return dose_NM
+    progress.set_text("Calculating NM dose...")
+    finished = calculate_sources(
+        partial(calculate_source_NM, isotopes=isotopes, walls=walls,
+                shield_data=shield_data, map_shape=map_shape,
+                calibration_factor=calibration_factor,
+                general_values=general_values, geometry_cache=geometry_cache,
+                positions=positions),
+        sources, result_callback,
+        progress, progress_value, step * len(walls), n_workers=n_workers)
+    return dose_NM if finished else None
 
 
 def get_adds_smoothed_dosemap(
@@ -595,10 +2652,118 @@ def get_flatten_factors(template, sin_angles):
     return factors
 
 
+def get_CT_doseratemap_floor(template, xs, ys, rotation=0., resolution=0.1,
+                             floor_dist=0.):
+    """Calculate doseratemap for one floor based on config_classes.CT_model.
+
+    Parameters
+    ----------
+    template : config_classes.CT_model
+        doserate values at defined positions
+    xs : np.array
+        pixel distance from source in x direction
+    ys : np.array
+        pixel distance from source in y direction (positive upwards)
+    rotation : float, optional
+        rotation of CT in degrees
+    resolution : float, optional
+        meters/pixel. The default is 0.1.
+    floor_dist : float, optional
+        vertical distance from source to the floor in meters.
+        Default is 0 (same floor as source).
+
+    Returns
+    -------
+    doseratemap : np.array
+    """
+    rot = - rotation * np.pi / 180.
+    ys_rotated = -np.sin(rot)*xs + np.cos(rot)*ys
+    sin_rear = np.sin(template.rear_stop_angle * np.pi / 180.)
+    sin_front = np.sin(template.front_stop_angle * np.pi / 180.)
+
+    if floor_dist == 0:
+        dists_sq = resolution ** 2 * (xs ** 2 + ys ** 2)
+        sin_angles = np.divide(resolution * ys_rotated, np.sqrt(dists_sq),
+                               out=np.zeros_like(dists_sq),
+                               where=dists_sq > 0)
+        inside = dists_sq > 0.6**2
+        doseratemap = np.divide(
+            template.scatter_factor_gantry, dists_sq,
+            out=np.zeros_like(dists_sq),
+            where=inside)
+    else:
+        xs_rotated = np.cos(rot)*xs + np.sin(rot)*ys
+        r_sq = (xs_rotated ** 2 + ys_rotated ** 2)
+        dists_sq = resolution ** 2 * r_sq + floor_dist ** 2
+        sin_angles = resolution * ys_rotated / np.sqrt(dists_sq)
+        inside = True
+        doseratemap = template.scatter_factor_gantry / dists_sq
+    doseratemap = np.divide(
+        template.scatter_factor_front, dists_sq,
+        out=doseratemap,
+        where=(sin_angles < sin_front) & inside)
+    doseratemap = np.divide(
+        template.scatter_factor_rear, dists_sq,
+        out=doseratemap,
+        where=(sin_angles > sin_rear) & inside)
+
+    adds = get_adds_smoothed_dosemap(
+        template, sin_rear, sin_front, dists_sq, sin_angles)
+    doseratemap = adds + doseratemap
+
+    factors = get_flatten_factors(template, sin_angles)
+    factors = factors ** template.flatten_power
+    return factors * doseratemap
+
+
+def get_CT_doseratemap_kernel(template, rotation=0., map_shape=(0, 0),
+                              resolution=0.1, floor_dist=0., kernel_cache=None,
+                              dtype=np.float64):
+    """Get doseratemap of twice the map size centered at the CT.
+
+    Parameters
+    ----------
+    template : config_classes.CT_model
+    rotation : float, optional
+        rotation of CT in degrees
+    map_shape : tuple of ints, optional
+        shape of map to slice from the kernel
+    resolution : float, optional
+        meters/pixel. The default is 0.1.
+    floor_dist : float, optional
+        vertical distance from source to the floor in meters. Default is 0.
+    kernel_cache : array_cache.ArrayCache, optional
+        reuse kernels for same CT model, rotation, resolution and floor.
+        Default is None.
+    dtype : numpy dtype, optional
+        floating point type of the kernel. Default is np.float64.
+
+    Returns
+    -------
+    kernel : np.array
+        doseratemap of shape (2*y-1, 2*x-1) with CT at center (y-1, x-1)
+    """
+    key = ('CT', astuple(template), rotation, tuple(map_shape),
+           resolution, floor_dist, np.dtype(dtype).name)
+    kernel = None
+    if kernel_cache is not None:
+        kernel = kernel_cache.get(key)
+    if kernel is None:
+        ny, nx = map_shape
+        ys, xs = np.ogrid[ny-1:-ny:-1, 1-nx:nx]
+        kernel = get_CT_doseratemap_floor(
+            template, xs, ys, rotation=rotation, resolution=resolution,
+            floor_dist=floor_dist).astype(dtype, copy=False)
+        if kernel_cache is not None:
+            kernel_cache.put(key, kernel)
+    return kernel
+
+
 def generate_CT_doseratemap(template,
                             rotation=0., map_shape=(0, 0), source_xy=(0, 0),
                             resolution=0.1, all_floors=True, general_values=None,
-                            factor=1.0):
+                            factor=1.0, kernel_cache=None, dtype=np.float64,
+                            positions=None):
     """Generate array with doserates based on values from config_classes.CT_model.
 
     Parameters
@@ -619,80 +2784,68 @@ def generate_CT_doseratemap(template,
         Used for heights if all_floors is True. Default is None.
     factor : float, optional
         Multiply all doseratemaps with this factor. Default is 1.0.
+    kernel_cache : array_cache.ArrayCache, optional
+        If given, doseratemaps are sliced from cached kernels centered at the CT
+        (see get_CT_doseratemap_kernel). Default is None.
+    dtype : numpy dtype, optional
+        floating point type of the doseratemaps. Default is np.float64.
+    positions : tuple of np.array, optional
+        (xs, ys) pixel coordinates, broadcastable (e.g. from np.ogrid), to
+        calculate only these positions of the map.
+        Without kernel_cache. Default is None.
 
     Returns
     -------
     doseratemap : np.array or list of np.array if all_floors True
     """
     # y along CT table at iso
-    doseratemap = np.zeros(map_shape)
     ny, nx = map_shape
     cx, cy = source_xy
-    xs, ys = np.meshgrid(np.arange(nx) - cx, np.arange(ny) - cy)
-    ys = -ys
-    dists_sq = resolution ** 2 * (xs ** 2 + ys ** 2)
-    rot = - rotation * np.pi / 180.
-    ys_rotated = -np.sin(rot)*xs + np.cos(rot)*ys
-    xs_rotated = np.cos(rot)*xs + np.sin(rot)*ys
-    sin_angles = np.divide(resolution * ys_rotated, np.sqrt(dists_sq),
-                           out=np.zeros_like(dists_sq),
-                           where=dists_sq > 0)
-
+    if positions is None:
+        doseratemap = np.zeros(map_shape, dtype=dtype)
+    else:
+        doseratemap = np.zeros(np.broadcast(*positions).shape, dtype=dtype)
     if template.scatter_factor_front > 0:
-        sin_rear = np.sin(template.rear_stop_angle * np.pi / 180.)
-        sin_front = np.sin(template.front_stop_angle * np.pi / 180.)
-        doseratemap = np.divide(
-            template.scatter_factor_gantry, dists_sq,
-            out=np.zeros_like(dists_sq),
-            where=dists_sq > 0.6**2)
-        doseratemap = np.divide(
-            template.scatter_factor_front, dists_sq,
-            out=doseratemap,
-            where=(sin_angles < sin_front) & (dists_sq > 0.6**2))
-        doseratemap = np.divide(
-            template.scatter_factor_rear, dists_sq,
-            out=doseratemap,
-            where=(sin_angles > sin_rear) & (dists_sq > 0.6**2))
-
-        adds = get_adds_smoothed_dosemap(
-            template, sin_rear, sin_front, dists_sq, sin_angles)
-        doseratemap = adds + doseratemap
-
-        factors = get_flatten_factors(template, sin_angles)
-        factors = factors ** template.flatten_power
-        doseratemap = factor * factors * doseratemap
-
+        floor_dists = [0.]
         if all_floors and general_values is not None:
-            doseratemap = [doseratemap]
-            for floor in [0, 2]:
-                floor_dist = get_floor_distance(floor, general_values)
-                r_sq = (xs_rotated ** 2 + ys_rotated ** 2)
-                dists_sq = resolution ** 2 * r_sq + floor_dist ** 2
-                sin_angles = resolution * ys_rotated / np.sqrt(dists_sq)
-                doseratemap_this = template.scatter_factor_gantry / dists_sq
-                doseratemap_this = np.divide(
-                    template.scatter_factor_front, dists_sq,
-                    out=doseratemap_this,
-                    where=(sin_angles < sin_front))
-                doseratemap_this = np.divide(
-                    template.scatter_factor_rear, dists_sq,
-                    out=doseratemap_this,
-                    where=(sin_angles > sin_rear))
-
-                adds = get_adds_smoothed_dosemap(
-                    template, sin_rear, sin_front, dists_sq, sin_angles)
-                doseratemap_this = adds + doseratemap_this
-
-                factors = get_flatten_factors(template, sin_angles)
-                factors = factors ** template.flatten_power
-                doseratemap_this = factor * factors * doseratemap_this
-                doseratemap.insert(floor, doseratemap_this)
+            floor_dists = [get_floor_distance(floor, general_values)
+                           for floor in [0, 1, 2]]
+
+        doseratemap = []
+        if (kernel_cache is not None and positions is None
+                and 0 <= cx < nx and 0 <= cy < ny
+                and cx == int(cx) and cy == int(cy)):
+            cx, cy = int(cx), int(cy)
+            for floor_dist in floor_dists:
+                kernel = get_CT_doseratemap_kernel(
+                    template, rotation=rotation, map_shape=map_shape,
+                    resolution=resolution, floor_dist=floor_dist,
+                    kernel_cache=kernel_cache, dtype=dtype)
+                doseratemap.append(
+                    factor * kernel[ny-1-cy:2*ny-1-cy, nx-1-cx:2*nx-1-cx])
+        else:
+            if positions is None:
+                xs, ys = np.meshgrid(np.arange(nx) - cx, np.arange(ny) - cy)
+            else:
+                xs, ys = np.broadcast_arrays(
+                    positions[0] - cx, positions[1] - cy)
+            ys = -ys
+            for floor_dist in floor_dists:
+                doseratemap_floor = get_CT_doseratemap_floor(
+                    template, xs, ys, rotation=rotation, resolution=resolution,
+                    floor_dist=floor_dist)
+                doseratemap.append(
+                    factor * doseratemap_floor.astype(dtype, copy=False))
+
+        if len(doseratemap) == 1:
+            doseratemap = doseratemap[0]
 
     return doseratemap
 
 
 def get_dose_factors_CT(source_row, ct_model, map_shape, general_values,
-                        calibration_factor):
+                        calibration_factor, kernel_cache=None,
+                        positions=None):
     """Calculate dose distribution from source (unshielded, pr workday).
 
     Parameters
@@ -707,6 +2860,11 @@ def get_dose_factors_CT(source_row, ct_model, map_shape, general_values,
         to get floor heights
     calibration_factor : float
         meters/pixel
+    kernel_cache : array_cache.ArrayCache, optional
+        reuse CT doseratemap kernels. Default is None.
+    positions : tuple of np.array, optional
+        (xs, ys) pixel coordinates, broadcastable (e.g. from np.ogrid), to
+        calculate only these positions of the map. Default is None.
 
     Returns
     -------
@@ -720,105 +2878,115 @@ def get_dose_factors_CT(source_row, ct_model, map_shape, general_values,
     dose_factors = generate_CT_doseratemap(
         ct_model, rotation=rotation, map_shape=map_shape, source_xy=pos,
         resolution=calibration_factor, general_values=general_values,
-        factor=general_factor)
+        factor=general_factor, kernel_cache=kernel_cache,
+        dtype=get_dtype(general_values), positions=positions)
+    if not isinstance(dose_factors, list):  # zero doseratemap
+        dose_factors = [dose_factors] * 3
 
     return dose_factors
 
 
-def calculate_dose_kV(
-        sources, ct_models, walls, shield_data,
-        map_shape, calibration_factor, general_values,
-        progress_modal, progress_value, step, msgs):
-    """Calculate parameters for kV sources, isotropic (OT) or non-isotropic (CT)."""
-    dose_dict = {  # calculated values and arrays listed pr source
-        'dist_maps': [],  # not used for CT
-        'dose_factors': [],
-        # list of float (OT) or lists of dose pr day pr floor (CT) pr source
-        'transmission_maps': [],  # list of transmission_map list of 3 floors pr source
-        }
-    mod = 'kV' if ct_models is None else 'CT'
+def calculate_source_kV(
+        source, ct_models, walls, shield_data,
+        map_shape, calibration_factor, general_values, geometry_cache=None,
+        kernel_cache=None, source_number=0, positions=None):
+    """Calculate parameters for one kV source, isotropic (OT) or CT.
 
-    progress_modal.setLabelText(f'Calculating dose for {mod} sources...')
+    Only positions (xs, ys) of the map are calculated if positions is given.
 
-    for i, source in enumerate(sources):
-        if source:
-            dist_map = get_distance_source(
-                map_shape, source[2], calibration_factor)
-            if mod == 'CT':
-                ct_models_label = source[5]
-                try:
-                    idx = [c.label for c in ct_models].index(ct_models_label)
-                    dose_factor = get_dose_factors_CT(
-                        source, ct_models[idx], map_shape, general_values,
-                        calibration_factor)
-                except ValueError:
-                    name = str(i) if source[1] == '' else source[1]
-                    msgs.append(f'Failed finding CT doseratemap ({source[5]}) '
-                                f'for CT source ({name})')
-                    dose_factor = None
-                kV_source = source[4]
-            else:
-                dose_factor = source[4] * source[5]
-                kV_source = source[3]
+    Returns
+    -------
+    values : dict
+        keys as the lists of dose_dict in calculate_dose_kV
+    msgs : list of str
+    """
+    msgs = []
+    dtype = get_dtype(general_values)
+    dist_map = get_distance_source(
+        map_shape, source[2], calibration_factor, dtype=dtype,
+        positions=positions)
+    if ct_models is not None:
+        ct_models_label = source[5]
+        try:
+            idx = [c.label for c in ct_models].index(ct_models_label)
+            dose_factor = get_dose_factors_CT(
+                source, ct_models[idx], map_shape, general_values,
+                calibration_factor, kernel_cache=kernel_cache,
+                positions=positions)
+        except ValueError:
+            name = str(source_number) if source[1] == '' else source[1]
+            msgs.append(f'Failed finding CT doseratemap ({source[5]}) '
+                        f'for CT source ({name})')
+            dose_factor = None
+        kV_source = source[4]
+    else:
+        dose_factor = source[4] * source[5]
+        kV_source = source[3]
 
-            if dose_factor is None:  # doseratemap CT not found
-                transmission_maps = None
-            else:
-                transmission_map = np.ones(map_shape)
-                if any(walls):
-                    for wall in walls:
-                        progress_value += step
-                        progress_modal.setValue(progress_value)
-                        if wall:
-                            wall_affect_map, mask = calculate_wall_affect_sector(
-                                map_shape, source[2], wall[2])
-                            if general_values.correct_thickness is False:
-                                wall_affect_map = np.ones(map_shape) * mask
-
-                            material = wall[3]
-                            transmission_map_this, errmsg = calculate_transmission(
-                                shield_data, wall_affect_map, thickness=wall[4],
-                                material=material, kV_source=kV_source)
-                            if errmsg:
-                                msgs.append(errmsg)
-                            else:
-                                transmission_map = (
-                                    transmission_map * transmission_map_this)
-
-                thickness_corr_0 = 1
-                thickness_corr_2 = 1
-                if general_values.correct_thickness:
-                    dist = get_floor_distance(0, general_values)
-                    thickness_corr_0 = np.sqrt(dist_map ** 2 + dist ** 2) / dist
-                    dist = get_floor_distance(2, general_values)
-                    thickness_corr_2 = np.sqrt(dist_map ** 2 + dist ** 2) / dist
-                transmission_floor_0, errmsg = calculate_transmission(
-                    shield_data, wall_affect_map=thickness_corr_0,
-                    thickness=general_values.shield_mm_below,
-                    material=general_values.shield_material_below,
-                    kV_source=kV_source)
-                if errmsg:
-                    msgs.append(errmsg)
-                transmission_floor_2, errmsg = calculate_transmission(
-                    shield_data, wall_affect_map=thickness_corr_2,
-                    thickness=general_values.shield_mm_above,
-                    material=general_values.shield_material_above,
-                    kV_source=kV_source)
-                if errmsg:
-                    msgs.append(errmsg)
+    if dose_factor is None:  # doseratemap CT not found
+        transmission_maps = None
+    else:
+        transmission_map = calculate_walls_transmission(
+            map_shape, source[2], walls, shield_data,
+            correct_thickness=general_values.correct_thickness,
+            kV_source=kV_source, msgs=msgs,
+            geometry_cache=geometry_cache, dtype=dtype, positions=positions)
+        check_floors_shield_data(
+            shield_data, general_values, kV_source=kV_source, msgs=msgs)
+        transmission_maps = [None, transmission_map, None]
+
+    values = {
+        'dist_maps': dist_map,
+        'dose_factors': dose_factor,
+        'transmission_maps': transmission_maps,
+        'shield_keys': ('', kV_source)
+        }
+    return (values, msgs)
 
-                transmission_maps = [
-                    transmission_floor_0, transmission_map, transmission_floor_2]
 
-            dose_dict['dist_maps'].append(dist_map)
-            dose_dict['dose_factors'].append(dose_factor)
-            dose_dict['transmission_maps'].append(transmission_maps)
-        else:
-            dose_dict['dist_maps'].append(None)
-            dose_dict['dose_factors'].append(None)
-            dose_dict['transmission_maps'].append(None)
+def calculate_dose_kV(
+        sources, ct_models, walls, shield_data,
+        map_shape, calibration_factor, general_values,
+        progress, progress_value, step, msgs, geometry_cache=None,
+        kernel_cache=None, n_workers=1, accumulator=None, positions=None):
+    """Calculate parameters for kV sources, isotropic (OT) or non-isotropic (CT).
 
-        if progress_modal.wasCanceled():
-            dose_dict = None
-            break
-    return dose_dict
+    Returns None if accumulator is given (dose added to accumulator).
+    """
+    mod = 'kV' if ct_models is None else 'CT'
+    modality = 'OT' if ct_models is None else 'CT'
+    if accumulator is None:
+        # calculated values and arrays stacked pr source
+        dose_dict = get_source_stack(
+            modality, sources, map_shape, dtype=get_dtype(general_values))
+        result_callback = partial(set_source_result, dose_dict, msgs=msgs)
+    else:
+        dose_dict = None
+        result_callback = partial(accumulator.add_result, modality, msgs=msgs)
+
+    progress.set_text(f'Calculating dose for {mod} sources...')
+
+    # kernels of twice the map size only pay off if used for more than one
+    # source (same CT model and rotation), else doseratemap calculated directly
+    kernel_keys = Counter()
+    if ct_models is not None:
+        kernel_keys.update([(source[5], source[3]) for source in sources if source])
+
+    def calculate_source(numbered_source):
+        source_number, source = numbered_source
+        reuse_kernel = ct_models is not None and (
+            kernel_keys[(source[5], source[3])] > 1)
+        return calculate_source_kV(
+            source, ct_models, walls, shield_data,
+            map_shape, calibration_factor, general_values,
+            geometry_cache=geometry_cache,
+            kernel_cache=kernel_cache if reuse_kernel else None,
+            source_number=source_number, positions=positions)
+
+    # source number passed with the row (identical rows are separate sources)
+    numbered_sources = [(i, source) if source else None
+                        for i, source in enumerate(sources)]
+    finished = calculate_sources(
+        calculate_source, numbered_sources, result_callback, progress,
+        progress_value, step * len(walls), n_workers=n_workers)
+    return dose_dict if finished else None
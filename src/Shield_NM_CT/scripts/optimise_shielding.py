@@ -0,0 +1,686 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Optimise wall thicknesses for dose limits at given points and sweep thickness.
+
+@author: Ellen Wasbo
+"""
+from dataclasses import dataclass, field
+import itertools
+import time
+
+import numpy as np
+
+# Shield_NM_CT block start
+from Shield_NM_CT.scripts.calculate_dose import (
+    CalculationProgress,
+    calculate_source_NM, calculate_source_kV, calculate_transmission,
+    get_dose_input, get_points_positions, get_shield_lookup,
+    get_source_shield_keys, get_valid_rows, get_walls_affect)
+# Shield_NM_CT block end
+
+# max number of material combinations to try, all combinations are tested
+MAX_MATERIAL_COMBINATIONS = 256
+# distance (m) between points covering areas with dose limit
+AREA_POINTS_SPACING = 0.1
+
+
+@dataclass
+class ShieldingSolution:
+    """Result from optimise_walls."""
+
+    thicknesses: list = field(default_factory=list)  # mm pr optimised wall
+    materials: list = field(default_factory=list)  # material pr optimised wall
+    feasible: bool = False  # True if all dose limits are met
+    doses: np.ndarray = None  # dose (mSv) pr point with this solution
+    cost: float = 0.0  # sum of material cost * thickness
+    iterations: int = 0  # number of thickness steps tested
+    runtime: float = 0.0  # seconds
+    msgs: list = field(default_factory=list)
+
+
+def get_area_points(area, spacing=10):
+    """Get pixel positions covering an area on a regular grid.
+
+    Parameters
+    ----------
+    area : tuple of ints
+        x0, y0, width, height as mini_methods.get_area_from_text
+    spacing : int, optional
+        pixels between points. Default is 10.
+
+    Returns
+    -------
+    xs : np.array
+    ys : np.array
+    """
+    x0, y0, width, height = area
+    xs = np.unique(np.append(np.arange(x0, x0 + width, spacing), x0 + width - 1))
+    ys = np.unique(np.append(np.arange(y0, y0 + height, spacing), y0 + height - 1))
+    xs, ys = np.meshgrid(xs, ys)
+    return xs.flatten(), ys.flatten()
+
+
+def get_areas_positions(areas, area_limits, map_shape, spacing=10):
+    """Get positions covering the active areas with a dose limit.
+
+    Parameters
+    ----------
+    areas : list of list
+        areas as returned by calculate_dose.get_valid_rows
+    area_limits : list of float or None
+        dose limit (mSv) pr row of areas. None for no limit.
+    map_shape : tuple of ints
+        shape of floor plan (y, x)
+    spacing : int, optional
+        pixels between points. Default is 10.
+
+    Returns
+    -------
+    rows : list of int
+        row number in areas of each position
+    xs : np.array
+        x pixel positions
+    ys : np.array
+        y pixel positions
+    """
+    rows = []
+    xs = [np.zeros(0, dtype=int)]
+    ys = [np.zeros(0, dtype=int)]
+    for i, (area, dose_limit) in enumerate(zip(areas, area_limits)):
+        if area and dose_limit is not None:
+            x0, x1 = sorted(area[2][0::2])
+            y0, y1 = sorted(area[2][1::2])
+            if x1 > x0 and y1 > y0:
+                xs_area, ys_area = get_area_points(
+                    (x0, y0, x1 - x0, y1 - y0), spacing=spacing)
+                inside = ((xs_area >= 0) & (xs_area < map_shape[1])
+                          & (ys_area >= 0) & (ys_area < map_shape[0]))
+                rows.extend([i] * int(np.count_nonzero(inside)))
+                xs.append(xs_area[inside])
+                ys.append(ys_area[inside])
+    return (rows, np.concatenate(xs), np.concatenate(ys))
+
+
+class WallOptimiser():
+    """Dose at points as function of thickness of some walls.
+
+    Dose pr source through the other walls and the path through the
+    optimised walls are calculated once. Transmission pr wall, material and
+    thickness is cached.
+
+    Parameters
+    ----------
+    sources, walls, isotopes, ct_models, shield_data, general_values,
+    map_shape, calibration_factor :
+        as calculate_dose.calculate_dose_sources
+    wall_numbers : list of int
+        index in walls of the walls to optimise
+    xs : np.array
+        x pixel positions of points
+    ys : np.array
+        y pixel positions of points
+    occupancy : float or np.array, optional
+        occupancy factor pr point. Default is 1.
+    working_days : int, optional
+        Default is general_values.working_days.
+    """
+
+    def __init__(self, sources, walls, wall_numbers, xs, ys,
+                 isotopes=None, ct_models=None, shield_data=None,
+                 general_values=None, map_shape=(0, 0), calibration_factor=None,
+                 occupancy=1., working_days=None):
+        self.msgs = []
+        if not isinstance(shield_data, dict):
+            shield_data = get_shield_lookup(shield_data)
+        self.shield_data = shield_data
+        positions = (np.asarray(xs), np.asarray(ys))
+        if working_days is None:
+            working_days = general_values.working_days
+        walls_other = [None if i in wall_numbers else wall
+                       for i, wall in enumerate(walls)]
+        walls_pos = [walls[i][2] for i in wall_numbers]
+
+        doses = []  # mSv pr source pr point without optimised walls
+        walls_affect = []  # pr source, pr wall, pr point
+        self.shield_keys = []
+        for modality, rows in sources.items():
+            for source in rows:
+                if source:
+                    if modality == 'NM':
+                        values, msgs = calculate_source_NM(
+                            source, isotopes, walls_other, shield_data,
+                            map_shape, calibration_factor, general_values,
+                            positions=positions)
+                    else:
+                        values, msgs = calculate_source_kV(
+                            source, ct_models if modality == 'CT' else None,
+                            walls_other, shield_data,
+                            map_shape, calibration_factor, general_values,
+                            positions=positions)
+                    self.msgs.extend(msgs)
+                    if values['dose_factors'] is None:
+                        continue
+                    transmission = values['transmission_maps'][1]
+                    if modality == 'CT':
+                        dose = values['dose_factors'][1] * transmission
+                    else:
+                        dose = (values['dose_factors'] * transmission
+                                / values['dist_maps'] ** 2)
+                    doses.append(0.001 * working_days * occupancy * dose)
+                    wall_affect = get_walls_affect(
+                        *positions, source[2], walls_pos,
+                        correct_thickness=general_values.correct_thickness)
+                    if general_values.correct_thickness is False:
+                        wall_affect = (wall_affect > 0).astype(float)
+                    walls_affect.append(wall_affect)
+                    self.shield_keys.append(get_source_shield_keys(
+                        modality, source, isotopes))
+        n_points = positions[0].size
+        self.doses = np.array(doses, dtype=float).reshape(-1, n_points)
+        self.walls_affect = np.array(walls_affect, dtype=float).reshape(
+            -1, len(wall_numbers), n_points)
+        # sources with same shield data calculated together
+        self.groups = {}
+        for i, (isotope, kV_source) in enumerate(self.shield_keys):
+            key = (isotope.label if isotope else '', kV_source)
+            if key not in self.groups:
+                self.groups[key] = (isotope, kV_source, [])
+            self.groups[key][2].append(i)
+        self.transmissions = {}
+        self.n_evaluations = 0
+
+    def get_transmission(self, wall_number, material, thickness):
+        """Get transmission pr source pr point for one optimised wall."""
+        key = (wall_number, material, thickness)
+        if key not in self.transmissions:
+            transmission = np.ones(self.doses.shape)
+            if thickness > 0:
+                for isotope, kV_source, idxs in self.groups.values():
+                    transmission_this, errmsg = calculate_transmission(
+                        self.shield_data, self.walls_affect[idxs, wall_number],
+                        thickness=thickness, material=material,
+                        isotope=isotope, kV_source=kV_source)
+                    if errmsg:
+                        if errmsg not in self.msgs:
+                            self.msgs.append(errmsg)
+                    elif transmission_this is not None:
+                        transmission[idxs] = transmission_this
+            self.transmissions[key] = transmission
+        return self.transmissions[key]
+
+    def get_transmission_sweep(self, wall_number, material, thicknesses):
+        """Get transmission pr thickness pr source pr point for one wall."""
+        thicknesses = np.asarray(thicknesses, dtype=float)
+        transmission = np.ones((thicknesses.size, ) + self.doses.shape)
+        for isotope, kV_source, idxs in self.groups.values():
+            transmission_this, errmsg = calculate_transmission(
+                self.shield_data, self.walls_affect[idxs, wall_number],
+                thickness=thicknesses[:, np.newaxis, np.newaxis],
+                material=material, isotope=isotope, kV_source=kV_source)
+            if errmsg:
+                if errmsg not in self.msgs:
+                    self.msgs.append(errmsg)
+            elif transmission_this is not None:
+                transmission[:, idxs] = transmission_this
+        return transmission
+
+    def get_doses_sweep(self, materials, thicknesses, wall_number,
+                        sweep_thicknesses):
+        """Get dose (mSv) pr thickness of one wall pr point, others as given."""
+        doses = self.doses
+        for wall_number_this, (material, thickness) in enumerate(
+                zip(materials, thicknesses)):
+            if wall_number_this != wall_number:
+                doses = doses * self.get_transmission(
+                    wall_number_this, material, thickness)
+        doses = doses * self.get_transmission_sweep(
+            wall_number, materials[wall_number], sweep_thicknesses)
+        return doses.sum(axis=1)
+
+    def get_doses(self, materials, thicknesses):
+        """Get dose (mSv) pr point with the optimised walls as given."""
+        self.n_evaluations += 1
+        doses = self.doses
+        for wall_number, (material, thickness) in enumerate(
+                zip(materials, thicknesses)):
+            doses = doses * self.get_transmission(
+                wall_number, material, thickness)
+        return doses.sum(axis=0)
+
+
+def get_violation(doses, dose_limits):
+    """Sum of relative excess dose over the limits."""
+    return float(np.maximum(doses / dose_limits - 1, 0).sum())
+
+
+def optimise_thicknesses(optimiser, materials, dose_limits, costs, step,
+                         max_thickness, max_iterations, progress=None):
+    """Find minimal thicknesses for given materials by greedy search.
+
+    The wall giving the largest reduction in excess dose pr cost is thickened
+    one step at a time until all limits are met. Walls are then thinned
+    as long as the limits are still met.
+
+    Returns
+    -------
+    thicknesses : list of float
+    feasible : bool
+    iterations : int
+    """
+    n_walls = len(materials)
+    thicknesses = [0.] * n_walls
+    violation = get_violation(
+        optimiser.get_doses(materials, thicknesses), dose_limits)
+    iterations = 0
+    while violation > 0 and iterations < max_iterations:
+        if progress is not None and progress.was_canceled():
+            break
+        best = None
+        for i in range(n_walls):
+            if thicknesses[i] + step <= max_thickness:
+                thicknesses_this = list(thicknesses)
+                thicknesses_this[i] += step
+                violation_this = get_violation(
+                    optimiser.get_doses(materials, thicknesses_this),
+                    dose_limits)
+                gain = (violation - violation_this) / costs[i]
+                if gain > 0 and (best is None or gain > best[0]):
+                    best = (gain, i, violation_this)
+                iterations += 1
+        if best is None:
+            break
+        thicknesses[best[1]] += step
+        violation = best[2]
+    feasible = violation == 0
+
+    if feasible:
+        for i in sorted(range(n_walls), key=lambda i: -costs[i] * thicknesses[i]):
+            while thicknesses[i] >= step:
+                thicknesses_this = list(thicknesses)
+                thicknesses_this[i] -= step
+                iterations += 1
+                if get_violation(optimiser.get_doses(
+                        materials, thicknesses_this), dose_limits) > 0:
+                    break
+                thicknesses = thicknesses_this
+
+    return thicknesses, feasible, iterations
+
+
+def get_material_combinations(materials, n_walls):
+    """Get all combinations of materials for the optimised walls.
+
+    Returns
+    -------
+    combinations : list of tuple or None
+        None if more than MAX_MATERIAL_COMBINATIONS.
+    msgs : list of str
+    """
+    combinations = None
+    msgs = []
+    n_combinations = len(materials) ** n_walls
+    if n_combinations > MAX_MATERIAL_COMBINATIONS:
+        msgs.append(
+            f'{len(materials)} materials for {n_walls} walls give '
+            f'{n_combinations} combinations to test, max is '
+            f'{MAX_MATERIAL_COMBINATIONS}. '
+            'Reduce the number of walls or materials.')
+    else:
+        combinations = list(itertools.product(materials, repeat=n_walls))
+    return (combinations, msgs)
+
+
+def optimise_walls(
+        sources, walls, wall_numbers, xs, ys, dose_limits,
+        isotopes=None, ct_models=None, shield_data=None, general_values=None,
+        map_shape=(0, 0), calibration_factor=None, occupancy=1.,
+        working_days=None, materials=None, material_costs=None,
+        thickness_step=1., max_thickness=400., max_iterations=100000,
+        progress_callback=None, cancel_callback=None):
+    """Find minimal shielding of some walls giving dose within limits at points.
+
+    Minimal shielding is the lowest sum of cost pr mm times thickness. All
+    combinations of materials are tested.
+
+    Parameters
+    ----------
+    sources, walls, isotopes, ct_models, shield_data, general_values,
+    map_shape, calibration_factor :
+        as calculate_dose.calculate_dose_sources
+    wall_numbers : list of int
+        index in walls of the walls to optimise. Thickness of these walls is
+        ignored, the material is kept if materials is None.
+    xs : np.array
+        x pixel positions of points
+    ys : np.array
+        y pixel positions of points
+    dose_limits : float or np.array
+        max dose (mSv) for the working days pr point
+    occupancy : float or np.array, optional
+        occupancy factor pr point. Default is 1.
+    working_days : int, optional
+        Default is general_values.working_days.
+    materials : list of str, optional
+        materials to try for the optimised walls. Default is None.
+        Not more than MAX_MATERIAL_COMBINATIONS combinations for the walls.
+    material_costs : dict, optional
+        cost pr mm pr material (e.g. price or weight). Default is None
+        (1 for all materials, i.e. minimal total thickness).
+    thickness_step : float, optional
+        mm. Default is 1.
+    max_thickness : float, optional
+        mm. Default is 400.
+    max_iterations : int, optional
+        max number of thickness steps tested pr material combination.
+        Default is 100000.
+    progress_callback : callable, optional
+        as calculate_dose.CalculationProgress. Default is None.
+    cancel_callback : callable, optional
+        as calculate_dose.CalculationProgress. Default is None.
+
+    Returns
+    -------
+    solution : ShieldingSolution
+        the solution with the lowest cost meeting the limits (if any).
+        No thicknesses if too many material combinations or canceled.
+    """
+    start_time = time.perf_counter()
+    if materials:
+        combinations, msgs = get_material_combinations(
+            materials, len(wall_numbers))
+        if combinations is None:
+            return ShieldingSolution(msgs=msgs)
+    else:
+        combinations = [tuple([walls[i][3] for i in wall_numbers])]
+        msgs = []
+    progress = CalculationProgress(
+        n_steps=len(combinations) + 1, progress_callback=progress_callback,
+        cancel_callback=cancel_callback)
+    progress.set_text('Preparing data...')
+    optimiser = WallOptimiser(
+        sources, walls, wall_numbers, xs, ys, isotopes=isotopes,
+        ct_models=ct_models, shield_data=shield_data,
+        general_values=general_values, map_shape=map_shape,
+        calibration_factor=calibration_factor, occupancy=occupancy,
+        working_days=working_days)
+    dose_limits = np.broadcast_to(
+        np.asarray(dose_limits, dtype=float), np.asarray(xs).shape)
+    if material_costs is None:
+        material_costs = {}
+
+    solution = None
+    iterations = 0
+    progress.set_text('Optimising thicknesses...')
+    for step, materials_this in enumerate(combinations):
+        progress.set_value(step + 1)
+        costs = [material_costs.get(material, 1.) for material in materials_this]
+        thicknesses, feasible, iterations_this = optimise_thicknesses(
+            optimiser, materials_this, dose_limits, costs, thickness_step,
+            max_thickness, max_iterations, progress=progress)
+        if progress.was_canceled():
+            msgs.append('Optimisation canceled.')
+            break
+        iterations += iterations_this
+        cost = sum([c * t for c, t in zip(costs, thicknesses)])
+        if (solution is None or (feasible and not solution.feasible)
+                or (feasible == solution.feasible and cost < solution.cost)):
+            solution = ShieldingSolution(
+                thicknesses=thicknesses, materials=list(materials_this),
+                feasible=feasible, cost=cost,
+                doses=optimiser.get_doses(materials_this, thicknesses))
+
+    if solution is None:  # canceled
+        solution = ShieldingSolution()
+    solution.iterations = iterations
+    solution.msgs = msgs + optimiser.msgs
+    solution.runtime = time.perf_counter() - start_time
+    return solution
+
+
+def calculate_thickness_sweep(
+        sources, walls, wall_numbers, xs, ys, sweep_thicknesses,
+        isotopes=None, ct_models=None, shield_data=None, general_values=None,
+        map_shape=(0, 0), calibration_factor=None, occupancy=1.,
+        working_days=None):
+    """Calculate dose at points as function of wall thickness.
+
+    Each wall is swept separately with the other walls as given in walls.
+    All thicknesses of a wall are calculated in one batch.
+
+    Parameters
+    ----------
+    sources, walls, wall_numbers, xs, ys, isotopes, ct_models, shield_data,
+    general_values, map_shape, calibration_factor, occupancy, working_days :
+        as optimise_walls
+    sweep_thicknesses : np.array
+        thicknesses (mm) to calculate dose for
+
+    Returns
+    -------
+    doses : np.array
+        dose (mSv) of shape (n_walls, n_thicknesses, n_points)
+    msgs : list of str
+        Info and warning messages.
+    """
+    optimiser = WallOptimiser(
+        sources, walls, wall_numbers, xs, ys, isotopes=isotopes,
+        ct_models=ct_models, shield_data=shield_data,
+        general_values=general_values, map_shape=map_shape,
+        calibration_factor=calibration_factor, occupancy=occupancy,
+        working_days=working_days)
+    materials = [walls[i][3] for i in wall_numbers]
+    thicknesses = [walls[i][4] for i in wall_numbers]
+    doses = np.array([
+        optimiser.get_doses_sweep(
+            materials, thicknesses, wall_number, sweep_thicknesses)
+        for wall_number in range(len(wall_numbers))])
+    return (doses, optimiser.msgs)
+
+
+def get_sweep_table(sweep_thicknesses, doses, wall_names, point_names):
+    """Get results from calculate_thickness_sweep as table.
+
+    Parameters
+    ----------
+    sweep_thicknesses : np.array
+    doses : np.array
+        as returned by calculate_thickness_sweep
+    wall_names : list of str
+    point_names : list of str
+
+    Returns
+    -------
+    table : list of list
+        header row and one row pr wall pr thickness
+    """
+    table = [['Wall', 'Thickness (mm)'] + [
+        f'{name} (mSv)' for name in point_names]]
+    for wall_name, doses_wall in zip(wall_names, doses):
+        for thickness, doses_thickness in zip(sweep_thicknesses, doses_wall):
+            table.append(
+                [wall_name, float(thickness)] + doses_thickness.tolist())
+    return table
+
+
+def get_walls_points_input(main, wall_numbers, area_limits=None):
+    """Collect input for optimise_walls from main for the calculation points.
+
+    Occupancy factors and number of working days as for the calculation points.
+
+    Parameters
+    ----------
+    main : ui_main.MainWindow
+    wall_numbers : list of int
+        row number in walls table of the walls to optimise
+    area_limits : list of float or None, optional
+        dose limit pr row of the areas table (None for no limit) to use
+        points covering these areas (see get_areas_positions) instead of the
+        calculation points. Default is None.
+
+    Returns
+    -------
+    walls_input : dict or None
+        keyword arguments to optimise_walls or calculate_thickness_sweep.
+        None if not possible.
+    point_rows : list of int
+        row number in points table pr point (areas table if area_limits)
+    msgs : list of str
+        Info and warning messages.
+    """
+    walls_input = None
+    point_rows = []
+    dose_input, _, _, msgs = get_dose_input(main)
+    if dose_input is not None:
+        if area_limits is None:
+            points = main.points_tab.table_list
+            point_rows, xs, ys = get_points_positions(
+                [row if row[0] else [False, '', ''] for row in points],
+                dose_input['map_shape'])
+        else:
+            spacing = max(1, round(
+                AREA_POINTS_SPACING / dose_input['calibration_factor']))
+            areas = get_valid_rows(
+                main.areas_tab.table_list, nonzero_columns=[], n_coordinates=4)
+            point_rows, xs, ys = get_areas_positions(
+                areas, area_limits, dose_input['map_shape'], spacing=spacing)
+        # walls to optimise also if thickness is zero
+        walls = dose_input['walls']
+        walls_all = get_valid_rows(
+            main.walls_tab.table_list, nonzero_columns=[], n_coordinates=4)
+        for i in wall_numbers:
+            walls[i] = walls_all[i]
+        if xs.size == 0:
+            if area_limits is None:
+                msgs.append('Found no active calculation points with position.')
+            else:
+                msgs.append('Found no active areas with dose limit.')
+        elif not all([walls[i] for i in wall_numbers]):
+            msgs.append('Selected walls must be active with valid position.')
+        else:
+            walls_input = {
+                'sources': dose_input['sources'], 'walls': walls,
+                'wall_numbers': wall_numbers, 'xs': xs, 'ys': ys,
+                'isotopes': dose_input['isotopes'],
+                'ct_models': dose_input['ct_models'],
+                'shield_data': dose_input['shield_data'],
+                'general_values': dose_input['general_values'],
+                'map_shape': dose_input['map_shape'],
+                'calibration_factor': dose_input['calibration_factor'],
+                'occupancy': main.occ_map[ys, xs],
+                'working_days': main.general_values.working_days
+                }
+
+    return (walls_input, point_rows, msgs)
+
+
+def get_optimise_walls_input(main, wall_numbers, dose_limit, thickness_step=1.,
+                             materials=None, material_costs=None,
+                             area_limits=None):
+    """Collect input for optimise_walls from main.
+
+    Parameters
+    ----------
+    main : ui_main.MainWindow
+    wall_numbers : list of int
+        row number in walls table of the walls to optimise
+    dose_limit : float
+        max dose (mSv) at the calculation points. Not used if area_limits.
+    thickness_step : float, optional
+        mm. Default is 1.
+    materials : list of str, optional
+        materials to try. Default is None (keep material of walls).
+    material_costs : dict, optional
+        cost pr mm pr material. Default is None (1 for all materials).
+    area_limits : list of float or None, optional
+        max dose (mSv) pr row of the areas table (None for no limit), to
+        optimise for the active areas instead of the calculation points.
+        Default is None.
+
+    Returns
+    -------
+    optimise_input : dict or None
+        keyword arguments to optimise_walls. None if not possible to optimise.
+    msgs : list of str
+        Info and warning messages.
+    """
+    optimise_input = None
+    msgs = []
+    if materials:
+        _, msgs = get_material_combinations(materials, len(wall_numbers))
+    if not msgs:
+        walls_input, rows, msgs = get_walls_points_input(
+            main, wall_numbers, area_limits=area_limits)
+        if walls_input is not None:
+            if area_limits is not None:
+                dose_limit = np.array([area_limits[i] for i in rows])
+            optimise_input = dict(
+                walls_input, dose_limits=dose_limit, materials=materials,
+                material_costs=material_costs, thickness_step=thickness_step)
+    return (optimise_input, msgs)
+
+
+def optimise_walls_points(main, wall_numbers, dose_limit, thickness_step=1.,
+                          materials=None, material_costs=None,
+                          area_limits=None):
+    """Optimise walls of main for a dose limit at the active calculation points.
+
+    Parameters
+    ----------
+    main, wall_numbers, dose_limit, thickness_step, materials, material_costs,
+    area_limits :
+        as get_optimise_walls_input
+
+    Returns
+    -------
+    solution : ShieldingSolution or None
+        None if not possible to optimise
+    msgs : list of str
+        Info and warning messages.
+    """
+    solution = None
+    optimise_input, msgs = get_optimise_walls_input(
+        main, wall_numbers, dose_limit, thickness_step=thickness_step,
+        materials=materials, material_costs=material_costs,
+        area_limits=area_limits)
+    if optimise_input is not None:
+        solution = optimise_walls(**optimise_input)
+        msgs.extend(solution.msgs)
+        if not solution.thicknesses:
+            solution = None
+
+    return (solution, msgs)
+
+
+def sweep_walls_points(main, wall_numbers, sweep_thicknesses):
+    """Calculate dose at active calculation points as function of wall thickness.
+
+    Parameters
+    ----------
+    main : ui_main.MainWindow
+    wall_numbers : list of int
+        row number in walls table of the walls to sweep
+    sweep_thicknesses : np.array
+        thicknesses (mm)
+
+    Returns
+    -------
+    table : list of list or None
+        as get_sweep_table. None if not possible to calculate.
+    msgs : list of str
+        Info and warning messages.
+    """
+    table = None
+    walls_input, point_rows, msgs = get_walls_points_input(main, wall_numbers)
+    if walls_input is not None:
+        doses, msgs_sweep = calculate_thickness_sweep(
+            sweep_thicknesses=sweep_thicknesses, **walls_input)
+        msgs.extend(msgs_sweep)
+        points = main.points_tab.table_list
+        walls = main.walls_tab.table_list
+        table = get_sweep_table(
+            sweep_thicknesses, doses,
+            [walls[i][1] if walls[i][1] else f'Wall {i}' for i in wall_numbers],
+            [points[i][1] if points[i][1] else f'Point {i}' for i in point_rows])
+
+    return (table, msgs)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Dose calculation in a separate thread to keep the GUI responsive.
+
+@author: Ellen Wasbo
+"""
+from PyQt6.QtCore import QThread, pyqtSignal
+
+# Shield_NM_CT block start
+from Shield_NM_CT.scripts.calculate_dose import (
+    calculate_dose_mode, update_walls_transmission)
+from Shield_NM_CT.scripts.optimise_shielding import optimise_walls
+# Shield_NM_CT block end
+
+
+class DoseWorker(QThread):
+    """Run calculate_dose_mode in a separate thread.
+
+    Parameters
+    ----------
+    dose_input : dict
+        keyword arguments to calculate_dose_sources as from get_dose_input
+    source_number : int, optional
+        source number to calculate. Default is None = all.
+    modality : str, optional
+        modality of source_number. Default is None = all.
+    parent : QObject, optional
+    """
+
+    progress = pyqtSignal(int, str)  # percent, text
+    partial_result = pyqtSignal(str, object)  # modality, dose values of modality
+    calculation_finished = pyqtSignal(object, list)  # dose_dict or None, msgs
+
+    def __init__(self, dose_input, source_number=None, modality=None,
+                 parent=None):
+        super().__init__(parent)
+        self.dose_input = dose_input
+        self.source_number = source_number
+        self.modality = modality
+        self.partial_dose_dict = None  # modalities finished, if all sources
+
+    def run(self):
+        """Calculate. Canceled by requestInterruption."""
+        dose_dict, msgs = calculate_dose_mode(
+            self.dose_input,
+            progress_callback=self.progress.emit,
+            cancel_callback=self.isInterruptionRequested,
+            partial_callback=self.partial_result.emit)
+        self.calculation_finished.emit(dose_dict, msgs)
+
+    def superseded_by(self, source_number=None, modality=None):
+        """Return True if a new request makes the result of this worker stale."""
+        return modality is None or self.modality is None or (
+            self.modality == modality and self.source_number == source_number)
+
+
+class WallsWorker(QThread):
+    """Run update_walls_transmission in a separate thread.
+
+    The dose_dict is updated in place source by source. If canceled, the
+    sources already updated are listed in dose_dict['walls_sources'].
+
+    Parameters
+    ----------
+    walls_input : dict
+        keyword arguments to update_walls_transmission as from get_walls_input
+    parent : QObject, optional
+    """
+
+    progress = pyqtSignal(int, str)  # percent, text
+    calculation_finished = pyqtSignal(list)  # msgs
+
+    def __init__(self, walls_input, parent=None):
+        super().__init__(parent)
+        self.walls_input = walls_input
+        self.dose_dict = walls_input['dose_dict']
+        self.source_number = None
+        self.modality = 'walls'
+
+    def run(self):
+        """Update walls. Canceled by requestInterruption."""
+        msgs = update_walls_transmission(
+            **self.walls_input,
+            progress_callback=self.progress.emit,
+            cancel_callback=self.isInterruptionRequested)
+        self.calculation_finished.emit(msgs)
+
+    def superseded_by(self, source_number=None, modality=None):
+        """Return True if a new request makes the result of this worker stale."""
+        return modality is None  # all sources calculated with current walls
+
+
+class OptimiseWorker(QThread):
+    """Run optimise_walls in a separate thread.
+
+    Parameters
+    ----------
+    optimise_input : dict
+        keyword arguments to optimise_walls as from get_optimise_walls_input
+    parent : QObject, optional
+    """
+
+    progress = pyqtSignal(int, str)  # percent, text
+    calculation_finished = pyqtSignal(object)  # ShieldingSolution
+
+    def __init__(self, optimise_input, parent=None):
+        super().__init__(parent)
+        self.optimise_input = optimise_input
+        self.source_number = None
+        self.modality = 'optimise'
+
+    def run(self):
+        """Optimise. Canceled by requestInterruption."""
+        solution = optimise_walls(
+            **self.optimise_input,
+            progress_callback=self.progress.emit,
+            cancel_callback=self.isInterruptionRequested)
+        self.calculation_finished.emit(solution)
+
+    def superseded_by(self, source_number=None, modality=None):
+        """Return True if a new request makes the result of this worker stale."""
+        return False  # independent of dose calculations
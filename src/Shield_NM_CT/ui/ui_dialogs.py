@@ -7,15 +7,20 @@
 
 import os
 
+import numpy as np
+import pandas as pd
 from PyQt6.QtGui import QIcon, QPixmap
 from PyQt6 import QtCore
 from PyQt6.QtCore import Qt
 from PyQt6.QtWidgets import (
     QApplication, QDialog, QVBoxLayout, QHBoxLayout, QFormLayout, QMessageBox,
-    QGroupBox, QButtonGroup, QDialogButtonBox, QSpinBox, QPushButton,
+    QGroupBox, QButtonGroup, QDialogButtonBox, QSpinBox, QDoubleSpinBox,
+    QPushButton,
     QTableWidget, QTableWidgetItem,
     QLabel, QRadioButton, QCheckBox, QFileDialog
     )
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
+from matplotlib.figure import Figure
 
 # Shield_NM_CT block block start
 from Shield_NM_CT.config.Shield_NM_CT_constants import (
@@ -421,3 +426,269 @@ class EditAnnotationsDialog(ShieldDialog):
             self.spin_picker.value(),
             self.spin_snap_radius.value()
             )
+
+
+class OptimiseWallsDialog(ShieldDialog):
+    """Dialog to set walls and dose limit for optimising wall thickness."""
+
+    def __init__(self, wall_names=[], selected_row=-1, materials=[],
+                 area_names=[]):
+        super().__init__()
+
+        self.setWindowTitle('Optimise wall thickness')
+        self.setMinimumWidth(400)
+
+        vlo = QVBoxLayout()
+        self.setLayout(vlo)
+        vlo.addWidget(QLabel(
+            'Find the minimum thickness of the selected walls giving dose '
+            'below the limit at all active calculation points or in the '
+            'active areas.'))
+
+        gb_walls = QGroupBox('Walls to optimise')
+        vlo_walls = QVBoxLayout()
+        gb_walls.setLayout(vlo_walls)
+        self.chk_walls = []
+        for i, wall_name in enumerate(wall_names):
+            chk = QCheckBox(wall_name if wall_name else f'Wall {i}')
+            chk.setChecked(i == selected_row)
+            self.chk_walls.append(chk)
+            vlo_walls.addWidget(chk)
+        vlo.addWidget(gb_walls)
+
+        gb_materials = QGroupBox(
+            'Materials to try (none = keep current) and cost pr mm')
+        vlo_materials = QVBoxLayout()
+        gb_materials.setLayout(vlo_materials)
+        vlo_materials.addWidget(QLabel(
+            'The solution with the lowest sum of cost pr mm x thickness is '
+            'found.<br>Set cost as e.g. price or weight pr mm. Equal costs give '
+            'the minimal total thickness.'))
+        fLO_materials = QFormLayout()
+        vlo_materials.addLayout(fLO_materials)
+        self.chk_materials = []
+        self.material_costs = []
+        for material in materials:
+            chk = QCheckBox(material)
+            self.chk_materials.append(chk)
+            material_cost = QDoubleSpinBox()
+            material_cost.setRange(0.001, 10000.)
+            material_cost.setDecimals(3)
+            material_cost.setValue(1.)
+            self.material_costs.append(material_cost)
+            fLO_materials.addRow(chk, material_cost)
+        vlo.addWidget(gb_materials)
+
+        gb_limits = QGroupBox('Dose limit (mSv)')
+        vlo_limits = QVBoxLayout()
+        gb_limits.setLayout(vlo_limits)
+        self.btns_limit = QButtonGroup()
+        rbtn_points = QRadioButton('at active calculation points')
+        rbtn_areas = QRadioButton('pr active area')
+        self.btns_limit.addButton(rbtn_points, 0)
+        self.btns_limit.addButton(rbtn_areas, 1)
+        rbtn_points.setChecked(True)
+        self.dose_limit = QDoubleSpinBox()
+        self.dose_limit.setRange(0.001, 1000.)
+        self.dose_limit.setDecimals(3)
+        self.dose_limit.setValue(1.)
+        hlo_points = QHBoxLayout()
+        hlo_points.addWidget(rbtn_points)
+        hlo_points.addWidget(self.dose_limit)
+        vlo_limits.addLayout(hlo_points)
+        vlo_limits.addWidget(rbtn_areas)
+        fLO_areas = QFormLayout()
+        vlo_limits.addLayout(fLO_areas)
+        self.area_limits = []  # pr row of areas table, None if not active
+        for i, area_name in enumerate(area_names):
+            area_limit = None
+            if area_name is not None:
+                area_limit = QDoubleSpinBox()
+                area_limit.setRange(0.001, 1000.)
+                area_limit.setDecimals(3)
+                area_limit.setValue(1.)
+                fLO_areas.addRow(
+                    QLabel(area_name if area_name else f'Area {i}'), area_limit)
+            self.area_limits.append(area_limit)
+        if all([area_limit is None for area_limit in self.area_limits]):
+            rbtn_areas.setEnabled(False)
+        vlo.addWidget(gb_limits)
+
+        fLO = QFormLayout()
+        vlo.addLayout(fLO)
+        self.thickness_step = QDoubleSpinBox()
+        self.thickness_step.setRange(0.1, 100.)
+        self.thickness_step.setDecimals(1)
+        self.thickness_step.setValue(1.)
+        fLO.addRow(QLabel('Thickness step (mm)'), self.thickness_step)
+
+        buttons = QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel
+        self.buttonBox = QDialogButtonBox(buttons)
+        self.buttonBox.accepted.connect(self.accept)
+        self.buttonBox.rejected.connect(self.reject)
+        vlo.addWidget(self.buttonBox)
+
+    def get_data(self):
+        """Get settings.
+
+        Returns
+        -------
+        list of int
+            row number of walls to optimise
+        float
+            dose limit (mSv) at calculation points
+        float
+            thickness step (mm)
+        list of str or None
+            materials to try
+        dict or None
+            cost pr mm pr material to try
+        list of float or None
+            dose limit (mSv) pr row of areas table (None if not active).
+            None if dose limit at calculation points.
+        """
+        wall_numbers = [
+            i for i, chk in enumerate(self.chk_walls) if chk.isChecked()]
+        materials = [
+            chk.text() for chk in self.chk_materials if chk.isChecked()]
+        material_costs = {
+            chk.text(): material_cost.value()
+            for chk, material_cost in zip(
+                self.chk_materials, self.material_costs)
+            if chk.isChecked()}
+        area_limits = None
+        if self.btns_limit.checkedId() == 1:
+            area_limits = [
+                None if area_limit is None else area_limit.value()
+                for area_limit in self.area_limits]
+        return (
+            wall_numbers,
+            self.dose_limit.value(),
+            self.thickness_step.value(),
+            materials if materials else None,
+            material_costs if material_costs else None,
+            area_limits
+            )
+
+
+class ThicknessSweepDialog(ShieldDialog):
+    """Dialog to set walls and thickness range for dose vs thickness curves."""
+
+    def __init__(self, wall_names=[], selected_row=-1):
+        super().__init__()
+
+        self.setWindowTitle('Dose vs wall thickness')
+        self.setMinimumWidth(400)
+
+        vlo = QVBoxLayout()
+        self.setLayout(vlo)
+        vlo.addWidget(QLabel(
+            'Calculate dose at the active calculation points as function of '
+            'the thickness of each selected wall (other walls as defined).'))
+
+        gb_walls = QGroupBox('Walls')
+        vlo_walls = QVBoxLayout()
+        gb_walls.setLayout(vlo_walls)
+        self.chk_walls = []
+        for i, wall_name in enumerate(wall_names):
+            chk = QCheckBox(wall_name if wall_name else f'Wall {i}')
+            chk.setChecked(i == selected_row)
+            self.chk_walls.append(chk)
+            vlo_walls.addWidget(chk)
+        vlo.addWidget(gb_walls)
+
+        fLO = QFormLayout()
+        vlo.addLayout(fLO)
+        self.thickness_min = QDoubleSpinBox()
+        self.thickness_max = QDoubleSpinBox()
+        self.thickness_step = QDoubleSpinBox()
+        for spin, value in zip(
+                [self.thickness_min, self.thickness_max, self.thickness_step],
+                [0., 10., 1.]):
+            spin.setRange(0., 400.)
+            spin.setDecimals(1)
+            spin.setValue(value)
+        self.thickness_step.setMinimum(0.1)
+        fLO.addRow(QLabel('Min thickness (mm)'), self.thickness_min)
+        fLO.addRow(QLabel('Max thickness (mm)'), self.thickness_max)
+        fLO.addRow(QLabel('Thickness step (mm)'), self.thickness_step)
+
+        buttons = QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel
+        self.buttonBox = QDialogButtonBox(buttons)
+        self.buttonBox.accepted.connect(self.accept)
+        self.buttonBox.rejected.connect(self.reject)
+        vlo.addWidget(self.buttonBox)
+
+    def get_data(self):
+        """Get settings.
+
+        Returns
+        -------
+        list of int
+            row number of walls
+        np.array
+            thicknesses (mm)
+        """
+        wall_numbers = [
+            i for i, chk in enumerate(self.chk_walls) if chk.isChecked()]
+        step = self.thickness_step.value()
+        thicknesses = np.arange(
+            self.thickness_min.value(), self.thickness_max.value() + 0.5 * step,
+            step)
+        return (wall_numbers, thicknesses)
+
+
+class ThicknessSweepDisplay(ShieldDialog):
+    """QDialog to display dose vs wall thickness as plot with csv export."""
+
+    def __init__(self, table, csv_separator=',', csv_decimal='.'):
+        super().__init__()
+        self.setWindowTitle('Dose vs wall thickness')
+        self.dataframe = pd.DataFrame(table[1:], columns=table[0])
+        self.csv_separator = csv_separator
+        self.csv_decimal = csv_decimal
+        vlo = QVBoxLayout()
+        self.setLayout(vlo)
+
+        fig = Figure(figsize=(7, 5))
+        canvas = FigureCanvasQTAgg(fig)
+        ax = fig.add_subplot(111)
+        point_names = table[0][2:]
+        for wall_name, df_wall in self.dataframe.groupby('Wall', sort=False):
+            for point_name in point_names:
+                ax.plot(df_wall['Thickness (mm)'], df_wall[point_name],
+                        label=f'{wall_name} - {point_name}')
+        ax.set_yscale('log')
+        ax.set_xlabel('Thickness (mm)')
+        ax.set_ylabel('Dose (mSv)')
+        ax.legend(fontsize='small')
+        fig.tight_layout()
+        vlo.addWidget(canvas)
+
+        hlo_buttons = QHBoxLayout()
+        vlo.addLayout(hlo_buttons)
+        btn_export = QPushButton('Export CSV')
+        btn_export.clicked.connect(lambda: self.export_csv())
+        hlo_buttons.addWidget(btn_export)
+        btn_clipboard = QPushButton('Copy table to clipboard')
+        btn_clipboard.clicked.connect(self.copy_clipboard)
+        hlo_buttons.addWidget(btn_clipboard)
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Close)
+        buttons.rejected.connect(self.reject)
+        hlo_buttons.addWidget(buttons)
+
+    def export_csv(self, path=''):
+        """Export table to csv."""
+        if path == '':
+            fname = QFileDialog.getSaveFileName(
+                self, 'Save table', filter="CSV file (*.csv)")
+            path = fname[0]
+        if len(path) > 0:
+            self.dataframe.to_csv(path, sep=self.csv_separator,
+                                  decimal=self.csv_decimal, index=False)
+
+    def copy_clipboard(self):
+        self.dataframe.to_clipboard(index=False, excel=True)
+        QMessageBox.information(self, 'Table in clipboard',
+                    'Values in table are copied to clipboard.',
+                    QMessageBox.StandardButton.Ok)
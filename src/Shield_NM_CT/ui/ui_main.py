@@ -19,7 +19,7 @@ from PyQt6.QtCore import Qt, QTimer, QFile, QIODevice
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QSplitter,
     QGroupBox, QButtonGroup, QScrollArea, QTabWidget,
-    QPushButton, QLabel, QSpinBox,
+    QPushButton, QLabel, QSpinBox, QComboBox,
     QRadioButton, QCheckBox, QSlider, QToolButton,
     QMenu, QMessageBox, QFileDialog
     )
@@ -41,8 +41,18 @@ from Shield_NM_CT.ui import ui_main_tabs
 from Shield_NM_CT.ui import messageboxes
 from Shield_NM_CT.ui import settings
 import Shield_NM_CT.ui.reusable_widgets as uir
-from Shield_NM_CT.ui.ui_dialogs import AboutDialog, EditAnnotationsDialog
-from Shield_NM_CT.scripts.calculate_dose import (calculate_dose, get_floor_distance)
+from Shield_NM_CT.ui.ui_dialogs import (
+    AboutDialog, EditAnnotationsDialog, OptimiseWallsDialog,
+    ThicknessSweepDialog, ThicknessSweepDisplay)
+from Shield_NM_CT.ui.dose_worker import (
+    DoseWorker, OptimiseWorker, WallsWorker)
+from Shield_NM_CT.scripts.calculate_dose import (
+    calculate_dose, calculate_dose_points, get_dose_input, get_grid_factor,
+    get_shield_lookup, get_valid_rows, get_walls_input, reset_dose_sums,
+    set_dose_result, sum_dose_days, walls_changed)
+from Shield_NM_CT.scripts.array_cache import ArrayCache
+from Shield_NM_CT.scripts.optimise_shielding import (
+    get_optimise_walls_input, sweep_walls_points)
 from Shield_NM_CT.scripts import mini_methods
 import Shield_NM_CT.resources
 # Shield_NM_CT block end
@@ -96,6 +106,19 @@ class MainWindow(QMainWindow):
         self.nm_doserate_map = np.zeros(2)
         self.ct_dose_map = np.zeros(2)
         self.ot_dose_map = np.zeros(2)
+        self.wall_geometry_cache = ArrayCache()
+        # wall shadow maps reused when material or thickness changed
+        self.ct_kernel_cache = ArrayCache()
+        # CT doseratemaps reused for sources with same CT model and rotation
+        self.dose_workers = []  # running DoseWorker (calculate_dose_background)
+        # WallsWorker (update_dose_walls) and OptimiseWorker (optimise_walls)
+        self.walls_warnings = None  # non-modal warnings from WallsWorker
+        self.scheduled_dose_sources = []  # [modality, row] edited, not updated
+        self.scheduled_dose_walls = False  # True if walls edited, not updated
+        self.dose_update_timer = QTimer()
+        self.dose_update_timer.setSingleShot(True)
+        self.dose_update_timer.setInterval(300)  # ms to wait for more edits
+        self.dose_update_timer.timeout.connect(self.run_scheduled_dose_update)
 
         self.renamed_isotopes = [[], []]
         self.renamed_materials = [[], []]
@@ -237,6 +260,9 @@ class MainWindow(QMainWindow):
         _, _, self.materials = cff.load_settings(fname='materials')
         _, _, self.ct_models = cff.load_settings(fname='ct_models')
         _, _, self.shield_data = cff.load_settings(fname='shield_data')
+        self.shield_lookup = get_shield_lookup(
+            self.shield_data,
+            table_accuracy=self.general_values.transmission_table_accuracy)
         _, _, self.colormaps = cff.load_settings(fname='colormaps')
         self.create_cmap_objects()
         self.gui.annotations_linethick = self.user_prefs.annotations_linethick
@@ -277,6 +303,13 @@ class MainWindow(QMainWindow):
         self.wCalculate.working_days.setValue(self.general_values.working_days)
         self.wCalculate.chk_correct_thickness_geometry.setChecked(
             self.general_values.correct_thickness)
+        self.wCalculate.chk_float32.setChecked(self.general_values.float32)
+        self.wCalculate.calculation_grid_cm.setValue(
+            self.general_values.calculation_grid_cm)
+        self.wCalculate.set_calculation_mode(self.general_values.calculation_mode)
+        self.shield_lookup = get_shield_lookup(
+            self.shield_data,
+            table_accuracy=self.general_values.transmission_table_accuracy)
 
     def create_cmap_objects(self):
         """Create cmap when register_cmap do not work well."""
@@ -347,6 +380,10 @@ class MainWindow(QMainWindow):
 
     def reset_dose(self):
         """Reset dose calculations."""
+        self.cancel_dose_workers()
+        self.dose_update_timer.stop()
+        self.scheduled_dose_sources = []
+        self.scheduled_dose_walls = False
         self.dose_dict = {}
         self.nm_dose_map = np.zeros(2)
         self.nm_doserate_map = np.zeros(2)
@@ -358,9 +395,37 @@ class MainWindow(QMainWindow):
         #TODO Info that dose is reset?
 
     def calculate_dose(self, source_number=None, modality=None):
-        """Calculate dose and update self.dose_dict."""
+        """Calculate dose and update self.dose_dict.
+
+        Calculations running in separate threads are canceled if all sources
+        are calculated. If a calculation of all sources is running, all
+        sources are calculated.
+        """
+        if any([worker.modality is None for worker in self.dose_workers]):
+            source_number = None
+            modality = None
+        if source_number is None or modality is None:
+            self.cancel_dose_workers(wait=True)
+        else:
+            self.stop_walls_workers()
+        progress_modal = uir.ProgressModal(
+            "Calculating...", "Cancel", 0, 100, self, minimum_duration=0)
+
+        def update_progress(value, text):
+            progress_modal.setLabelText(text)
+            progress_modal.setValue(value)
+
         status, msgs = calculate_dose(
-            self, source_number=source_number, modality=modality)
+            self, source_number=source_number, modality=modality,
+            progress_callback=update_progress,
+            cancel_callback=progress_modal.wasCanceled)
+        progress_modal.close()
+        self.show_dose_result(status, msgs)
+        if status and modality is not None:
+            self.update_dose_walls()  # walls stopped or edited meanwhile
+
+    def show_dose_result(self, status, msgs):
+        """Show warnings and dose after calculation."""
         if msgs:
             dlg = messageboxes.MessageBoxWithDetails(
                 self, title='Warnings',
@@ -376,63 +441,237 @@ class MainWindow(QMainWindow):
                 self.wFloorDisplay.canvas.update_overlay()
                 self.wVisual.colorbar.colorbar_draw()
 
+    def calculate_dose_background(self, source_number=None, modality=None):
+        """Calculate dose in a separate thread and update self.dose_dict when done.
+
+        Running calculations of the same source or of all sources are
+        superseded by the new request. If a calculation of all sources is
+        superseded, all sources are recalculated.
+        """
+        superseded = [worker for worker in self.dose_workers
+                      if worker.superseded_by(source_number, modality)]
+        if any([worker.modality is None for worker in superseded]):
+            source_number = None
+            modality = None
+        for worker in superseded:
+            worker.requestInterruption()
+            self.dose_workers.remove(worker)
+
+        dose_input, source_number, modality, msgs = get_dose_input(
+            self, source_number=source_number, modality=modality)
+        if dose_input is None:
+            status = False
+            if modality:
+                status = set_dose_result(
+                    self, None, source_number=source_number, modality=modality)
+            self.show_dose_result(status, msgs)
+        else:
+            worker = DoseWorker(
+                dose_input, source_number=source_number, modality=modality,
+                parent=self)
+            worker.progress.connect(
+                lambda value, text, worker=worker:
+                    self.dose_progress(worker, value, text))
+            worker.partial_result.connect(
+                lambda modality, values, worker=worker:
+                    self.dose_partial_result(worker, modality, values))
+            worker.calculation_finished.connect(
+                lambda dose_dict, msgs, worker=worker:
+                    self.dose_calculation_finished(worker, dose_dict, msgs))
+            worker.finished.connect(worker.deleteLater)
+            self.dose_workers.append(worker)
+            self.wCalculate.update_progress(0, 'Calculating...')
+            worker.start()
+
+    def dose_progress(self, worker, value, text):
+        """Show progress of calculation if not superseded or canceled."""
+        if worker in self.dose_workers:
+            self.wCalculate.update_progress(value, text)
+
+    def dose_partial_result(self, worker, modality, values):
+        """Show dose of finished modality while calculation of all sources runs."""
+        if worker in self.dose_workers and worker.modality is None:
+            if worker.partial_dose_dict is None:
+                worker.partial_dose_dict = {
+                    'dose_NM': None, 'dose_CT': None, 'dose_OT': None,
+                    'walls': worker.dose_input['walls'],
+                    'shield_data': worker.dose_input['shield_data'],
+                    'grid_factor': get_grid_factor(
+                        worker.dose_input['calibration_factor'],
+                        worker.dose_input['general_values']),
+                    'map_shape': worker.dose_input['map_shape']}
+            # not copied, values are also in the result of the worker.
+            # Walls edited during the calculation are updated when finished.
+            worker.partial_dose_dict[f'dose_{modality}'] = values
+            reset_dose_sums(worker.partial_dose_dict)
+            self.dose_dict = worker.partial_dose_dict
+            self.sum_dose_days()
+
+    def dose_calculation_finished(self, worker, dose_dict, msgs):
+        """Update dose when calculation in separate thread finished."""
+        if worker in self.dose_workers:  # not superseded or canceled
+            self.dose_workers.remove(worker)
+            status = False
+            if worker.modality is not None:
+                self.stop_walls_workers()  # not updating dose_dict meanwhile
+            if dose_dict is not None:
+                status = set_dose_result(
+                    self, dose_dict, source_number=worker.source_number,
+                    modality=worker.modality)
+            self.show_dose_result(status, msgs)
+            if status:
+                self.update_dose_walls()  # walls edited during calculation?
+        if len(self.dose_workers) == 0:
+            self.wCalculate.update_progress(None, '')
+
+    def schedule_dose_update(self, source_number=None, modality=None,
+                             walls=False):
+        """Update dose after edits when no more edits for a short while.
+
+        Edits are collected until the timer runs out such that e.g. scrolling
+        a spinbox gives one recalculation of the edited source.
+
+        Parameters
+        ----------
+        source_number : int, optional
+            edited source. Default is None.
+        modality : str, optional
+            modality of edited source. Default is None.
+        walls : bool, optional
+            True if walls are edited. Default is False.
+        """
+        if self.dose_dict:
+            if modality is not None:
+                if [modality, source_number] not in self.scheduled_dose_sources:
+                    self.scheduled_dose_sources.append([modality, source_number])
+            if walls:
+                self.scheduled_dose_walls = True
+            self.dose_update_timer.start()
+
+    def run_scheduled_dose_update(self):
+        """Update dose for edits collected by schedule_dose_update."""
+        scheduled_sources = self.scheduled_dose_sources
+        self.scheduled_dose_sources = []
+        if self.scheduled_dose_walls:
+            self.scheduled_dose_walls = False
+            self.update_dose_walls()
+        for modality, source_number in scheduled_sources:
+            self.calculate_dose_background(
+                source_number=source_number, modality=modality)
+
+    def cancel_dose_workers(self, wait=False):
+        """Cancel calculations running in separate threads."""
+        for worker in (self.findChildren(DoseWorker)
+                       + self.findChildren(WallsWorker)
+                       + self.findChildren(OptimiseWorker)):  # also superseded
+            worker.requestInterruption()
+            if wait:
+                worker.wait()
+        self.dose_workers = []
+        self.wCalculate.update_progress(None, '')
+
+    def stop_walls_workers(self):
+        """Stop updating walls in separate threads before changing dose_dict.
+
+        Sources not updated yet are updated by update_dose_walls when the
+        worker is finished (walls_update_finished).
+        """
+        for worker in self.findChildren(WallsWorker):
+            if worker.dose_dict is self.dose_dict:
+                worker.requestInterruption()
+                worker.wait()
+
+    def update_dose_walls(self):
+        """Update dose after walls edited, recalculating changed walls only.
+
+        The transmission is updated in a separate thread. A running update is
+        superseded, i.e. canceled and started again when the worker stops.
+        If the dose pr source is not kept, all sources are recalculated.
+        If a calculation of all sources is running, walls are updated when
+        the calculation is finished.
+        """
+        if any([worker.modality is None for worker in self.dose_workers]):
+            pass  # dose_calculation_finished calls update_dose_walls
+        elif self.dose_dict:
+            walls = get_valid_rows(
+                self.walls_tab.table_list, nonzero_columns=[4],
+                n_coordinates=4)
+            if walls_changed(self.dose_dict, walls):
+                if self.dose_dict.get('retain_sources', True):
+                    running = [worker for worker in self.dose_workers
+                               if isinstance(worker, WallsWorker)]
+                    if running:
+                        for worker in running:
+                            worker.requestInterruption()
+                    else:
+                        self.start_walls_worker()
+                else:
+                    self.calculate_dose_background()
+
+    def start_walls_worker(self):
+        """Start WallsWorker updating self.dose_dict for edited walls."""
+        walls_input = get_walls_input(self)
+        if walls_input is not None:
+            worker = WallsWorker(walls_input, parent=self)
+            worker.progress.connect(
+                lambda value, text, worker=worker:
+                    self.dose_progress(worker, value, text))
+            worker.calculation_finished.connect(
+                lambda msgs, worker=worker:
+                    self.walls_update_finished(worker, msgs))
+            worker.finished.connect(worker.deleteLater)
+            self.dose_workers.append(worker)
+            self.wCalculate.update_progress(0, 'Updating walls...')
+            worker.start()
+
+    def walls_update_finished(self, worker, msgs):
+        """Show dose when walls are updated in separate thread.
+
+        Walls are updated again if edited meanwhile or superseded.
+        """
+        if worker in self.dose_workers:  # not canceled
+            self.dose_workers.remove(worker)
+            if worker.dose_dict is self.dose_dict:
+                reset_dose_sums(self.dose_dict)  # if summed while updating
+                if msgs:
+                    self.show_walls_warnings(msgs)
+                self.sum_dose_days()
+                self.update_dose_walls()
+        if len(self.dose_workers) == 0:
+            self.wCalculate.update_progress(None, '')
+
+    def show_walls_warnings(self, msgs):
+        """Show warnings from updating walls without blocking further edits."""
+        if self.walls_warnings is not None:
+            self.walls_warnings.close()
+        self.walls_warnings = messageboxes.MessageBoxWithDetails(
+            self, title='Warnings',
+            msg='Found issues when updating walls',
+            info='See details',
+            icon=QMessageBox.Icon.Warning,
+            details=msgs)
+        self.walls_warnings.setModal(False)
+        self.walls_warnings.show()
+
     def sum_dose_days(self):
         """Sum dose on number of working days changed."""
         if self.dose_dict:
-            floor = self.gui.current_floor
-            floor_dist = get_floor_distance(floor, self.general_values)
-            wd = self.wCalculate.working_days.value()
-            if self.dose_dict['dose_NM']:
-                dd = self.dose_dict['dose_NM']
-                self.nm_dose_map = np.zeros(self.occ_map.shape)
-                self.nm_doserate_map = np.zeros(self.occ_map.shape)
-                for i, df in enumerate(dd['dose_factors']):
-                    if df:
-                        if floor == 1:
-                            temp = 1. / dd['dist_maps'][i]**2
-                        else:
-                            temp = 1. / (floor_dist**2 + dd['dist_maps'][i]**2)
-                        if dd['transmission_maps'][i]:
-                            temp = dd['transmission_maps'][i][floor] * temp
-                        nm_dose_map_this = 0.001 * wd * df * self.occ_map * temp
-                        self.nm_dose_map = self.nm_dose_map + nm_dose_map_this
-                        nm_doserate_map_this = dd['doserate_max_factors'][i] * temp
-                        self.nm_doserate_map = (
-                            self.nm_doserate_map + nm_doserate_map_this)
-            else:
-                self.nm_dose_map = np.zeros(2)
-                self.nm_doserate_map = np.zeros(2)
-            if self.dose_dict['dose_CT']:
-                dd = self.dose_dict['dose_CT']
-                self.ct_dose_map = np.zeros(self.occ_map.shape)
-                for i, df in enumerate(dd['dose_factors']):
-                    if df is not None:
-                        if df[floor] is not None:
-                            temp = 0.001 * wd * df[floor]
-                            if dd['transmission_maps'][i]:
-                                temp = dd['transmission_maps'][i][floor] * temp
-                            temp = self.occ_map * temp
-                            self.ct_dose_map = self.ct_dose_map + temp
+            dose_maps = sum_dose_days(
+                self.dose_dict, occ_map=self.occ_map,
+                floor=self.gui.current_floor,
+                working_days=self.wCalculate.working_days.value(),
+                general_values=self.general_values)
+            if dose_maps is None:
+                # dose pr source not kept and floor shielding changed
+                self.calculate_dose_background()
             else:
-                self.ct_dose_map = np.zeros(2)
-            if self.dose_dict['dose_OT']:
-                dd = self.dose_dict['dose_OT']
-                self.ot_dose_map = np.zeros(self.occ_map.shape)
-                for i, df in enumerate(dd['dose_factors']):
-                    if df:
-                        if floor == 1:
-                            temp = 1. / dd['dist_maps'][i]**2
-                        else:
-                            temp = 1. / (floor_dist**2 + dd['dist_maps'][i]**2)
-                        if dd['transmission_maps'][i]:
-                            temp = dd['transmission_maps'][i][floor] * temp
-                        ot_dose_map_this = 0.001 * wd * df * self.occ_map * temp
-                        self.ot_dose_map = self.ot_dose_map + ot_dose_map_this
-            else:
-                self.ot_dose_map = np.zeros(2)
-            self.update_calculation_points()
-            if 'Dose' in self.wVisual.overlay_text():
-                self.wFloorDisplay.canvas.update_overlay()
+                for key, dose_map in dose_maps.items():
+                    if dose_map is None:
+                        dose_map = np.zeros(2)
+                    setattr(self, key, dose_map)
+                self.update_calculation_points()
+                if 'Dose' in self.wVisual.overlay_text():
+                    self.wFloorDisplay.canvas.update_overlay()
 
     def update_calculation_points(self):
         """Update dose to calculation points."""
@@ -450,33 +689,13 @@ class MainWindow(QMainWindow):
                             dose += self.ot_dose_map[y, x]
                     except IndexError:
                         pass
-                    if dose > 0:
-                        if dose > 0.001:
-                            dose_string = f'{dose:.4f}'
-                        else:
-                            dose_string = f'{dose:.2g}'
-                    else:
-                        dose_string = '0'
-                    self.points_tab.table_list[i][3] = dose_string
-                    self.points_tab.table.cellWidget(i, 3).setText(dose_string)
                     try:
                         doserate = self.nm_doserate_map[y, x]
                     except IndexError:
                         doserate = 0
-                    if doserate > 0:
-                        if doserate > 0.001:
-                            dose_string = f'{doserate:.2f}'
-                        else:
-                            dose_string = f'{doserate:.2g}'
-                    else:
-                        dose_string = '0'
-                    self.points_tab.table_list[i][4] = dose_string
+                    self.set_calculation_point(i, (dose, doserate))
                 else:
-                    dose_string = '?'
-                try:
-                    self.points_tab.table.cellWidget(i, 4).setText(dose_string)
-                except AttributeError:
-                    pass
+                    self.set_calculation_point(i, None)
         else:
             try:
                 for row in self.points_tab.table_list:
@@ -484,6 +703,178 @@ class MainWindow(QMainWindow):
             except AttributeError:
                 pass
 
+    def set_calculation_point(self, row, point_dose):
+        """Show dose and doserate in row of calculation points table.
+
+        Parameters
+        ----------
+        row : int
+        point_dose : tuple or None
+            (dose, doserate) or None if unknown position.
+        """
+        if point_dose is None:
+            dose_string = '?'
+        else:
+            dose, doserate = point_dose
+            if dose > 0:
+                if dose > 0.001:
+                    dose_string = f'{dose:.4f}'
+                else:
+                    dose_string = f'{dose:.2g}'
+            else:
+                dose_string = '0'
+            self.points_tab.table_list[row][3] = dose_string
+            self.points_tab.table.cellWidget(row, 3).setText(dose_string)
+            if doserate > 0:
+                if doserate > 0.001:
+                    dose_string = f'{doserate:.2f}'
+                else:
+                    dose_string = f'{doserate:.2g}'
+            else:
+                dose_string = '0'
+            self.points_tab.table_list[row][4] = dose_string
+        try:
+            self.points_tab.table.cellWidget(row, 4).setText(dose_string)
+        except AttributeError:
+            pass
+
+    def calculate_dose_points(self):
+        """Calculate dose at calculation points only, without dose maps."""
+        progress_modal = uir.ProgressModal(
+            "Calculating...", "Cancel", 0, 100, self, minimum_duration=0)
+
+        def update_progress(value, text):
+            progress_modal.setLabelText(text)
+            progress_modal.setValue(value)
+
+        point_doses, msgs = calculate_dose_points(
+            self, progress_callback=update_progress,
+            cancel_callback=progress_modal.wasCanceled)
+        progress_modal.close()
+        self.show_dose_result(False, msgs)
+        if point_doses is not None:
+            for i, point_dose in enumerate(point_doses):
+                self.set_calculation_point(i, point_dose)
+
+    def optimise_walls(self):
+        """Find minimum wall thickness for dose limits at points or areas."""
+        walls_tab = self.walls_tab
+        dlg = OptimiseWallsDialog(
+            wall_names=[row[1] for row in walls_tab.table_list],
+            selected_row=walls_tab.active_row,
+            materials=walls_tab.material_strings,
+            area_names=[row[1] if row[0] else None
+                        for row in self.areas_tab.table_list])
+        if dlg.exec():
+            (wall_numbers, dose_limit, thickness_step, materials,
+             material_costs, area_limits) = dlg.get_data()
+            if wall_numbers:
+                optimise_input, msgs = get_optimise_walls_input(
+                    self, wall_numbers, dose_limit,
+                    thickness_step=thickness_step, materials=materials,
+                    material_costs=material_costs, area_limits=area_limits)
+                if optimise_input is None:
+                    self.show_dose_result(False, msgs)
+                else:
+                    self.optimise_walls_background(
+                        optimise_input, wall_numbers, msgs,
+                        at_areas=area_limits is not None)
+
+    def optimise_walls_background(self, optimise_input, wall_numbers, msgs,
+                                  at_areas=False):
+        """Run optimise_walls in a separate thread, superseding running."""
+        for worker in [worker for worker in self.dose_workers
+                       if isinstance(worker, OptimiseWorker)]:
+            worker.requestInterruption()
+            self.dose_workers.remove(worker)
+        worker = OptimiseWorker(optimise_input, parent=self)
+        walls_start = copy.deepcopy(self.walls_tab.table_list)
+        worker.progress.connect(
+            lambda value, text, worker=worker:
+                self.dose_progress(worker, value, text))
+        worker.calculation_finished.connect(
+            lambda solution, worker=worker:
+                self.optimise_walls_finished(
+                    worker, solution, wall_numbers, walls_start,
+                    msgs + solution.msgs, at_areas=at_areas))
+        worker.finished.connect(worker.deleteLater)
+        self.dose_workers.append(worker)
+        self.wCalculate.update_progress(0, 'Optimising...')
+        worker.start()
+
+    def optimise_walls_finished(self, worker, solution, wall_numbers,
+                                walls_start, msgs, at_areas=False):
+        """Offer to set walls to the solution from optimise_walls_background.
+
+        Parameters
+        ----------
+        worker : OptimiseWorker
+        solution : ShieldingSolution
+        wall_numbers : list of int
+            row number in walls table of the optimised walls
+        walls_start : list of list
+            walls table when the optimisation started
+        msgs : list of str
+        at_areas : bool, optional
+            True if dose limits pr area. Default is False.
+        """
+        if worker in self.dose_workers:  # not superseded or canceled
+            self.dose_workers.remove(worker)
+            if len(self.dose_workers) == 0:
+                self.wCalculate.update_progress(None, '')
+            walls_tab = self.walls_tab
+            if walls_tab.table_list != walls_start and solution.thicknesses:
+                msgs.append(
+                    'Walls edited during optimisation. Solution not valid, '
+                    'please optimise again.')
+            elif solution.thicknesses:
+                result = [
+                    f'{walls_tab.table_list[i][1]}: {thickness:.1f} mm {material}'
+                    for i, thickness, material in zip(
+                        wall_numbers, solution.thicknesses,
+                        solution.materials)]
+                at_txt = 'areas' if at_areas else 'calculation points'
+                info = (
+                    f'Max dose at {at_txt}: '
+                    f'{float(solution.doses.max()):.3f} mSv<br>'
+                    f'{solution.iterations} iterations in '
+                    f'{solution.runtime:.2f} s')
+                if solution.feasible:
+                    question = 'Found solution:<br>' + '<br>'.join(result)
+                else:
+                    question = (
+                        'Found no solution within max thickness. Best found:'
+                        '<br>' + '<br>'.join(result))
+                proceed = messageboxes.proceed_question(
+                    self, question + '<br><br>Set walls to these values?',
+                    info_text=info)
+                if proceed:
+                    for i, thickness, material in zip(
+                            wall_numbers, solution.thicknesses,
+                            solution.materials):
+                        walls_tab.set_wall_shielding(i, material, thickness)
+                    self.schedule_dose_update(walls=True)
+            self.show_dose_result(False, msgs)
+
+    def sweep_walls(self):
+        """Show dose at calculation points as function of wall thickness."""
+        walls_tab = self.walls_tab
+        dlg = ThicknessSweepDialog(
+            wall_names=[row[1] for row in walls_tab.table_list],
+            selected_row=walls_tab.active_row)
+        if dlg.exec():
+            wall_numbers, thicknesses = dlg.get_data()
+            if wall_numbers and thicknesses.size > 0:
+                self.start_wait_cursor()
+                table, msgs = sweep_walls_points(self, wall_numbers, thicknesses)
+                self.stop_wait_cursor()
+                self.show_dose_result(False, msgs)
+                if table is not None:
+                    dlg = ThicknessSweepDisplay(
+                        table, csv_separator=self.general_values.csv_separator,
+                        csv_decimal=self.general_values.csv_decimal)
+                    dlg.exec()
+
     def keyReleaseEvent(self, event):
         """Trigger get_pos when Enter/Return pressed."""
         if isinstance(event, QKeyEvent):
@@ -509,6 +900,7 @@ class MainWindow(QMainWindow):
 
     def finish_cleanup(self):
         """Cleanup/save before exit."""
+        self.cancel_dose_workers(wait=True)
         try:
             cff.remove_user_from_active_users()
             # save current settings to user prefs
@@ -647,6 +1039,8 @@ class MainWindow(QMainWindow):
             widget.reset_table()
         self.gui.image_path == ''
         self.image = np.zeros(2)
+        self.wall_geometry_cache.clear()
+        self.ct_kernel_cache.clear()
         self.reset_dose()
         self.update_image()
 
@@ -1396,7 +1790,10 @@ class FloorCanvas(FigureCanvasQTAgg):
             elif ('source' in self.main.gui.current_tab
                   or 'point' in self.main.gui.current_tab):
                 self.sourcepos_highlight()
-            self.main.reset_dose()
+            if self.main.gui.current_tab == 'Walls':
+                self.main.update_dose_walls()
+            else:
+                self.main.reset_dose()
 
         #self.reset_hover_pick()
 
@@ -2429,17 +2826,110 @@ class CalculateWidget(QWidget):
         hlo_correct.addWidget(uir.InfoTool(
             'Correct wall thickness geometrically as the rays actually have a longer '
             'path through the material when oblique to the wall.<br>'
-            'NB might underestimate path length of scattered photons.<br>'
-            'These corrections are ignored for oblique walls.',
+            'NB might underestimate path length of scattered photons.',
+            parent=self))
+        self.chk_float32 = QCheckBox(
+            'Calculate with single precision.')
+        self.chk_float32.setChecked(self.main.general_values.float32)
+        self.chk_float32.clicked.connect(self.float32_edited)
+        hlo_float32 = QHBoxLayout()
+        vlo.addLayout(hlo_float32)
+        hlo_float32.addWidget(self.chk_float32)
+        hlo_float32.addWidget(uir.InfoTool(
+            'Calculate and store dose maps as 32 bit floating point numbers.<br>'
+            'Uses half the memory and is faster for large floor plans. '
+            'Relative deviation from double precision is in the order of 1e-6.',
             parent=self))
+        self.calculation_grid_cm = QSpinBox(
+            minimum=0, maximum=100,
+            value=self.main.general_values.calculation_grid_cm)
+        self.calculation_grid_cm.valueChanged.connect(
+            self.calculation_grid_edited)
+        hlo_grid = QHBoxLayout()
+        vlo.addLayout(hlo_grid)
+        hlo_grid.addWidget(QLabel('Calculate dose every '))
+        hlo_grid.addWidget(self.calculation_grid_cm)
+        hlo_grid.addWidget(QLabel(' cm'))
+        hlo_grid.addWidget(uir.InfoTool(
+            'Distance between calculation points. 0 = every pixel of the '
+            'floor plan.<br>'
+            'Dose between calculation points is interpolated bilinearly. '
+            'A few cm is usually sufficient and much faster for floor plans '
+            'scanned with high resolution.',
+            parent=self))
+        hlo_grid.addStretch()
+        self.calculation_modes = {
+            'sources': 'Keep dose pr source',
+            'streaming': 'Summed dose only',
+            'tiled': 'Summed dose only, limited memory',
+            'adaptive': 'Adaptive grid, summed dose only'}
+        self.calculation_mode = QComboBox()
+        self.calculation_mode.addItems(list(self.calculation_modes.values()))
+        self.set_calculation_mode(self.main.general_values.calculation_mode)
+        self.calculation_mode.currentIndexChanged.connect(
+            self.calculation_mode_edited)
+        hlo_mode = QHBoxLayout()
+        vlo.addLayout(hlo_mode)
+        hlo_mode.addWidget(QLabel('Calculation method '))
+        hlo_mode.addWidget(self.calculation_mode)
+        hlo_mode.addWidget(uir.InfoTool(
+            'Keep dose pr source: edits of single sources and walls are '
+            'updated without recalculating all sources.<br>'
+            'Summed dose only: dose maps pr source are added to the summed '
+            'dose and discarded. Uses less memory with many sources.<br>'
+            'Limited memory: dose is calculated for a few rows of the floor '
+            'plan at a time, for floor plans too large to calculate at '
+            'once.<br>'
+            'Adaptive grid: dose is calculated on a coarse grid, refined near '
+            'walls, wall shadows and sources and where interpolation '
+            'fails. Faster for large floor plans.<br>'
+            'If only the summed dose is kept, any edit of sources, '
+            'walls or floor shielding recalculates all sources. '
+            'Limited memory and adaptive grid do not use the calculation '
+            'grid above.',
+            parent=self))
+        hlo_mode.addStretch()
 
         vlo.addSpacing(20)
         btn_calculate = QPushButton('Calculate dose')
-        btn_calculate.clicked.connect(self.main.calculate_dose)
+        btn_calculate.clicked.connect(
+            lambda: self.main.calculate_dose_background())
         hlo_calc = QHBoxLayout()
         vlo.addLayout(hlo_calc)
         hlo_calc.addWidget(self.gb_floor)
-        hlo_calc.addWidget(btn_calculate)
+        vlo_btns = QVBoxLayout()
+        hlo_calc.addLayout(vlo_btns)
+        vlo_btns.addWidget(btn_calculate)
+        btn_calculate_points = QPushButton('Calculate points only')
+        btn_calculate_points.setToolTip(
+            'Calculate dose at the calculation points without dose maps.')
+        btn_calculate_points.clicked.connect(
+            lambda: self.main.calculate_dose_points())
+        vlo_btns.addWidget(btn_calculate_points)
+
+        self.progress_bar = uir.ProgressBar(self)
+        self.btn_cancel = QPushButton('Cancel')
+        self.btn_cancel.clicked.connect(
+            lambda: self.main.cancel_dose_workers())
+        hlo_progress = QHBoxLayout()
+        vlo.addLayout(hlo_progress)
+        hlo_progress.addWidget(self.progress_bar)
+        hlo_progress.addWidget(self.btn_cancel)
+        self.update_progress(None, '')
+
+    def update_progress(self, value, text):
+        """Show progress of calculation running in separate thread.
+
+        Progress is hidden if value is None.
+        """
+        if value is None:
+            self.progress_bar.hide()
+            self.btn_cancel.hide()
+        else:
+            self.progress_bar.setFormat(f'{text} %p%')
+            self.progress_bar.setValue(value)
+            self.progress_bar.show()
+            self.btn_cancel.show()
 
     def correct_thickness_edited(self):
         """Update after setting for correct thickness edited."""
@@ -2448,6 +2938,34 @@ class CalculateWidget(QWidget):
         if self.main.dose_dict:
             self.main.reset_dose()  # TODO or recalculate?
 
+    def float32_edited(self):
+        """Update after setting for single precision edited."""
+        self.main.general_values.float32 = self.chk_float32.isChecked()
+        if self.main.dose_dict:
+            self.main.reset_dose()
+
+    def calculation_grid_edited(self):
+        """Update after distance between calculation points edited."""
+        self.main.general_values.calculation_grid_cm = (
+            self.calculation_grid_cm.value())
+        if self.main.dose_dict:
+            self.main.reset_dose()
+
+    def set_calculation_mode(self, mode):
+        """Show calculation mode from general_values."""
+        modes = list(self.calculation_modes)
+        self.calculation_mode.blockSignals(True)
+        self.calculation_mode.setCurrentIndex(
+            modes.index(mode) if mode in modes else 0)
+        self.calculation_mode.blockSignals(False)
+
+    def calculation_mode_edited(self):
+        """Update after calculation method edited."""
+        self.main.general_values.calculation_mode = list(
+            self.calculation_modes)[self.calculation_mode.currentIndex()]
+        if self.main.dose_dict:
+            self.main.reset_dose()
+
     def working_days_edited(self):
         """Update after mumber of working days edited."""
         self.main.general_values.working_days = self.working_days.value()
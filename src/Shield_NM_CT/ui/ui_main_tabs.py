@@ -166,8 +166,7 @@ class InputTab(QWidget):
                         w.blockSignals(False)
                     self.update_wall_annotation(row, remove_already=True)
                     self.highlight_selected_in_image()
-                    if self.main.dose_dict:
-                        self.main.reset_dose()  # TODO auto recalculate?
+                    self.main.schedule_dose_update(walls=True)
                 elif 'source' in self.label:
                     self.update_current_source_annotation()
                     if col == 5 and 'CT' in self.label:
@@ -176,8 +175,8 @@ class InputTab(QWidget):
                         w_unit = self.table.cellWidget(row, 6)
                         w_unit.setText(self.ct_doserate_units[idx])
                         self.table_list[row][6] = self.ct_doserate_units[idx]
-                    if self.main.dose_dict:
-                        self.main.calculate_dose(source_number=row, modality=self.modality)
+                    self.main.schedule_dose_update(
+                        source_number=row, modality=self.modality)
                 elif self.label == 'point':
                     self.update_current_source_annotation()
                     if self.main.dose_dict:
@@ -197,7 +196,11 @@ class InputTab(QWidget):
                 tabitem.setText(text)
                 self.table_list[self.active_row][2] = text
                 self.update_source_annotations()
-                self.main.reset_dose()
+                if 'source' in self.label:
+                    self.main.schedule_dose_update(
+                        source_number=self.active_row, modality=self.modality)
+                else:
+                    self.main.reset_dose()
         elif self.main.gui.x1 is None:
             dlg = messageboxes.MessageBoxWithDetails(
                 self, title='Warning',
@@ -1055,6 +1058,17 @@ class WallsTab(InputTab):
         self.rectify.setChecked(True)
         self.rectify.clicked.connect(self.rectify_changed)
         self.hlo_extra.addWidget(self.rectify)
+        btn_optimise = QPushButton('Optimise thickness...')
+        btn_optimise.setToolTip(
+            'Find minimum thickness of walls for a dose limit at the '
+            'calculation points')
+        btn_optimise.clicked.connect(main.optimise_walls)
+        self.hlo_extra.addWidget(btn_optimise)
+        btn_sweep = QPushButton('Dose vs thickness...')
+        btn_sweep.setToolTip(
+            'Dose at the calculation points as function of wall thickness')
+        btn_sweep.clicked.connect(main.sweep_walls)
+        self.hlo_extra.addWidget(btn_sweep)
 
         self.label = 'Walls'
         self.main = main
@@ -1144,7 +1158,7 @@ class WallsTab(InputTab):
                 tabitem.setText(text)
                 self.table_list[self.active_row][2] = text
                 self.update_wall_annotations()
-                self.main.reset_dose()
+                self.main.update_dose_walls()
             except (AttributeError, IndexError):
                 self.select_row_col(0, 0)
 
@@ -1168,6 +1182,29 @@ class WallsTab(InputTab):
                 break
         return color
 
+    def set_wall_shielding(self, row, material, thickness):
+        """Set material and thickness of a wall without triggering dose update.
+
+        Parameters
+        ----------
+        row : int
+            row number in table
+        material : str
+            material label
+        thickness : float
+            mm
+        """
+        for col, value in [(3, material), (4, thickness)]:
+            w = self.table.cellWidget(row, col)
+            w.blockSignals(True)
+            if col == 3:
+                w.setCurrentText(value)
+            else:
+                w.setValue(value)
+            w.blockSignals(False)
+            self.table_list[row][col] = value
+        self.update_wall_annotation(row, remove_already=True)
+
     def get_default_thickness_from_material(self, material):
         """Return default_thickness for given material label.
 
@@ -1328,8 +1365,7 @@ class WallsTab(InputTab):
         """Delete selected row."""
         removed_row = super().delete_row()
         if removed_row > -1:
-            if self.main.dose_dict:
-                self.main.reset_dose()  # TODO or update
+            self.main.update_dose_walls()
 
     def add_row(self):
         """Add row after selected row (or as last row if none selected).
@@ -1365,6 +1401,7 @@ class WallsTab(InputTab):
             self.select_row_col(added_row, 1)
             self.table_list[added_row] = copy.deepcopy(values_above)
             self.update_wall_annotations()
+            self.main.update_dose_walls()
 
 
 class NMsourcesTab(InputTab):
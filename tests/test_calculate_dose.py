@@ -0,0 +1,748 @@
+# -*- coding: utf-8 -*-
+"""
+Tests on dose calculations without GUI.
+
+@author: ewas
+"""
+import copy
+from pathlib import Path
+import tracemalloc
+import numpy as np
+import yaml
+
+from Shield_NM_CT.config import config_classes as cfc
+from Shield_NM_CT.scripts import calculate_dose as cd
+from Shield_NM_CT.scripts.array_cache import ArrayCache
+from Shield_NM_CT.scripts import optimise_shielding as osh
+
+
+path_defaults = (
+    Path(__file__).parent.parent / 'src' / 'Shield_NM_CT' / 'config_defaults')
+
+
+def read_defaults(fname, dataclass):
+    with open(path_defaults / f'{fname}.yaml', 'r') as file:
+        docs = yaml.safe_load_all(file)
+        settings = [dataclass(**doc) for doc in docs if doc is not None]
+    return settings
+
+
+isotopes = read_defaults('isotopes', cfc.Isotope)
+shield_data = read_defaults('shield_data', cfc.ShieldData)
+ct_models = read_defaults('ct_models', cfc.CT_model)
+
+# as tests/simple_project without areas, scale 200 pixels = 1 m
+general_values = cfc.GeneralValues(working_days=1000, h0=2.7, h1=2.5)
+map_shape = (1000, 1000)
+calibration_factor = 1./200
+source_NM = [True, '', '500, 500', 'F-18', False, 100., 1., 1., 1., 1.]
+walls = [[True, '', '201, 397, 804, 397', 'Lead', 2.],
+         [True, '', '198, 598, 797, 598', 'Concrete', 200.]]
+points = [(500, 300), (300, 500), (500, 700)]  # top, left, bottom
+
+
+def get_simple_project_input():
+    sources = {'NM': cd.get_valid_rows(
+        [source_NM], nonzero_columns=[5, 7, 8, 9], n_coordinates=2)}
+    walls_valid = cd.get_valid_rows(
+        walls, nonzero_columns=[4], n_coordinates=4)
+    return sources, walls_valid
+
+
+def test_headless_simple_project():
+    sources, walls_valid = get_simple_project_input()
+    dose_dict, msgs = cd.calculate_dose_sources(
+        sources, walls_valid, isotopes=isotopes, shield_data=shield_data,
+        general_values=general_values, map_shape=map_shape,
+        calibration_factor=calibration_factor)
+    assert msgs == []
+    dose_maps = cd.sum_dose_days(
+        dose_dict, working_days=general_values.working_days)
+    dose_values = [round(dose_maps['nm_dose_map'][y, x], 4) for x, y in points]
+    assert dose_values == [6.416, 8.1492, 0.7364]
+    doserate_values = [
+        round(dose_maps['nm_doserate_map'][y, x], 2) for x, y in points]
+    assert doserate_values == [7.71, 9.79, 0.88]
+
+
+def test_float32_within_printed_precision():
+    sources, walls_valid = get_simple_project_input()
+    point_values = []
+    for float32 in [True, False]:
+        general_values_this = copy.deepcopy(general_values)
+        general_values_this.float32 = float32
+        general_values_this.correct_thickness = True
+        dose_dict, _ = cd.calculate_dose_sources(
+            sources, walls_valid, isotopes=isotopes, shield_data=shield_data,
+            general_values=general_values_this, map_shape=map_shape,
+            calibration_factor=calibration_factor)
+        dose_maps = cd.sum_dose_days(
+            dose_dict, occ_map=np.ones(map_shape), working_days=1000,
+            general_values=general_values_this)
+        assert dose_maps['nm_dose_map'].dtype == (
+            np.float32 if float32 else np.float64)
+        point_values.append(
+            [round(float(dose_maps['nm_dose_map'][y, x]), 4) for x, y in points])
+    assert point_values[0] == point_values[1]
+
+
+def test_headless_progress_cancel():
+    sources, walls_valid = get_simple_project_input()
+    progress_values = []
+    dose_dict, _ = cd.calculate_dose_sources(
+        sources, walls_valid, isotopes=isotopes, shield_data=shield_data,
+        general_values=general_values, map_shape=map_shape,
+        calibration_factor=calibration_factor,
+        progress_callback=lambda value, text: progress_values.append(value),
+        cancel_callback=lambda: len(progress_values) > 1)
+    assert dose_dict is None
+    assert progress_values == [0, 1]
+
+
+def test_wall_affect_sector_oblique_wide_map():
+    # oblique wall to the right of the source, map wider than high
+    shape = (200, 600)
+    wall_affect, mask = cd.calculate_wall_affect_sector(
+        shape, (100, 100), (300, 0, 400, 199))
+    assert mask[100, 500] == 1  # behind wall, outside first shape[0] columns
+    assert mask[100, 200] == 0  # between source and wall
+    assert mask[100, 50] == 0  # opposite side of source
+    # path length 1/cos(angle between ray and wall normal)
+    wall_length = (100 ** 2 + 199 ** 2) ** 0.5
+    assert round(wall_affect[100, 500], 4) == round(wall_length / 199, 4)
+
+
+def test_wall_affect_on_wall_line():
+    ys, xs = np.ogrid[:200, :200]
+    walls_pos = [[20, 50, 180, 50], [20, 150, 180, 120], [150, 20, 150, 180]]
+    walls_affect = cd.get_walls_affect(xs, ys, (100, 100), walls_pos)
+    walls_behind = cd.get_walls_affect(
+        xs, ys, (100, 100), walls_pos, correct_thickness=False)
+    assert ((walls_affect > 0) == (walls_behind > 0)).all()
+    # pixels on the wall line shielded in both modes
+    assert walls_behind[0, 50, 60:140].all()
+    assert walls_behind[2, 60:140, 150].all()
+    assert (walls_affect[0, 50, 60:140] >= 1).all()
+    assert (walls_affect[2, 60:140, 150] >= 1).all()
+
+
+def test_wall_geometry_cache():
+    sources, walls_valid = get_simple_project_input()
+    geometry_cache = ArrayCache()
+    cd.calculate_dose_sources(
+        sources, walls_valid, isotopes=isotopes, shield_data=shield_data,
+        general_values=general_values, map_shape=map_shape,
+        calibration_factor=calibration_factor, geometry_cache=geometry_cache)
+    assert len(geometry_cache) == 2
+    assert geometry_cache.misses == 2
+
+    walls_valid[0][4] = 4.  # change only thickness of lead
+    dose_dict_cached, _ = cd.calculate_dose_sources(
+        sources, walls_valid, isotopes=isotopes, shield_data=shield_data,
+        general_values=general_values, map_shape=map_shape,
+        calibration_factor=calibration_factor, geometry_cache=geometry_cache)
+    assert geometry_cache.misses == 2
+    assert geometry_cache.hits == 2
+    dose_dict, _ = cd.calculate_dose_sources(
+        sources, walls_valid, isotopes=isotopes, shield_data=shield_data,
+        general_values=general_values, map_shape=map_shape,
+        calibration_factor=calibration_factor)
+    assert (dose_dict_cached['dose_NM']['transmission_maps'][1][0]
+            == dose_dict['dose_NM']['transmission_maps'][1][0]).all()
+
+
+def test_update_walls_transmission():
+    sources, walls_valid = get_simple_project_input()
+    dose_dict, _ = cd.calculate_dose_sources(
+        sources, walls_valid, isotopes=isotopes, shield_data=shield_data,
+        general_values=general_values, map_shape=map_shape,
+        calibration_factor=calibration_factor)
+
+    # retune lead wall, remove concrete wall, add oblique wall
+    walls_valid[0][4] = 4.
+    walls_valid[1] = None
+    walls_valid.append([True, '', [100, 100, 300, 400], 'Concrete', 100.])
+    msgs = cd.update_walls_transmission(
+        dose_dict, walls_valid, isotopes=isotopes, shield_data=shield_data,
+        general_values=general_values, map_shape=map_shape)
+    assert msgs == []
+    dose_dict_all, _ = cd.calculate_dose_sources(
+        sources, walls_valid, isotopes=isotopes, shield_data=shield_data,
+        general_values=general_values, map_shape=map_shape,
+        calibration_factor=calibration_factor)
+    transmission_updated = dose_dict['dose_NM']['transmission_maps'][1][0]
+    transmission_all = dose_dict_all['dose_NM']['transmission_maps'][1][0]
+    assert abs(transmission_updated - transmission_all).max() < 1e-12
+
+
+def test_update_walls_transmission_canceled():
+    sources, walls_valid = get_simple_project_input()
+    sources['NM'].append(copy.deepcopy(sources['NM'][0]))
+    sources['NM'][1][2] = [300, 700]
+    kwargs = {
+        'isotopes': isotopes, 'shield_data': shield_data,
+        'general_values': general_values, 'map_shape': map_shape}
+    dose_dict, _ = cd.calculate_dose_sources(
+        sources, walls_valid, calibration_factor=calibration_factor, **kwargs)
+    walls_old = copy.deepcopy(walls_valid)
+
+    # canceled after first source
+    walls_valid[0][4] = 4.
+    n_checks = []
+
+    def cancel_second():
+        n_checks.append(1)
+        return len(n_checks) > 1
+
+    cd.update_walls_transmission(
+        dose_dict, walls_valid, cancel_callback=cancel_second, **kwargs)
+    assert dose_dict['walls'] == walls_old
+    assert list(dose_dict['walls_sources']) == [('NM', 0)]
+    assert cd.walls_changed(dose_dict, walls_old)
+
+    # edited again, first source from walls_sources, second from walls
+    walls_valid[1][4] = 100.
+    cd.update_walls_transmission(dose_dict, walls_valid, **kwargs)
+    assert 'walls_sources' not in dose_dict
+    assert cd.walls_changed(dose_dict, walls_valid) is False
+    dose_dict_all, _ = cd.calculate_dose_sources(
+        sources, walls_valid, calibration_factor=calibration_factor, **kwargs)
+    for i in range(2):
+        assert np.allclose(
+            dose_dict['dose_NM']['transmission_maps'][1][i],
+            dose_dict_all['dose_NM']['transmission_maps'][1][i],
+            rtol=1e-10, atol=1e-300)
+
+
+def test_update_walls_transmission_thick_float32():
+    sources, walls_valid = get_simple_project_input()
+    general_values_this = copy.deepcopy(general_values)
+    general_values_this.float32 = True
+    # two thick lead walls, transmission of both underflow in float32
+    walls_valid[0][4] = 400.
+    walls_valid.append([True, '', [201, 390, 804, 390], 'Lead', 400.])
+    kwargs = {
+        'isotopes': isotopes, 'shield_data': shield_data,
+        'general_values': general_values_this, 'map_shape': map_shape}
+    dose_dict, _ = cd.calculate_dose_sources(
+        sources, walls_valid, calibration_factor=calibration_factor, **kwargs)
+
+    walls_valid[2] = None
+    cd.update_walls_transmission(dose_dict, walls_valid, **kwargs)
+    dose_dict_all, _ = cd.calculate_dose_sources(
+        sources, walls_valid, calibration_factor=calibration_factor, **kwargs)
+    transmission_updated = dose_dict['dose_NM']['transmission_maps'][1][0]
+    transmission_all = dose_dict_all['dose_NM']['transmission_maps'][1][0]
+    assert transmission_updated.dtype == np.float32
+    assert transmission_all[300, 500] > 0
+    assert np.allclose(transmission_updated, transmission_all, rtol=1e-6, atol=0)
+
+
+def test_distance_source():
+    shape = (300, 400)
+    for x, y in [(0, 0), (399, 299), (123, 45), (-50, 500)]:
+        distance_map = cd.get_distance_source(
+            shape, (x, y), 0.01, dtype=np.float32)
+        assert distance_map.shape == shape
+        assert distance_map.dtype == np.float32
+        if 0 <= x < shape[1] and 0 <= y < shape[0]:
+            assert distance_map[y, x] == np.float32(0.1)
+            assert round(float(distance_map[0, 399 - x]), 5) == round(
+                0.01 * ((399 - 2*x) ** 2 + y ** 2) ** 0.5, 5)
+        else:
+            assert round(float(distance_map[0, 0]), 5) == round(
+                0.01 * (x ** 2 + y ** 2) ** 0.5, 5)
+        xs, ys = np.array([10, 399]), np.array([299, 0])
+        distance_positions = cd.get_distance_source(
+            shape, (x, y), 0.01, dtype=np.float32, positions=(xs, ys))
+        assert (distance_positions == distance_map[ys, xs]).all()
+
+
+def test_CT_doseratemap_kernel_cache():
+    kernel_cache = ArrayCache()
+    ct_model = ct_models[0]
+    for source_xy in [(100, 200), (500, 500)]:  # identical CTs, same rotation
+        doseratemaps_cached = cd.generate_CT_doseratemap(
+            ct_model, rotation=30., map_shape=map_shape, source_xy=source_xy,
+            resolution=calibration_factor, general_values=general_values,
+            factor=2., kernel_cache=kernel_cache)
+        doseratemaps = cd.generate_CT_doseratemap(
+            ct_model, rotation=30., map_shape=map_shape, source_xy=source_xy,
+            resolution=calibration_factor, general_values=general_values,
+            factor=2.)
+        for floor in [0, 1, 2]:
+            assert abs(doseratemaps_cached[floor] - doseratemaps[floor]).max() < (
+                1e-12 * doseratemaps[floor].max())
+    # one kernel pr floor distance (floor 0 and 2 at same distance here)
+    assert len(kernel_cache) == 2
+    assert kernel_cache.misses == 2
+
+
+def test_CT_kernel_only_if_reused():
+    _, walls_valid = get_simple_project_input()
+    source_CT = [True, '', '500, 500', 30., 'CT 120 kVp', ct_models[0].label,
+                 '', 4000, 1.0, 10.]
+    for positions, n_kernels in [(['500, 500'], 0),
+                                 (['500, 500', '300, 200'], 2)]:
+        kernel_cache = ArrayCache()
+        sources = {'CT': cd.get_valid_rows(
+            [source_CT[:2] + [pos] + source_CT[3:] for pos in positions],
+            nonzero_columns=[7, 8, 9], n_coordinates=2)}
+        dose_dict, msgs = cd.calculate_dose_sources(
+            sources, walls_valid, ct_models=ct_models, shield_data=shield_data,
+            general_values=general_values, map_shape=map_shape,
+            calibration_factor=calibration_factor, kernel_cache=kernel_cache)
+        assert msgs == []
+        assert dose_dict['dose_CT']['valid'].all()
+        assert len(kernel_cache) == n_kernels
+
+
+def test_parallel_sources_in_order():
+    sources, walls_valid = get_simple_project_input()
+    sources['NM'] = cd.get_valid_rows(
+        [source_NM[:2] + [pos] + source_NM[3:]
+         for pos in ['500, 500', '300, 200', '', '700, 800']],
+        nonzero_columns=[5, 7, 8, 9], n_coordinates=2)
+    dose_dicts = []
+    for n_workers in [1, 3]:
+        dose_dict, msgs = cd.calculate_dose_sources(
+            sources, walls_valid, isotopes=isotopes, shield_data=shield_data,
+            general_values=general_values, map_shape=map_shape,
+            calibration_factor=calibration_factor, n_workers=n_workers)
+        assert msgs == []
+        dose_dicts.append(dose_dict['dose_NM'])
+    assert dose_dicts[1]['valid'].tolist() == [True, True, False, True]
+    assert (dose_dicts[0]['transmission_maps'][1]
+            == dose_dicts[1]['transmission_maps'][1]).all()
+    assert (dose_dicts[0]['dist_maps'] == dose_dicts[1]['dist_maps']).all()
+
+    progress_values = []
+    dose_dict, _ = cd.calculate_dose_sources(
+        sources, walls_valid, isotopes=isotopes, shield_data=shield_data,
+        general_values=general_values, map_shape=map_shape,
+        calibration_factor=calibration_factor, n_workers=3,
+        progress_callback=lambda value, text: progress_values.append(value),
+        cancel_callback=lambda: len(progress_values) > 3)
+    assert dose_dict is None
+
+
+def test_identical_CT_sources_numbered():
+    _, walls_valid = get_simple_project_input()
+    source_CT = [True, '', '500, 500', 0, 'CT 120 kVp', 'unknown', '', 4000,
+                 1.0, 10.]
+    sources = {'CT': cd.get_valid_rows(
+        [source_CT, copy.deepcopy(source_CT)],
+        nonzero_columns=[7, 8, 9], n_coordinates=2)}
+    _, msgs = cd.calculate_dose_sources(
+        sources, walls_valid, ct_models=ct_models, shield_data=shield_data,
+        general_values=general_values, map_shape=map_shape,
+        calibration_factor=calibration_factor)
+    assert [msg for msg in msgs if 'unknown' in msg] == [
+        f'Failed finding CT doseratemap (unknown) for CT source ({i})'
+        for i in [0, 1]]
+
+
+def test_dose_sums_reused_for_occupancy():
+    sources, walls_valid = get_simple_project_input()
+    dose_dict, _ = cd.calculate_dose_sources(
+        sources, walls_valid, isotopes=isotopes, shield_data=shield_data,
+        general_values=general_values, map_shape=map_shape,
+        calibration_factor=calibration_factor)
+    dose_maps = cd.sum_dose_days(
+        dose_dict, working_days=1000, general_values=general_values)
+    dose_sums = dose_dict['dose_sums'][(1, )]
+    occ_map = np.full(map_shape, 0.5)
+    dose_maps_half = cd.sum_dose_days(
+        dose_dict, occ_map=occ_map, working_days=1000,
+        general_values=general_values)
+    assert len(dose_dict['dose_sums']) == 1
+    assert dose_dict['dose_sums'][(1, )] is dose_sums
+    x, y = points[1]
+    assert round(float(dose_maps_half['nm_dose_map'][y, x]), 4) == round(
+        0.5 * float(dose_maps['nm_dose_map'][y, x]), 4)
+    assert dose_maps_half['nm_doserate_map'] is dose_maps['nm_doserate_map']
+
+    cd.set_source_dose(dose_dict, 'NM', 0, None)
+    assert 'dose_sums' not in dose_dict
+
+
+def test_floor_transmission_when_needed():
+    sources, walls_valid = get_simple_project_input()
+    general_values_this = copy.deepcopy(general_values)
+    general_values_this.correct_thickness = True
+    dose_dict, _ = cd.calculate_dose_sources(
+        sources, walls_valid, isotopes=isotopes, shield_data=shield_data,
+        general_values=general_values_this, map_shape=map_shape,
+        calibration_factor=calibration_factor)
+    transmission_maps = dose_dict['dose_NM']['transmission_maps']
+    assert transmission_maps[0] is None and transmission_maps[2] is None
+
+    dose_sums_0 = cd.get_dose_sums(
+        dose_dict, floor=0, general_values=general_values_this)
+    assert transmission_maps[0].shape == (1, ) + map_shape
+    assert transmission_maps[2] is None
+    assert cd.get_dose_sums(
+        dose_dict, floor=0, general_values=general_values_this) is dose_sums_0
+
+    general_values_this.shield_mm_below = 0.5 * general_values.shield_mm_below
+    dose_sums_0_thinner = cd.get_dose_sums(
+        dose_dict, floor=0, general_values=general_values_this)
+    x, y = points[0]
+    assert (dose_sums_0_thinner['nm_dose_map'][y, x]
+            > dose_sums_0['nm_dose_map'][y, x])
+
+
+def test_source_stack_set_source_dose():
+    sources, walls_valid = get_simple_project_input()
+    dose_dict, _ = cd.calculate_dose_sources(
+        sources, walls_valid, isotopes=isotopes, shield_data=shield_data,
+        general_values=general_values, map_shape=map_shape,
+        calibration_factor=calibration_factor)
+    dose_NM = dose_dict['dose_NM']
+    nbytes_NM = 2 * np.dtype(cd.get_dtype(general_values)).itemsize * (
+        map_shape[0] * map_shape[1])  # distance and transmission floor 1
+    assert cd.get_dose_nbytes(dose_dict)['NM'] >= nbytes_NM
+    x, y = points[1]
+    dose_one = cd.sum_dose_days(dose_dict)['nm_dose_map'][y, x]
+
+    # same source as source number 2, source number 1 invalid
+    dose_NM_one = copy.deepcopy(dose_NM)
+    cd.set_source_dose(dose_dict, 'NM', 2, copy.deepcopy(dose_NM_one))
+    assert dose_NM['valid'].tolist() == [True, False, True]
+    assert dose_NM['stack_index'].tolist() == [0, -1, 1]  # no maps for invalid
+    assert dose_NM['dist_maps'].shape == (2, ) + map_shape
+    assert round(float(cd.sum_dose_days(dose_dict)['nm_dose_map'][y, x]), 6) == (
+        round(2 * float(dose_one), 6))
+
+    cd.set_source_dose(dose_dict, 'NM', 0, None)
+    assert round(float(cd.sum_dose_days(dose_dict)['nm_dose_map'][y, x]), 6) == (
+        round(float(dose_one), 6))
+
+    # added one by one, stack capacity doubled when full
+    for source_number in [3, 4, 5]:
+        cd.set_source_dose(
+            dose_dict, 'NM', source_number, copy.deepcopy(dose_NM_one))
+    assert dose_NM['n_stack'] == 5
+    assert dose_NM['dist_maps'].shape[0] == 8
+    assert round(float(cd.sum_dose_days(dose_dict)['nm_dose_map'][y, x]), 6) == (
+        round(4 * float(dose_one), 6))
+
+
+def test_streaming_equals_retained():
+    sources, walls_valid = get_simple_project_input()
+    sources['OT'] = [[True, '', [300, 200], 'CT 120 kVp', 5.0, 1.0]]
+    dose_dicts = []
+    for retain_sources in [True, False]:
+        dose_dict, msgs = cd.calculate_dose_sources(
+            sources, walls_valid, isotopes=isotopes, shield_data=shield_data,
+            general_values=general_values, map_shape=map_shape,
+            calibration_factor=calibration_factor, retain_sources=retain_sources)
+        assert msgs == []
+        dose_dicts.append(dose_dict)
+    assert dose_dicts[1]['dose_NM'] is None
+    for floor in [0, 1, 2]:
+        dose_maps = [cd.sum_dose_days(dose_dict, floor=floor,
+                                      general_values=general_values)
+                     for dose_dict in dose_dicts]
+        for key in ['nm_dose_map', 'nm_doserate_map', 'ot_dose_map']:
+            assert abs(dose_maps[1][key] - dose_maps[0][key]).max() < (
+                1e-5 * dose_maps[0][key].max())
+        assert dose_maps[1]['ct_dose_map'] is None
+
+
+def test_tiled_bounded_memory():
+    sources, walls_valid = get_simple_project_input()
+    sources['OT'] = [[True, '', [300, 200], 'CT 120 kVp', 5.0, 1.0]]
+    memory_limit = 60 * 2 ** 20
+    assert cd.get_tile_rows(
+        map_shape, n_accumulators=9, dtype=np.float32,
+        memory_limit=memory_limit) < map_shape[0]
+    dose_dict, _ = cd.calculate_dose_sources(
+        sources, walls_valid, isotopes=isotopes, shield_data=shield_data,
+        general_values=general_values, map_shape=map_shape,
+        calibration_factor=calibration_factor, retain_sources=False)
+    tracemalloc.start()
+    dose_dict_tiled, msgs = cd.calculate_dose_tiled(
+        sources, walls_valid, isotopes=isotopes, shield_data=shield_data,
+        general_values=general_values, map_shape=map_shape,
+        calibration_factor=calibration_factor, memory_limit=memory_limit)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert msgs == []
+    assert peak < memory_limit
+    for floor in [0, 1, 2]:
+        dose_maps = cd.sum_dose_days(
+            dose_dict, floor=floor, general_values=general_values)
+        dose_maps_tiled = cd.sum_dose_days(
+            dose_dict_tiled, floor=floor, general_values=general_values)
+        for key in ['nm_dose_map', 'nm_doserate_map', 'ot_dose_map']:
+            assert abs(dose_maps_tiled[key] - dose_maps[key]).max() < (
+                1e-5 * dose_maps[key].max())
+
+
+def test_calculation_grid():
+    sources, walls_valid = get_simple_project_input()
+    general_values_grid = copy.deepcopy(general_values)
+    general_values_grid.calculation_grid_cm = 5
+    assert cd.get_grid_factor(calibration_factor, general_values_grid) == 10
+    assert cd.get_grid_shape(map_shape, 10) == (101, 101)
+    dose_maps = []
+    for general_values_this in [general_values, general_values_grid]:
+        dose_dict, _ = cd.calculate_dose_sources(
+            sources, walls_valid, isotopes=isotopes, shield_data=shield_data,
+            general_values=general_values_this, map_shape=map_shape,
+            calibration_factor=calibration_factor)
+        dose_maps.append(cd.sum_dose_days(
+            dose_dict, working_days=1000, general_values=general_values_this))
+    assert dose_dict['dose_NM']['dist_maps'].shape == (1, 101, 101)
+    assert dose_maps[1]['nm_dose_map'].shape == map_shape
+    for x, y in points + [(513, 287), (333, 517)]:
+        dose = float(dose_maps[0]['nm_dose_map'][y, x])
+        dose_grid = float(dose_maps[1]['nm_dose_map'][y, x])
+        assert abs(dose_grid - dose) < 0.005 * dose
+
+
+def test_upsample_grid():
+    grid_map = np.arange(6, dtype=np.float32).reshape(2, 3)
+    upsampled = cd.upsample_grid(grid_map, (3, 5), 2)
+    assert upsampled.dtype == np.float32
+    assert upsampled.tolist() == [
+        [0., 0.5, 1., 1.5, 2.], [1.5, 2., 2.5, 3., 3.5], [3., 3.5, 4., 4.5, 5.]]
+
+
+def test_dose_positions():
+    sources, walls_valid = get_simple_project_input()
+    dose_dict, _ = cd.calculate_dose_sources(
+        sources, walls_valid, isotopes=isotopes, shield_data=shield_data,
+        general_values=general_values, map_shape=map_shape,
+        calibration_factor=calibration_factor)
+    dose_sums = cd.get_dose_sums(dose_dict)
+    xs, ys = np.array(points).T
+    dose_sums_positions, msgs = cd.calculate_dose_positions(
+        xs, ys, sources, walls_valid, isotopes=isotopes, shield_data=shield_data,
+        general_values=general_values, map_shape=map_shape,
+        calibration_factor=calibration_factor)
+    assert msgs == []
+    for name in ['nm_dose_map', 'nm_doserate_map']:
+        assert (dose_sums_positions[(1, )][name] == dose_sums[name][ys, xs]).all()
+
+
+def test_adaptive_grid():
+    sources, walls_valid = get_simple_project_input()
+    sources['OT'] = [[True, '', [300, 200], 'CT 120 kVp', 5.0, 1.0]]
+    dose_dict, _ = cd.calculate_dose_sources(
+        sources, walls_valid, isotopes=isotopes, shield_data=shield_data,
+        general_values=general_values, map_shape=map_shape,
+        calibration_factor=calibration_factor, retain_sources=False)
+    dose_dict_adaptive, msgs = cd.calculate_dose_adaptive(
+        sources, walls_valid, isotopes=isotopes, shield_data=shield_data,
+        general_values=general_values, map_shape=map_shape,
+        calibration_factor=calibration_factor, tolerance=0.01)
+    assert msgs == []
+    assert dose_dict_adaptive['n_calculated'] < 0.1 * map_shape[0] * map_shape[1]
+    for floor in [0, 1, 2]:
+        dose_maps = cd.sum_dose_days(
+            dose_dict, floor=floor, general_values=general_values)
+        dose_maps_adaptive = cd.sum_dose_days(
+            dose_dict_adaptive, floor=floor, general_values=general_values)
+        for key in ['nm_dose_map', 'ot_dose_map']:
+            assert dose_maps_adaptive[key].shape == map_shape
+            assert (np.abs(dose_maps_adaptive[key] - dose_maps[key])
+                    <= 0.01 * dose_maps[key]).all()
+
+    # only summed dose kept, not available for changed floor shielding
+    general_values_thinner = copy.deepcopy(general_values)
+    general_values_thinner.shield_mm_below = 0.5 * general_values.shield_mm_below
+    for dose_dict_summed in [dose_dict, dose_dict_adaptive]:
+        assert cd.get_dose_sums(
+            dose_dict_summed, floor=0, general_values=general_values_thinner) is None
+        assert cd.sum_dose_days(
+            dose_dict_summed, floor=0, general_values=general_values_thinner) is None
+
+
+def test_optimise_walls():
+    sources, walls_valid = get_simple_project_input()
+    xs, ys = np.array(points).T
+    kwargs = {
+        'isotopes': isotopes, 'shield_data': shield_data,
+        'general_values': general_values, 'map_shape': map_shape,
+        'calibration_factor': calibration_factor}
+    # dose limit at top point just above dose with 2 mm lead
+    solution = osh.optimise_walls(
+        sources, walls_valid, [0], xs[:1], ys[:1], 6.42, thickness_step=0.5,
+        **kwargs)
+    assert solution.feasible
+    assert solution.thicknesses == [2.0]
+    assert solution.iterations > 0
+
+    dose_limits = [3., 8.2, 0.1]
+    solution = osh.optimise_walls(
+        sources, walls_valid, [0, 1], xs, ys, dose_limits,
+        materials=['Lead', 'Concrete'],
+        material_costs={'Lead': 50., 'Concrete': 1.}, **kwargs)
+    assert solution.feasible
+    assert (solution.doses <= dose_limits).all()
+    walls_solution = copy.deepcopy(walls_valid)
+    for wall, material, thickness in zip(
+            walls_solution, solution.materials, solution.thicknesses):
+        wall[3] = material
+        wall[4] = thickness
+    dose_sums, _ = cd.calculate_dose_positions(
+        xs, ys, sources, walls_solution, **kwargs)
+    dose_maps = cd.sum_dose_days(
+        {'dose_sums': dose_sums}, working_days=general_values.working_days)
+    assert np.allclose(dose_maps['nm_dose_map'], solution.doses, rtol=1e-4)
+    # one step less than solution exceeds the limits
+    optimiser = osh.WallOptimiser(
+        sources, walls_valid, [0, 1], xs, ys, **kwargs)
+    for i in range(2):
+        thicknesses = list(solution.thicknesses)
+        thicknesses[i] -= 1
+        assert (optimiser.get_doses(solution.materials, thicknesses)
+                > dose_limits).any()
+
+
+def test_optimise_walls_materials():
+    sources, walls_valid = get_simple_project_input()
+    xs, ys = np.array(points).T
+    kwargs = {
+        'isotopes': isotopes, 'shield_data': shield_data,
+        'general_values': general_values, 'map_shape': map_shape,
+        'calibration_factor': calibration_factor}
+    # cost decides material, equal costs give the thinnest (lead)
+    materials = []
+    for material_costs in [None, {'Lead': 1000., 'Concrete': 1.}]:
+        solution = osh.optimise_walls(
+            sources, walls_valid, [0], xs[:1], ys[:1], 1.,
+            materials=['Lead', 'Concrete'], material_costs=material_costs,
+            **kwargs)
+        assert solution.feasible
+        materials.extend(solution.materials)
+    assert materials == ['Lead', 'Concrete']
+
+    # too many combinations refused, not truncated
+    materials_many = [f'Material {i}' for i in range(17)]
+    solution = osh.optimise_walls(
+        sources, walls_valid, [0, 1], xs, ys, 1., materials=materials_many,
+        **kwargs)
+    assert solution.thicknesses == []
+    assert 'Reduce the number of walls or materials' in solution.msgs[0]
+
+    progress_values = []
+    solution = osh.optimise_walls(
+        sources, walls_valid, [0], xs[:1], ys[:1], 1.,
+        materials=['Lead', 'Concrete'], cancel_callback=lambda: True,
+        progress_callback=lambda value, text: progress_values.append(value),
+        **kwargs)
+    assert solution.thicknesses == []
+    assert 'Optimisation canceled.' in solution.msgs
+    assert progress_values
+
+
+def test_transmission_thickness_axis():
+    thicknesses = np.arange(0, 50, 0.5)
+    wall_affect = np.array([[0., 1., 1.5], [1., 2., 0.]])
+    shield_lookup = cd.get_shield_lookup(shield_data)
+    for (material, isotope_label, kV_source), coeffs in shield_lookup.items():
+        if coeffs is None:
+            continue
+        isotope = ''
+        if isotope_label:
+            isotope = isotopes[[x.label for x in isotopes].index(isotope_label)]
+        transmission, _ = cd.calculate_transmission(
+            shield_lookup, wall_affect, thickness=thicknesses[:, None, None],
+            material=material, isotope=isotope, kV_source=kV_source)
+        assert transmission.shape == thicknesses.shape + wall_affect.shape
+        for i, thickness in enumerate(thicknesses):
+            transmission_this, _ = cd.calculate_transmission(
+                shield_lookup, wall_affect, thickness=thickness,
+                material=material, isotope=isotope, kV_source=kV_source)
+            assert np.allclose(transmission[i], transmission_this)
+
+
+def test_thickness_sweep():
+    sources, walls_valid = get_simple_project_input()
+    xs, ys = np.array(points).T
+    thicknesses = np.arange(0., 11., 1.)
+    doses, msgs = osh.calculate_thickness_sweep(
+        sources, walls_valid, [0, 1], xs, ys, thicknesses,
+        isotopes=isotopes, shield_data=shield_data,
+        general_values=general_values, map_shape=map_shape,
+        calibration_factor=calibration_factor,
+        working_days=general_values.working_days)
+    assert msgs == []
+    assert doses.shape == (2, thicknesses.size, len(points))
+    # lead as defined (2 mm)
+    assert [round(dose, 4) for dose in doses[0, 2]] == [6.416, 8.1492, 0.7364]
+    assert (np.diff(doses[0, :, 0]) < 0).all()
+    assert (doses[0, :, 1] == doses[0, 0, 1]).all()  # left not shielded
+    table = osh.get_sweep_table(
+        thicknesses, doses, ['lead', 'concrete'], ['top', 'left', 'bottom'])
+    assert len(table) == 1 + 2 * thicknesses.size
+    assert table[3][:2] == ['lead', 2.]
+
+
+def test_walls_transmission_log_domain():
+    shield_lookup = cd.get_shield_lookup(shield_data)
+    shape = (200, 200)
+    walls_pos = [[20, 50 + 30 * i, 180, 60 + 30 * i] for i in range(4)]
+    for (material, isotope_label, kV_source), coeffs in shield_lookup.items():
+        if coeffs is None:
+            continue
+        isotope = ''
+        if isotope_label:
+            isotope = isotopes[[x.label for x in isotopes].index(isotope_label)]
+        walls_this = [[True, '', pos, material, 1. + 3 * i]
+                      for i, pos in enumerate(walls_pos)]
+        transmission_map = cd.calculate_walls_transmission(
+            shape, (100, 10), walls_this, shield_lookup, correct_thickness=True,
+            isotope=isotope, kV_source=kV_source)
+        walls_affect = cd.get_walls_affect_cached(
+            shape, (100, 10), walls_pos, correct_thickness=True)
+        transmission_product = np.ones(shape)
+        for wall, wall_affect in zip(walls_this, walls_affect):
+            transmission, _ = cd.calculate_transmission(
+                shield_lookup, wall_affect, thickness=wall[4],
+                material=material, isotope=isotope, kV_source=kV_source)
+            transmission_product *= transmission
+        assert np.allclose(transmission_map, transmission_product,
+                           rtol=1e-10, atol=0)
+
+
+def test_transmission_table():
+    accuracy = 1e-4
+    shield_lookup = cd.get_shield_lookup(shield_data)
+    shield_lookup_table = cd.get_shield_lookup(
+        shield_data, table_accuracy=accuracy)
+    rng = np.random.default_rng(0)
+    shape = (200, 200)
+    walls_pos = [[20, 50 + 30 * i, 180, 60 + 30 * i] for i in range(4)]
+    n_archer = 0
+    for key, coeffs in shield_lookup_table.items():
+        if coeffs is None or coeffs.archer is False:
+            continue
+        n_archer += 1
+        assert cd.get_transmission_table_error(coeffs) <= accuracy
+        material, isotope_label, kV_source = key
+        isotope = ''
+        if isotope_label:
+            isotope = isotopes[[x.label for x in isotopes].index(isotope_label)]
+        thicknesses = rng.uniform(0, 100. / abs(coeffs.alpha_gamma), 1000)
+        transmission, _ = cd.calculate_transmission(
+            shield_lookup, thicknesses, thickness=1., material=material,
+            isotope=isotope, kV_source=kV_source)
+        transmission_table = np.exp(
+            cd.interpolate_log_transmission(coeffs, thicknesses))
+        assert np.allclose(transmission_table, transmission,
+                           rtol=accuracy, atol=0)
+
+        walls_this = [[True, '', pos, material, 1. + 3 * i]
+                      for i, pos in enumerate(walls_pos)]
+        transmission_maps = [
+            cd.calculate_walls_transmission(
+                shape, (100, 10), walls_this, lookup, correct_thickness=True,
+                isotope=isotope, kV_source=kV_source)
+            for lookup in [shield_lookup, shield_lookup_table]]
+        assert np.allclose(*transmission_maps, rtol=len(walls_pos) * accuracy,
+                           atol=0)
+    assert n_archer > 0
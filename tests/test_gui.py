@@ -7,10 +7,17 @@ Tests on GUI.
 import os
 from pathlib import Path
 
+import numpy as np
+
 from Shield_NM_CT.ui.ui_main import MainWindow
+from Shield_NM_CT.ui.ui_dialogs import (
+    OptimiseWallsDialog, ThicknessSweepDisplay)
 from Shield_NM_CT.config.Shield_NM_CT_constants import (
     ENV_USER_PREFS_PATH, ENV_CONFIG_FOLDER, ENV_ICON_PATH)
 from Shield_NM_CT.config.config_func import get_icon_path
+from Shield_NM_CT.scripts.optimise_shielding import (
+    get_optimise_walls_input, optimise_walls_points, sweep_walls_points)
+from Shield_NM_CT.ui import messageboxes
 
 
 os.environ[ENV_USER_PREFS_PATH] = ''
@@ -47,6 +54,167 @@ def test_simple_project(qtbot):
     assert doserate_center == expected_doserate_values[-1]
 
 
+def test_simple_project_add_first_OT(qtbot):
+    project_path = path_tests / 'simple_project'
+    main = MainWindow()
+    qtbot.addWidget(main)
+    main.open_project(path=project_path)
+    main.calculate_dose()
+    transmission_NM = main.dose_dict['dose_NM']['transmission_maps'][1]
+
+    # first OT source, 5 uSv @ 1m pr day at same position as NM source
+    main.OTsources_tab.table_list[0] = [
+        True, '', '500, 500', 'CT 120 kVp', 5.0, 1.0]
+    main.calculate_dose(source_number=0, modality='OT')
+    assert main.dose_dict['dose_NM']['transmission_maps'][1] is transmission_NM
+    table_list = main.points_tab.get_table_as_list()
+    dose_left = float(table_list[2][-2])
+    assert dose_left == 13.1492  # 8.1492 + 1000 days * 5 uSv @ 1m
+
+    main.OTsources_tab.table_list[0][5] = 0.  # no procedures
+    main.calculate_dose(source_number=0, modality='OT')
+    table_list = main.points_tab.get_table_as_list()
+    assert float(table_list[2][-2]) == 8.1492
+
+
+def test_simple_project_background(qtbot):
+    project_path = path_tests / 'simple_project'
+    main = MainWindow()
+    qtbot.addWidget(main)
+    main.open_project(path=project_path)
+    main.calculate_dose_background()
+    main.calculate_dose_background()  # supersedes the first
+    qtbot.waitUntil(lambda: len(main.dose_workers) == 0, timeout=20000)
+    table_list = main.points_tab.get_table_as_list()
+    dose_values = [float(row[-2]) for row in table_list[1:-1]]
+    expected_dose_values = [6.416, 8.1492, 0.8149, 0.7364,
+                            1.604, 2.0373, 0.2037, 0.1841]
+    assert expected_dose_values == dose_values
+    main.cancel_dose_workers(wait=True)
+
+
+def test_edit_wall_during_background(qtbot):
+    project_path = path_tests / 'simple_project'
+    main = MainWindow()
+    qtbot.addWidget(main)
+    main.open_project(path=project_path)
+    dose_partial_result = main.dose_partial_result
+
+    def edit_wall_after_partial(worker, modality, values):
+        dose_partial_result(worker, modality, values)
+        assert main.dose_dict[f'dose_{modality}'] is values  # not copied
+        if main.walls_tab.table_list[0][4] == 2.:
+            main.walls_tab.table_list[0][4] = 4.  # lead 2 -> 4 mm
+            main.update_dose_walls()
+
+    main.dose_partial_result = edit_wall_after_partial
+    main.calculate_dose_background()
+    qtbot.waitUntil(lambda: len(main.dose_workers) == 0, timeout=20000)
+    assert main.walls_tab.table_list[0][4] == 4.
+    dose_values = [float(row[-2]) for row in main.points_tab.table_list]
+    main.cancel_dose_workers(wait=True)
+    main.calculate_dose()
+    dose_values_fresh = [float(row[-2]) for row in main.points_tab.table_list]
+    assert dose_values == dose_values_fresh
+
+
+def test_edit_walls_background(qtbot):
+    project_path = path_tests / 'simple_project'
+    main = MainWindow()
+    qtbot.addWidget(main)
+    main.open_project(path=project_path)
+    main.calculate_dose()
+    main.walls_tab.table_list[0][4] = 4.
+    main.update_dose_walls()
+    assert len(main.dose_workers) == 1  # updated in separate thread
+    worker = main.dose_workers[0]
+    main.walls_tab.table_list[1][4] = 100.
+    main.update_dose_walls()
+    assert worker.isInterruptionRequested()  # superseded
+    qtbot.waitUntil(lambda: len(main.dose_workers) == 0, timeout=20000)
+    assert main.dose_dict['walls'][1][4] == 100.
+    assert 'walls_sources' not in main.dose_dict
+    dose_values = [float(row[-2]) for row in main.points_tab.table_list]
+    main.calculate_dose()
+    dose_values_fresh = [float(row[-2]) for row in main.points_tab.table_list]
+    assert dose_values == dose_values_fresh
+    main.cancel_dose_workers(wait=True)
+
+
+def test_summed_dose_modes(qtbot):
+    project_path = path_tests / 'simple_project'
+    main = MainWindow()
+    qtbot.addWidget(main)
+    main.open_project(path=project_path)
+    main.calculate_dose()
+    dose_values = [float(row[-2]) for row in main.points_tab.table_list]
+    main.gui.current_floor = 0
+    main.areas_tab.update_occ_map()
+    main.general_values.shield_mm_below = 100.
+    main.sum_dose_days()
+    dose_values_below = [float(row[-2]) for row in main.points_tab.table_list]
+
+    for mode in ['streaming', 'tiled', 'adaptive']:
+        main.general_values.calculation_mode = mode
+        main.gui.current_floor = 1
+        main.areas_tab.update_occ_map()
+        main.general_values.shield_mm_below = 200.
+        main.walls_tab.table_list[0][4] = 2.
+        main.reset_dose()
+        main.calculate_dose()
+        assert main.dose_dict['dose_NM'] is None
+        dose_values_mode = [
+            float(row[-2]) for row in main.points_tab.table_list]
+        for dose, dose_mode in zip(dose_values, dose_values_mode):
+            assert abs(dose_mode - dose) <= 1e-4 + 0.01 * dose
+
+        # floor shielding changed, all sources recalculated
+        main.gui.current_floor = 0
+        main.areas_tab.update_occ_map()
+        main.general_values.shield_mm_below = 100.
+        main.sum_dose_days()
+        assert len(main.dose_workers) == 1
+        qtbot.waitUntil(lambda: len(main.dose_workers) == 0, timeout=20000)
+        dose_values_mode = [
+            float(row[-2]) for row in main.points_tab.table_list]
+        for dose, dose_mode in zip(dose_values_below, dose_values_mode):
+            assert dose > 0
+            assert abs(dose_mode - dose) <= 1e-4 + 0.01 * dose
+
+        # walls edited, all sources recalculated
+        main.update_dose_walls()
+        assert len(main.dose_workers) == 0  # walls not changed
+        main.walls_tab.table_list[0][4] = 4.
+        main.update_dose_walls()
+        assert len(main.dose_workers) == 1
+        qtbot.waitUntil(lambda: len(main.dose_workers) == 0, timeout=20000)
+        assert main.dose_dict['walls'][0][4] == 4.
+    main.cancel_dose_workers(wait=True)
+
+
+def test_simple_project_scheduled_update(qtbot):
+    project_path = path_tests / 'simple_project'
+    main = MainWindow()
+    qtbot.addWidget(main)
+    main.open_project(path=project_path)
+    main.calculate_dose()
+
+    # OT source edited several times, one recalculation
+    main.OTsources_tab.table_list[0] = [
+        True, '', '500, 500', 'CT 120 kVp', 1.0, 1.0]
+    for dose in [2.0, 3.0, 4.0, 5.0]:
+        main.OTsources_tab.table_list[0][4] = dose
+        main.schedule_dose_update(source_number=0, modality='OT')
+    assert main.scheduled_dose_sources == [['OT', 0]]
+    qtbot.waitUntil(
+        lambda: (not main.dose_update_timer.isActive()
+                 and len(main.dose_workers) == 0),
+        timeout=20000)
+    table_list = main.points_tab.get_table_as_list()
+    assert float(table_list[2][-2]) == 13.1492  # 8.1492 + 1000 days * 5 uSv
+    main.cancel_dose_workers(wait=True)
+
+
 def test_simple_project_90(qtbot):
     project_path = path_tests / 'simple_project_90'
     main = MainWindow()
@@ -155,6 +323,110 @@ def test_siemens_CT_floor(qtbot):
     assert dose_center == 0.82  # same as 1m left (shaded by gantry)
 
 
+def test_points_only(qtbot):
+    for project in ['simple_project', 'SiemensCT_verify']:
+        main = MainWindow()
+        qtbot.addWidget(main)
+        main.open_project(path=path_tests / project)
+        main.calculate_dose()
+        dose_values = [float(row[-2]) for row
+                       in main.points_tab.get_table_as_list()[1:]]
+        main.reset_dose()
+        main.calculate_dose_points()
+        dose_values_points = [float(row[-2]) for row
+                              in main.points_tab.get_table_as_list()[1:]]
+        for dose, dose_points in zip(dose_values, dose_values_points):
+            assert abs(dose_points - dose) <= 1e-4 + 1e-5 * dose
+
+
+def test_optimise_walls_points(qtbot):
+    main = MainWindow()
+    qtbot.addWidget(main)
+    main.open_project(path=path_tests / 'simple_project')
+    # only points behind the walls
+    for row in main.points_tab.table_list:
+        row[0] = row[1] in ['top', 'bottom', 'top2m', 'bottom2m']
+    dose_limit = 1.
+    solution, msgs = optimise_walls_points(main, [0, 1], dose_limit)
+    assert msgs == []
+    assert solution.feasible
+    for i, thickness in enumerate(solution.thicknesses):
+        main.walls_tab.set_wall_shielding(i, solution.materials[i], thickness)
+    main.calculate_dose_points()
+    dose_values = [float(row[-2]) for row in main.points_tab.table_list
+                   if row[0]]
+    assert max(dose_values) <= dose_limit * (1 + 1e-4)
+
+
+def test_optimise_walls_areas(qtbot):
+    main = MainWindow()
+    qtbot.addWidget(main)
+    main.open_project(path=path_tests / 'simple_project')
+    # area behind the lead wall
+    main.areas_tab.table_list.insert(
+        0, [True, 'above', '300, 150, 700, 350', 1.])
+    main.areas_tab.update_occ_map()
+    dlg = OptimiseWallsDialog(
+        wall_names=['', ''], area_names=['above', None])
+    dlg.btns_limit.button(1).setChecked(True)
+    dlg.area_limits[0].setValue(0.05)
+    area_limits = dlg.get_data()[-1]
+    assert area_limits == [0.05, None]
+    solution, msgs = optimise_walls_points(
+        main, [0], None, area_limits=area_limits)
+    assert msgs == []
+    assert solution.feasible
+    assert solution.thicknesses[0] > 0
+    main.walls_tab.set_wall_shielding(
+        0, solution.materials[0], solution.thicknesses[0])
+    main.calculate_dose()
+    assert main.nm_dose_map[150:350, 300:700].max() <= 0.05 * (1 + 1e-3)
+
+
+def test_optimise_walls_background(qtbot, monkeypatch):
+    main = MainWindow()
+    qtbot.addWidget(main)
+    main.open_project(path=path_tests / 'simple_project')
+    dlg = OptimiseWallsDialog(
+        wall_names=['', ''], materials=['Lead', 'Concrete'])
+    for chk, material_cost in zip(dlg.chk_materials, dlg.material_costs):
+        chk.setChecked(True)
+        material_cost.setValue(2.)
+    assert dlg.get_data()[4] == {'Lead': 2., 'Concrete': 2.}
+
+    for row in main.points_tab.table_list:
+        row[0] = row[1] in ['top', 'top2m']
+    optimise_input, msgs = get_optimise_walls_input(
+        main, [0], 1., materials=['Lead', 'Concrete'],
+        material_costs={'Lead': 1000., 'Concrete': 1.})
+    assert msgs == []
+    monkeypatch.setattr(
+        messageboxes, 'proceed_question', lambda *args, **kwargs: True)
+    main.optimise_walls_background(optimise_input, [0], msgs)
+    assert len(main.dose_workers) == 1  # GUI not blocked
+    qtbot.waitUntil(lambda: len(main.dose_workers) == 0, timeout=20000)
+    assert main.walls_tab.table_list[0][3] == 'Concrete'
+    assert main.walls_tab.table_list[0][4] > 0
+    main.cancel_dose_workers(wait=True)
+
+
+def test_sweep_walls_points(qtbot, tmp_path):
+    main = MainWindow()
+    qtbot.addWidget(main)
+    main.open_project(path=path_tests / 'simple_project')
+    main.calculate_dose_points()
+    table, msgs = sweep_walls_points(main, [0], np.arange(0., 5., 1.))
+    assert msgs == []
+    assert len(table) == 6
+    assert len(table[0]) == 2 + len(main.points_tab.table_list)
+    # lead wall as defined (2 mm)
+    dose_values = [float(row[-2]) for row in main.points_tab.table_list]
+    assert np.allclose(table[3][2:], dose_values, rtol=1e-3, atol=1e-4)
+    dlg = ThicknessSweepDisplay(table)
+    dlg.export_csv(path=str(tmp_path / 'sweep.csv'))
+    assert len((tmp_path / 'sweep.csv').read_text().splitlines()) == 6
+
+
 def test_start_settings(qtbot):
     main = MainWindow()
     qtbot.addWidget(main)